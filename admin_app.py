@@ -1,10 +1,22 @@
 # admin_app.py (versión web para Render con menú, formulario de tiempo y autenticación)
-from flask import Blueprint, request, jsonify, Response
-import sqlite3
-from datetime import datetime
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
 from functools import wraps
+from urllib.parse import urlencode
+from markupsafe import escape
+from datetime import datetime
+import csv, io, os
+import database
+from almacen import almacen
+import exportar_qr
+import generador_qr
+import importar
+from indice_codigos import indice
+from configuracion import configuracion, segundos_renovacion, CLAVE_TIEMPO
+from expiracion import programador
+from bitacora import bitacora
+from antirrebote import escaneos_recientes, limitador
 
-DB_NAME = "beneficiarios.db"
+DB_NAME = database.DB_NAME
 
 # Definimos el Blueprint
 admin_bp = Blueprint("admin", __name__, template_folder="templates")
@@ -35,43 +47,31 @@ def requires_auth(f):
 
 # ---------------- BASE DE DATOS ----------------
 def get_conn():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def limpiar_expirados():
-    """Resetea a PENDIENTE todos los beneficiarios RECLAMADO cuyo tiempo ya expiró."""
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, fecha_expira FROM beneficiarios WHERE status='RECLAMADO'")
-    rows = cursor.fetchall()
-    cambios = 0
-    for id_, fecha_expira in rows:
-        try:
-            if fecha_expira and datetime.fromisoformat(fecha_expira) < datetime.now():
-                cursor.execute("""
-                    UPDATE beneficiarios
-                    SET status='PENDIENTE', fecha_reclamo=NULL, fecha_expira=NULL
-                    WHERE id=?
-                """, (id_,))
-                cambios += 1
-        except Exception:
-            continue
-    conn.commit()
-    conn.close()
-    return cambios
+    # Conexión del pool compartido; conn.close() la devuelve al pool
+    return database.get_conn()
 
 # ---------------- PANEL ----------------
+POR_PAGINA = 100
+POR_PAGINA_MAX = 500
+TAMANO_FETCH = 50
+
 @admin_bp.route("/")
 @requires_auth
 def admin_panel():
-    """Panel de control web en /admin"""
-    limpiar_expirados()
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nombre, curp, status, codigo_unico FROM beneficiarios")
-    rows = cursor.fetchall()
-    conn.close()
+    """Panel de control web en /admin, paginado por keyset y enviado en streaming.
+
+    Parámetros: status, orden (id, -id, nombre), por_pagina y el cursor de
+    la página anterior (despues y, al ordenar por nombre, despues_nombre).
+    """
+    orden = request.args.get("orden", "id")
+    status = request.args.get("status") or None
+    if orden not in database.ORDENES or (status and status not in exportar_qr.STATUS_VALIDOS):
+        return jsonify({"ok": False, "error": "Parámetros inválidos"}), 400
+    por_pagina = request.args.get("por_pagina", POR_PAGINA, type=int)
+    por_pagina = max(1, min(por_pagina, POR_PAGINA_MAX))
+    despues = request.args.get("despues", type=int)
+    if despues is not None and orden == "nombre":
+        despues = (request.args.get("despues_nombre", ""), despues)
 
     # Menú de accesos rápidos
     menu = """
@@ -82,26 +82,175 @@ def admin_panel():
         <li><a href="/verificar/TEST-CODIGO">Verificación por QR (ejemplo)</a></li>
         <li><a href="/verificar">API de Verificación (POST)</a></li>
         <li><a href="/admin/configurar_tiempo">Configurar Tiempo</a></li>
+        <li><a href="/admin/importar">Importar padrón (CSV/JSONL)</a></li>
+        <li><a href="/admin/qr_sheet?formato=pdf&status=PENDIENTE">Credenciales QR pendientes (PDF)</a></li>
         <li><a href="/limpiar">Limpieza</a></li>
     </ul>
     """
 
-    # Tabla de beneficiarios
-    tabla = """
+    def enlace(texto, **params):
+        base = {"status": status or "", "orden": orden, "por_pagina": por_pagina}
+        base.update(params)
+        query = urlencode({k: v for k, v in base.items() if v not in ("", None)})
+        return f'<a href="/admin/?{query}">{escape(texto)}</a>'
+
+    filtros = " | ".join([
+        enlace("Todos", status=""), enlace("Pendientes", status="PENDIENTE"),
+        enlace("Reclamados", status="RECLAMADO"), "Orden:",
+        enlace("ID ↑", orden="id"), enlace("ID ↓", orden="-id"), enlace("Nombre", orden="nombre"),
+    ])
+
+    def generar():
+        # Lo primero sale de inmediato; las filas se envían por bloques
+        yield menu
+        yield f"""
     <h3>Beneficiarios registrados</h3>
+    <p>{filtros}</p>
     <table border=1 cellpadding=5>
         <tr>
             <th>ID</th><th>Nombre</th><th>CURP</th><th>Status</th><th>Código Único</th>
         </tr>
     """
+        # Una fila de más indica si existe página siguiente (con fragmentos,
+        # la página ya viene mezclada de todos)
+        rows = almacen.pagina(orden, despues, status, por_pagina + 1)
+        hay_mas = len(rows) > por_pagina
+        rows = rows[:por_pagina]
+        ultima = rows[-1] if rows else None
+        for inicio in range(0, len(rows), TAMANO_FETCH):
+            partes = []
+            for row in rows[inicio:inicio + TAMANO_FETCH]:
+                color = "#d9fcd9" if row["status"] == "PENDIENTE" else "#ffd6d6"
+                partes.append(
+                    f"<tr style='background-color:{color};'>"
+                    f"<td>{row['id']}</td><td>{escape(row['nombre'])}</td><td>{escape(row['curp'])}</td>"
+                    f"<td>{escape(row['status'])}</td><td>{escape(row['codigo_unico'])}</td></tr>"
+                )
+            yield "".join(partes)
+
+        paginacion = [enlace("Primera página")]
+        if hay_mas:
+            cursor_siguiente = {"despues": ultima["id"]}
+            if orden == "nombre":
+                cursor_siguiente["despues_nombre"] = ultima["nombre"]
+            paginacion.append(enlace("Siguiente »", **cursor_siguiente))
+        yield f"</table><p>{' | '.join(paginacion)}</p>"
+
+    return Response(stream_with_context(generar()), mimetype="text/html")
+
+# ---------------- BÚSQUEDA ----------------
+@admin_bp.route("/buscar")
+@requires_auth
+def buscar():
+    """Búsqueda por prefijos en nombre y CURP (sin acentos ni mayúsculas)."""
+    q = request.args.get("q", "")
+    limite = request.args.get("limite", 50, type=int)
+    rows = almacen.buscar(q, limite)
+    return jsonify({"q": q, "resultados": [dict(row) for row in rows]})
+
+# ---------------- CAMBIOS ----------------
+@admin_bp.route("/cambios")
+@requires_auth
+def cambios():
+    """Beneficiarios que cambiaron después de la versión `desde`.
+
+    El cliente guarda la `version` de la respuesta y la manda en la
+    siguiente consulta; con hay_mas=true debe pedir de nuevo enseguida.
+    Con DB_FRAGMENTOS la versión es una cadena "v0.v1..." (una por fragmento).
+    """
+    desde = request.args.get("desde", "0")
+    limite = max(1, min(request.args.get("limite", database.CAMBIOS_MAX, type=int), database.CAMBIOS_MAX))
+    try:
+        version, rows, hay_mas = almacen.cambios(desde, limite)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Versión inválida"}), 400
+    cambios = []
     for row in rows:
-        color = "#d9fcd9" if row["status"] == "PENDIENTE" else "#ffd6d6"
-        tabla += f"<tr style='background-color:{color};'>"
-        tabla += f"<td>{row['id']}</td><td>{row['nombre']}</td><td>{row['curp']}</td>"
-        tabla += f"<td>{row['status']}</td><td>{row['codigo_unico']}</td></tr>"
-    tabla += "</table>"
+        if row["borrado"]:
+            cambios.append({"id": row["id_beneficiario"], "borrado": True})
+        else:
+            cambios.append({"id": row["id_beneficiario"], "nombre": row["nombre"], "curp": row["curp"],
+                            "status": row["status"], "codigo_unico": row["codigo_unico"]})
+    return jsonify({
+        "version": version,
+        "hay_mas": hay_mas,
+        "cambios": cambios,
+    })
+
+# ---------------- BITÁCORA DE RECLAMOS ----------------
+RECLAMOS_POR_PAGINA = 500
+COLUMNAS_RECLAMOS = ("id", "momento", "codigo_unico", "id_beneficiario", "resultado", "origen")
+
+def filtro_reclamos():
+    """Filtros de la bitácora desde la query string; None si alguna fecha es inválida."""
+    try:
+        desde, hasta = (datetime.fromisoformat(request.args[clave]) if request.args.get(clave) else None
+                        for clave in ("desde", "hasta"))
+    except ValueError:
+        return None
+    return dict(
+        codigo=request.args.get("codigo") or None,
+        id_beneficiario=request.args.get("beneficiario", type=int),
+        desde=desde, hasta=hasta,
+        resultado=request.args.get("resultado") or None,
+    )
+
+@admin_bp.route("/reclamos")
+@requires_auth
+def reclamos():
+    """Eventos de la bitácora en orden de id, paginados con `despues`.
+
+    Filtros: codigo, beneficiario (id), desde/hasta (ISO, hasta excluido) y
+    resultado. `siguiente` es el valor de `despues` para la página que sigue.
+    """
+    filtro = filtro_reclamos()
+    if filtro is None:
+        return jsonify({"ok": False, "error": "Fecha inválida"}), 400
+    limite = max(1, min(request.args.get("limite", RECLAMOS_POR_PAGINA, type=int), RECLAMOS_POR_PAGINA))
+    # Lo que este worker tiene en cola también debe aparecer
+    bitacora.vaciar()
+    conn = get_conn()
+    rows = database.consultar_reclamos(conn, despues=request.args.get("despues", type=int),
+                                       limite=limite, **filtro).fetchall()
+    conn.close()
+    return jsonify({
+        "reclamos": [dict(row) for row in rows],
+        "siguiente": rows[-1]["id"] if len(rows) == limite else None,
+    })
 
-    return menu + tabla
+@admin_bp.route("/reclamos.csv")
+@requires_auth
+def reclamos_csv():
+    """La bitácora completa (con los mismos filtros) como CSV, en streaming."""
+    filtro = filtro_reclamos()
+    if filtro is None:
+        return jsonify({"ok": False, "error": "Fecha inválida"}), 400
+    bitacora.vaciar()
+
+    def generar():
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(COLUMNAS_RECLAMOS)
+        # La conexión se toma y se devuelve dentro del generador: si el cliente
+        # se desconecta, el cierre del generador pasa por el finally
+        conn = get_conn()
+        try:
+            cursor = database.consultar_reclamos(conn, **filtro)
+            while True:
+                filas = cursor.fetchmany(TAMANO_FETCH * 20)
+                if not filas:
+                    break
+                escritor.writerows(filas)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        finally:
+            conn.close()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generar()), mimetype="text/csv", headers={
+        "Content-Disposition": "attachment; filename=reclamos.csv",
+    })
 
 # ---------------- CONFIGURAR TIEMPO ----------------
 @admin_bp.route("/configurar_tiempo", methods=["GET", "POST"])
@@ -121,12 +270,93 @@ def configurar_tiempo():
 
     # POST: puede venir como JSON o como formulario
     data = request.get_json(silent=True) or request.form
-    segundos = data.get("segundos")
-    horas = data.get("horas")
-
-    if segundos:
-        return jsonify({"ok": True, "mensaje": f"Tiempo configurado en {segundos} segundos"})
-    elif horas:
-        return jsonify({"ok": True, "mensaje": f"Tiempo configurado en {horas} horas"})
-    else:
+    segundos = segundos_renovacion(data)
+    if segundos is None:
         return jsonify({"ok": False, "error": "Debes enviar 'segundos' o 'horas'"}), 400
+
+    # Se guarda en la base: todos los workers lo aplican en menos de un segundo
+    configuracion.guardar(**{CLAVE_TIEMPO: segundos})
+    if data.get("segundos"):
+        return jsonify({"ok": True, "mensaje": f"Tiempo configurado en {data.get('segundos')} segundos"})
+    return jsonify({"ok": True, "mensaje": f"Tiempo configurado en {data.get('horas')} horas"})
+
+# ---------------- IMPORTACIÓN MASIVA ----------------
+EXPORT_DIR = "exportaciones"
+
+@admin_bp.route("/importar", methods=["GET", "POST"])
+@requires_auth
+def importar_archivo():
+    if request.method == "GET":
+        return """
+        <h2>Importar beneficiarios</h2>
+        <form method="post" enctype="multipart/form-data">
+            <label>Archivo CSV (nombre,curp) o JSONL: <input type="file" name="archivo"></label><br><br>
+            <label><input type="checkbox" name="qr" value="1"> Generar ZIP con los QR</label><br><br>
+            <button type="submit">Importar</button>
+        </form>
+        <p>También desde consola: python importar.py padron.csv --qr-zip qrs.zip</p>
+        """
+
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        return jsonify({"ok": False, "error": "Debes enviar un 'archivo'"}), 400
+    formato = request.form.get("formato") or importar.detectar_formato(archivo.filename)
+
+    salida_qr = None
+    zip_path = None
+    if request.form.get("qr"):
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        zip_path = os.path.join(EXPORT_DIR, f"qr_importacion_{datetime.now():%Y%m%d_%H%M%S}.zip")
+        salida_qr = importar.SalidaQR(zip_path=zip_path)
+
+    resumen = importar.importar(importar.abrir_texto(archivo.stream), formato, salida_qr)
+    return jsonify({"ok": True, "resumen": resumen, "qr_zip": zip_path})
+
+# ---------------- HOJA DE CREDENCIALES QR ----------------
+@admin_bp.route("/qr_sheet")
+@requires_auth
+def qr_sheet():
+    """Descarga en streaming las credenciales QR (PDF o ZIP) de un filtro.
+
+    Parámetros: formato=pdf|zip, status, desde, hasta (ids) y limite.
+    """
+    formato = request.args.get("formato", "pdf")
+    status = request.args.get("status") or None
+    if formato not in ("pdf", "zip") or (status and status not in exportar_qr.STATUS_VALIDOS):
+        return jsonify({"ok": False, "error": "Parámetros inválidos"}), 400
+    filtro = dict(
+        status=status,
+        desde=request.args.get("desde", type=int),
+        hasta=request.args.get("hasta", type=int),
+        limite=request.args.get("limite", type=int),
+    )
+
+    total = almacen.contar(**filtro)
+
+    def generar():
+        try:
+            yield from exportar_qr.exportar(almacen.exportables(**filtro), formato, total)
+        finally:
+            current_app.logger.info("Hoja QR: %s", exportar_qr.ultima_exportacion)
+
+    mimetype = "application/zip" if formato == "zip" else "application/pdf"
+    return Response(stream_with_context(generar()), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename=credenciales.{formato}",
+        "X-Total-Credenciales": str(total),
+    })
+
+# ---------------- ESTADÍSTICAS ----------------
+@admin_bp.route("/estadisticas")
+@requires_auth
+def estadisticas():
+    """Estadísticas internas del worker que atiende la petición."""
+    return jsonify({
+        "pool": database.estadisticas_pool(),
+        "expiracion": programador.estadisticas(),
+        "qr": generador_qr.cache_qr.estadisticas(),
+        "ultima_hoja_qr": exportar_qr.ultima_exportacion,
+        "indice_codigos": indice.estadisticas(),
+        "bitacora": bitacora.estadisticas(),
+        "escaneos_repetidos": escaneos_recientes.estadisticas(),
+        "limitador_dispositivos": limitador.estadisticas(),
+    })
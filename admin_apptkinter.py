@@ -1,113 +1,139 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3, uuid, qrcode
-from PIL import Image, ImageTk
+import socket, sqlite3, uuid, qrcode, queue, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import ImageTk
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+import database
+import migraciones
+from expiracion import programador
+from instantanea import VerificadorSinConexion
 
 # Cambia esta IP por la de tu PC si usas celular en la misma red
 SERVER_URL = "http://192.168.1.68:5000"
 DB_NAME = "beneficiarios.db"
-# admin_app.py
-from flask import Blueprint, render_template
-import sqlite3
 
-admin_bp = Blueprint("admin", __name__, template_folder="templates")
-
-def db_connection():
-    conn = sqlite3.connect("beneficiarios.db")
-    conn.row_factory = sqlite3.Row
-    return conn
-
-@admin_bp.route("/")
-def admin_panel():
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT nombre, curp, status FROM beneficiarios")
-    rows = cursor.fetchall()
-    conn.close()
-
-    tabla = "<table border=1><tr><th>Nombre</th><th>CURP</th><th>Status</th></tr>"
-    for row in rows:
-        tabla += f"<tr><td>{row['nombre']}</td><td>{row['curp']}</td><td>{row['status']}</td></tr>"
-    tabla += "</table>"
-
-    return f"<h1>Panel de control</h1>{tabla}"
 # ---------------- UTILIDADES DE BASE DE DATOS ----------------
+# Todas se ejecutan en el hilo trabajador_db, nunca en el hilo de Tk
 def get_conn():
     return sqlite3.connect(DB_NAME)
 
 def ensure_schema():
-    """Asegura que la tabla tenga las columnas requeridas."""
+    """Aplica las migraciones pendientes (ver migraciones.py)."""
+    migraciones.aplicar(DB_NAME)
+
+COLUMNAS_TABLA = f"id, nombre, curp, status, {database.CODIGO_TEXTO}"
+
+def _filas_desde(conn, id_usuario, limite):
+    return conn.execute(f"""
+        SELECT {COLUMNAS_TABLA} FROM beneficiarios WHERE id >= ? ORDER BY id LIMIT ?
+    """, (id_usuario, limite)).fetchall()
+
+def _filas_antes(conn, id_usuario, limite):
+    """Las `limite` filas anteriores a `id_usuario`, en orden de id."""
+    filas = conn.execute(f"""
+        SELECT {COLUMNAS_TABLA} FROM beneficiarios WHERE id < ? ORDER BY id DESC LIMIT ?
+    """, (id_usuario, limite)).fetchall()
+    filas.reverse()
+    return filas
+
+def contar(conn, conteo):
+    """(version, total, max_id); COUNT(*) solo se repite si hubo altas o bajas desde `conteo`.
+
+    Los reclamos y expiraciones también avanzan la versión de cambios, pero
+    no cambian el total: basta ver si algún cambio posterior es un borrado
+    o un id mayor al último contado (búsqueda por el índice de versión).
+    """
+    # La versión se lee antes que los datos: lo que cambie en medio se vuelve a aplicar
+    version = database.version_cambios(conn)
+    if conteo is not None:
+        version_conteo, total, max_id = conteo
+        if version == version_conteo:
+            return conteo
+        altas_o_bajas = conn.execute("""
+            SELECT EXISTS(SELECT 1 FROM cambios WHERE version > ? AND (borrado OR id_beneficiario > ?))
+        """, (version_conteo, max_id)).fetchone()[0]
+        if not altas_o_bajas:
+            return version, total, max_id
+    total, max_id = conn.execute("SELECT COUNT(*), IFNULL(MAX(id), 0) FROM beneficiarios").fetchone()
+    return version, total, max_id
+
+def obtener_datos(primer_id, inicio, mover, limite, conteo):
+    """Ventana de la tabla en orden de id: solo las filas que se van a mostrar.
+
+    Paginación por keyset desde `primer_id` (la primera fila visible), así
+    el costo no crece con la posición: `mover` es ("filas", n) para bajar o
+    subir n filas, o ("fraccion", f) cuando se arrastra la barra, que salta
+    al id en esa fracción del rango. `inicio` (la posición para la barra)
+    se lleva aproximada y es exacta en los extremos. Devuelve
+    (conteo, inicio, filas), con `conteo` como lo da contar().
+    """
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS beneficiarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            curp TEXT UNIQUE NOT NULL,
-            codigo_unico TEXT UNIQUE NOT NULL,
-            status TEXT DEFAULT 'PENDIENTE',
-            fecha_reclamo TEXT,
-            fecha_expira TEXT
-        )
-    """)
-    # Verificar columnas faltantes por si la tabla existía antes
-    cursor.execute("PRAGMA table_info(beneficiarios)")
-    cols = {row[1] for row in cursor.fetchall()}
-    if "fecha_reclamo" not in cols:
-        cursor.execute("ALTER TABLE beneficiarios ADD COLUMN fecha_reclamo TEXT")
-    if "fecha_expira" not in cols:
-        cursor.execute("ALTER TABLE beneficiarios ADD COLUMN fecha_expira TEXT")
-    conn.commit()
-    conn.close()
+    try:
+        conteo = contar(conn, conteo)
+        _, total, max_id = conteo
+        tipo, cantidad = mover
+        if tipo == "fraccion":
+            minimo = conn.execute("SELECT IFNULL(MIN(id), 0) FROM beneficiarios").fetchone()[0]
+            filas = _filas_desde(conn, minimo + int(cantidad * (max_id - minimo)), limite)
+            inicio = int(cantidad * total)
+        elif cantidad >= 0:
+            filas = _filas_desde(conn, primer_id, cantidad + limite)[cantidad:]
+            inicio += cantidad
+        else:
+            anteriores = _filas_antes(conn, primer_id, -cantidad)
+            filas = _filas_desde(conn, anteriores[0][0] if anteriores else primer_id, limite)
+            inicio -= len(anteriores)
+        if len(filas) < limite:
+            # Fin de la tabla: la última ventana completa
+            filas = _filas_antes(conn, max_id + 1, limite)
+            inicio = total - len(filas)
+        elif not _filas_antes(conn, filas[0][0], 1):
+            inicio = 0
+    finally:
+        conn.close()
+    return conteo, max(0, min(inicio, total - len(filas))), filas
 
-def limpiar_expirados():
-    """Resetea a PENDIENTE todos los beneficiarios RECLAMADO cuyo fecha_expira ya pasó."""
+def buscar_en_base(texto):
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, fecha_expira FROM beneficiarios WHERE status='RECLAMADO'")
-    rows = cursor.fetchall()
-    cambios = 0
-    for id_, fecha_expira in rows:
-        try:
-            if fecha_expira and datetime.fromisoformat(fecha_expira) < datetime.now():
-                cursor.execute("""
-                    UPDATE beneficiarios
-                    SET status='PENDIENTE', fecha_reclamo=NULL, fecha_expira=NULL
-                    WHERE id=?
-                """, (id_,))
-                cambios += 1
-        except Exception:
-            # Si hay un formato inesperado, lo ignoramos
-            continue
-    conn.commit()
-    conn.close()
-    return cambios
+    try:
+        version = database.version_cambios(conn)
+        # Misma búsqueda indexada (FTS5) que /admin/buscar
+        return version, database.buscar(conn, texto, LIMITE_BUSQUEDA)
+    finally:
+        conn.close()
 
-def obtener_datos():
-    limpiar_expirados()  # limpiar antes de mostrar
+def leer_cambios(version):
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nombre, curp, status, codigo_unico FROM beneficiarios")
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    try:
+        cambios = []
+        while True:
+            parte = database.cambios_desde(conn, version)
+            cambios.extend(parte)
+            if len(parte) < database.CAMBIOS_MAX:
+                return cambios
+            version = parte[-1][0]
+    finally:
+        conn.close()
 
 def agregar_usuario(nombre, curp):
+    """Devuelve el código nuevo, o None si el nombre o la CURP ya existen."""
     codigo = str(uuid.uuid4())
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO beneficiarios (nombre, curp, codigo_unico, status) VALUES (?,?,?,?)",
-            (nombre, curp, codigo, "PENDIENTE")
-        )
-        conn.commit()
-        conn.close()
-        return codigo
-    except sqlite3.IntegrityError:
+    conn = get_conn()
+    insertado = database.registrar_beneficiario(conn, nombre, curp, codigo)
+    conn.close()
+    return codigo if insertado else None
+
+def agregar_con_qr(nombre, curp):
+    """Registra y renderiza el QR (imagen PIL); None si ya existía."""
+    codigo = agregar_usuario(nombre, curp)
+    if not codigo:
         return None
+    # Generar QR con la URL completa
+    url_qr = f"{SERVER_URL}/verificar/{codigo}"
+    return qrcode.make(url_qr).get_image().resize((200, 200))
 
 def eliminar_usuario(id_usuario):
     conn = get_conn()
@@ -116,69 +142,251 @@ def eliminar_usuario(id_usuario):
     conn.commit()
     conn.close()
 
-def eliminar_todos():
-    confirmar = messagebox.askyesno("Confirmar", "⚠️ Esto borrará TODOS los registros.\n¿Seguro que deseas continuar?")
-    if confirmar:
-        conn = get_conn()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM beneficiarios")
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name='beneficiarios'")
-        conn.commit()
-        conn.close()
-        refrescar_tabla()
-        label_qr.config(image="")
-        messagebox.showinfo("Éxito", "Todos los registros fueron eliminados y el ID reiniciado")
+def borrar_todo():
+    conn = get_conn()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM beneficiarios")
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name='beneficiarios'")
+    conn.commit()
+    conn.close()
 
-# ---------------- FUNCIONES DE INTERFAZ ----------------
-def refrescar_tabla():
-    cambios = limpiar_expirados()
-    for row in tree.get_children():
-        tree.delete(row)
-    for r in obtener_datos():
+# ---------------- TRABAJO EN SEGUNDO PLANO ----------------
+# Los hilos trabajadores dejan (callback, valor) en esta cola y
+# ciclo_resultados() los ejecuta en el hilo de Tk.
+resultados = queue.SimpleQueue()
+
+class Trabajador:
+    """Hilo que ejecuta tareas en orden de llegada, fuera del hilo de Tk."""
+
+    def __init__(self, nombre):
+        self._tareas = queue.SimpleQueue()
+        threading.Thread(target=self._ciclo, name=nombre, daemon=True).start()
+
+    def enviar(self, funcion, *args, al_terminar=None, al_fallar=None):
+        self._tareas.put((funcion, args, al_terminar, al_fallar))
+
+    def _ciclo(self):
+        while True:
+            funcion, args, al_terminar, al_fallar = self._tareas.get()
+            try:
+                resultado = funcion(*args)
+            except Exception as error:
+                resultados.put((al_fallar or error_en_segundo_plano, error))
+            else:
+                if al_terminar:
+                    resultados.put((al_terminar, resultado))
+
+# Uno para SQLite y otro para HTTP: una petición lenta no frena la tabla
+trabajador_db = Trabajador("tk-base")
+trabajador_red = Trabajador("tk-red")
+
+INTERVALO_RESULTADOS_MS = 30
+
+def ciclo_resultados():
+    try:
+        while True:
+            try:
+                callback, valor = resultados.get_nowait()
+            except queue.Empty:
+                break
+            callback(valor)
+    finally:
+        root.after(INTERVALO_RESULTADOS_MS, ciclo_resultados)
+
+def error_en_segundo_plano(error):
+    status_bar.set(f"Error: {error}")
+
+# ---------------- TABLA VIRTUAL ----------------
+# El Treeview solo contiene las filas visibles; la barra de desplazamiento
+# se mueve sobre el total y cada movimiento pide esa ventana a la base.
+ALTO_FILA = 20
+estado_tabla = {
+    "version": 0,      # versión de cambios que ya refleja la tabla
+    "total": 0,
+    "max_id": 0,
+    "conteo": None,    # (version, total, max_id) del último COUNT(*)
+    "inicio": 0,       # posición de la primera fila visible
+    "primer_id": 0,    # id de la primera fila visible (keyset)
+    "filas": 14,       # filas que caben en el Treeview
+    "busqueda": None,  # lista de resultados cuando se muestra una búsqueda
+    "en_vuelo": False,
+    "mover": None,     # movimiento pendiente mientras hay una consulta en curso
+    "cambios_en_vuelo": False,
+}
+
+def _sumar_movimientos(pendiente, mover):
+    # Los desplazamientos por filas se acumulan; un salto de la barra reemplaza
+    if pendiente is not None and pendiente[0] == mover[0] == "filas":
+        return ("filas", pendiente[1] + mover[1])
+    return mover if mover[0] == "fraccion" or pendiente is None else pendiente
+
+def cargar_ventana(mover=("filas", 0)):
+    """Pide la ventana visible; si ya hay una consulta en curso, se repite al terminar."""
+    if estado_tabla["busqueda"] is not None:
+        mostrar_busqueda()
+        return
+    estado_tabla["mover"] = _sumar_movimientos(estado_tabla["mover"], mover)
+    if estado_tabla["en_vuelo"]:
+        return
+    mover, estado_tabla["mover"] = estado_tabla["mover"], None
+    estado_tabla["en_vuelo"] = True
+    trabajador_db.enviar(obtener_datos, estado_tabla["primer_id"], estado_tabla["inicio"], mover,
+                         estado_tabla["filas"], estado_tabla["conteo"],
+                         al_terminar=ventana_cargada, al_fallar=ventana_fallida)
+
+def ventana_cargada(datos):
+    conteo, inicio, filas = datos
+    estado_tabla["en_vuelo"] = False
+    if estado_tabla["busqueda"] is not None:
+        estado_tabla["mover"] = None
+        mostrar_busqueda()
+        return
+    version, total, max_id = conteo
+    estado_tabla.update(version=version, total=total, max_id=max_id, conteo=conteo, inicio=inicio,
+                        primer_id=filas[0][0] if filas else 0)
+    if estado_tabla["mover"] is not None:
+        # Se movió la barra mientras se consultaba esta ventana
+        cargar_ventana()
+        return
+    mostrar_filas(filas)
+
+def ventana_fallida(error):
+    estado_tabla["en_vuelo"] = False
+    estado_tabla["mover"] = None
+    error_en_segundo_plano(error)
+
+def mostrar_busqueda():
+    filas = estado_tabla["busqueda"]
+    estado_tabla["total"] = len(filas)
+    inicio = max(0, min(estado_tabla["inicio"], len(filas) - estado_tabla["filas"]))
+    estado_tabla["inicio"] = inicio
+    mostrar_filas(filas[inicio:inicio + estado_tabla["filas"]])
+
+def mostrar_filas(filas):
+    tree.delete(*tree.get_children())
+    for r in filas:
         # r: (id, nombre, curp, status, codigo_unico)
         status_tag = "pendiente" if r[3] == "PENDIENTE" else "reclamado"
-        tree.insert("", tk.END, values=r, tags=(status_tag,))
-    if cambios:
-        status_bar.set(f"Registros expirados reseteados: {cambios}")
+        tree.insert("", tk.END, iid=str(r[0]), values=tuple(r), tags=(status_tag,))
+    total = estado_tabla["total"]
+    if total:
+        inicio = estado_tabla["inicio"]
+        scrollbar.set(inicio / total, min(1.0, (inicio + len(filas)) / total))
+    else:
+        scrollbar.set(0.0, 1.0)
+
+def desplazar(accion, cantidad, unidad=None):
+    """Comando de la barra de desplazamiento ('moveto' o 'scroll')."""
+    total, filas = estado_tabla["total"], estado_tabla["filas"]
+    if accion == "moveto":
+        fraccion = max(0.0, min(1.0, float(cantidad)))
+        mover = ("fraccion", fraccion)
+        inicio = int(fraccion * total)
+    else:
+        paso = filas if unidad == "pages" else 1
+        mover = ("filas", int(cantidad) * paso)
+        inicio = estado_tabla["inicio"] + mover[1]
+    inicio = max(0, min(inicio, total - filas))
+    if inicio == estado_tabla["inicio"] and estado_tabla["mover"] is None:
+        return
+    if estado_tabla["busqueda"] is not None:
+        estado_tabla["inicio"] = inicio
+        mostrar_busqueda()
     else:
-        status_bar.set("Tabla actualizada")
+        cargar_ventana(mover)
 
-def accion_agregar():
-    nombre = entry_nombre.get().strip().upper()
-    curp = entry_curp.get().strip().upper()
+def rueda(event):
+    if event.num == 4 or event.delta > 0:
+        desplazar("scroll", -3)
+    else:
+        desplazar("scroll", 3)
+    return "break"
+
+def redimensionar(event):
+    filas = max(1, (event.height - ALTO_FILA) // ALTO_FILA)
+    if filas != estado_tabla["filas"]:
+        estado_tabla["filas"] = filas
+        cargar_ventana()
 
-    if not nombre or not curp:
-        messagebox.showwarning("Error", "Debes ingresar nombre y CURP")
+def refrescar_tabla():
+    """Vuelve a la tabla completa desde la primera fila."""
+    estado_tabla["busqueda"] = None
+    cargar_ventana(("fraccion", 0.0))
+    status_bar.set("Tabla actualizada")
+
+def actualizar_tabla():
+    """Aplica los cambios desde la última versión sin recargar toda la tabla."""
+    if estado_tabla["cambios_en_vuelo"]:
+        return
+    estado_tabla["cambios_en_vuelo"] = True
+    trabajador_db.enviar(leer_cambios, estado_tabla["version"],
+                         al_terminar=aplicar_cambios, al_fallar=cambios_fallidos)
+
+def cambios_fallidos(error):
+    estado_tabla["cambios_en_vuelo"] = False
+    error_en_segundo_plano(error)
+
+def aplicar_cambios(cambios):
+    estado_tabla["cambios_en_vuelo"] = False
+    if not cambios:
         return
-    if len(curp) != 18:
-        messagebox.showwarning("Error", "La CURP debe tener exactamente 18 caracteres")
+    estado_tabla["version"] = max(estado_tabla["version"], cambios[-1][0])
+    busqueda = estado_tabla["busqueda"]
+    if busqueda is not None:
+        # En una búsqueda solo se actualizan (o quitan) sus resultados
+        posiciones = {r[0]: i for i, r in enumerate(busqueda)}
+        for _, id_usuario, borrado, nombre, curp, status, codigo in cambios:
+            i = posiciones.get(id_usuario)
+            if i is not None:
+                busqueda[i] = None if borrado else (id_usuario, nombre, curp, status, codigo)
+        estado_tabla["busqueda"] = [r for r in busqueda if r is not None]
+        mostrar_busqueda()
         return
+    if any(borrado or id_usuario > estado_tabla["max_id"] for _, id_usuario, borrado, *_ in cambios):
+        # Altas y bajas mueven las posiciones: se vuelve a pedir la ventana visible
+        cargar_ventana()
+        return
+    for _, id_usuario, _, nombre, curp, status, codigo in cambios:
+        iid = str(id_usuario)
+        if tree.exists(iid):
+            status_tag = "pendiente" if status == "PENDIENTE" else "reclamado"
+            tree.item(iid, values=(id_usuario, nombre, curp, status, codigo), tags=(status_tag,))
 
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM beneficiarios WHERE nombre=? OR curp=?", (nombre, curp))
-    existe = cursor.fetchone()
-    conn.close()
-    if existe:
-        messagebox.showerror("Error", "El nombre o la CURP ya están registrados")
+# Cambios hechos por el servidor u otros procesos sobre la misma base
+INTERVALO_CAMBIOS_MS = 2000
+
+def ciclo_cambios():
+    actualizar_tabla()
+    root.after(INTERVALO_CAMBIOS_MS, ciclo_cambios)
+
+def accion_agregar():
+    nombre, curp, error = database.normalizar_registro(entry_nombre.get(), entry_curp.get())
+    if error:
+        messagebox.showwarning("Error", error)
         return
 
-    codigo = agregar_usuario(nombre, curp)
-    if codigo:
-        # Generar QR con la URL completa
-        url_qr = f"{SERVER_URL}/verificar/{codigo}"
-        img = qrcode.make(url_qr)
-        img.save("qr_temp.png")
-        qr_img = Image.open("qr_temp.png").resize((200, 200))
+    btn_agregar.config(state="disabled")
+    status_bar.set(f"Agregando a {nombre}...")
+
+    def agregado(qr_img):
+        btn_agregar.config(state="normal")
+        if qr_img is None:
+            messagebox.showerror("Error", "El nombre o la CURP ya están registrados")
+            return
+        # PhotoImage solo puede crearse en el hilo de Tk
         qr_tk = ImageTk.PhotoImage(qr_img)
         label_qr.config(image=qr_tk)
         label_qr.image = qr_tk
         messagebox.showinfo("Éxito", f"Usuario {nombre} agregado con éxito")
         entry_nombre.delete(0, tk.END)
         entry_curp.delete(0, tk.END)
-        refrescar_tabla()
-    else:
-        messagebox.showerror("Error", "No se pudo registrar el usuario")
+        actualizar_tabla()
+
+    def fallido(error):
+        btn_agregar.config(state="normal")
+        error_en_segundo_plano(error)
+
+    trabajador_db.enviar(agregar_con_qr, nombre, curp, al_terminar=agregado, al_fallar=fallido)
 
 def accion_eliminar():
     seleccionado = tree.selection()
@@ -189,12 +397,36 @@ def accion_eliminar():
     id_usuario = item["values"][0]
     confirmar = messagebox.askyesno("Confirmar", "¿Seguro que deseas eliminar este usuario?")
     if confirmar:
-        eliminar_usuario(id_usuario)
-        refrescar_tabla()
-        label_qr.config(image="")
-        messagebox.showinfo("Eliminado", "Usuario eliminado correctamente")
+        def eliminado(_):
+            actualizar_tabla()
+            label_qr.config(image="")
+            messagebox.showinfo("Eliminado", "Usuario eliminado correctamente")
+        trabajador_db.enviar(eliminar_usuario, id_usuario, al_terminar=eliminado)
+
+def eliminar_todos():
+    confirmar = messagebox.askyesno("Confirmar", "⚠️ Esto borrará TODOS los registros.\n¿Seguro que deseas continuar?")
+    if confirmar:
+        def eliminados(_):
+            refrescar_tabla()
+            label_qr.config(image="")
+            messagebox.showinfo("Éxito", "Todos los registros fueron eliminados y el ID reiniciado")
+        trabajador_db.enviar(borrar_todo, al_terminar=eliminados)
 
 # ---------------- VERIFICACIÓN DE QR ----------------
+# Peticiones simultáneas del modo escáner; la sesión mantiene abiertas
+# (keep-alive) esa misma cantidad de conexiones al servidor
+ESCANEOS_EN_VUELO = 4
+sesion_http = requests.Session()
+# El servidor limita los escaneos por dispositivo y reconoce los repetidos de este equipo
+sesion_http.headers["X-Dispositivo"] = f"escritorio-{socket.gethostname()}"
+sesion_http.mount("http://", HTTPAdapter(pool_maxsize=ESCANEOS_EN_VUELO))
+sesion_http.mount("https://", HTTPAdapter(pool_maxsize=ESCANEOS_EN_VUELO))
+
+def verificar_en_linea(codigo):
+    # POST para obtener JSON y aplicar la lógica del servidor
+    r = sesion_http.post(f"{SERVER_URL}/verificar", json={"codigo": codigo}, timeout=6)
+    return r.status_code, (r.json() if r.status_code == 200 else None)
+
 def comenzar_verificacion():
     ventana = tk.Toplevel(root)
     ventana.title("Verificación de QR")
@@ -215,33 +447,184 @@ def comenzar_verificacion():
             bg=color_bg, fg="white"
         ).pack(fill="both", expand=True)
 
+    def respuesta(resultado):
+        estado, nombre, local = resultado
+        # Sin conexión la instantánea no trae nombres: el reclamo se sube después
+        aviso = "\n(sin conexión, se sincroniza después)" if local else ""
+        if estado == "puede reclamar":
+            mostrar_resultado("green", f"🟩 {nombre} VALIDADO", "Marcado como RECLAMADO" + aviso)
+        elif estado == "ya reclamado":
+            mostrar_resultado("red", f"🟥 {nombre} YA RECLAMÓ", aviso.strip())
+        else:
+            mostrar_resultado("gray", "❌ CÓDIGO NO ENCONTRADO", aviso.strip())
+        actualizar_tabla()
+
+    def fallo(error):
+        if isinstance(error, requests.RequestException):
+            mostrar_resultado("orange", "Error de conexión")
+        else:
+            mostrar_resultado("orange", "Error del servidor")
+
     def validar():
         codigo = entry_codigo.get().strip()
         if not codigo:
             messagebox.showwarning("Error", "Debes ingresar un código")
             return
-        try:
-            # POST para obtener JSON y aplicar la lógica del servidor
-            r = requests.post(f"{SERVER_URL}/verificar", json={"codigo": codigo}, timeout=6)
-            if r.status_code == 200:
-                data = r.json()
-                estado = data.get("status")
-                nombre = data.get("nombre", "")
-                if estado == "puede reclamar":
-                    mostrar_resultado("green", f"🟩 {nombre} VALIDADO", "Marcado como RECLAMADO")
-                elif estado == "ya reclamado":
-                    mostrar_resultado("red", f"🟥 {nombre} YA RECLAMÓ")
-                else:
-                    mostrar_resultado("gray", "❌ CÓDIGO NO ENCONTRADO")
-                refrescar_tabla()
+        # Primero el servidor (ve los reclamos de las demás puertas); la
+        # instantánea solo decide si no hay red
+        boton_validar.config(state="disabled")
+        trabajador_red.enviar(verificar_escaneo, codigo, al_terminar=respuesta, al_fallar=fallo)
+
+    boton_validar = tk.Button(ventana, text="Validar", command=validar)
+    boton_validar.pack(pady=15)
+
+# ---------------- MODO ESCÁNER CONTINUO ----------------
+# Para lectores USB que escriben el código y un Enter: la ventana queda
+# abierta, cada escaneo sale sin esperar al anterior y el resultado aparece
+# en la lista cuando llega. La tabla no se recarga por escaneo (la
+# actualiza ciclo_cambios).
+HISTORIAL_ESCANEOS = 50
+escaneos_pool = ThreadPoolExecutor(max_workers=ESCANEOS_EN_VUELO, thread_name_prefix="escaner")
+
+def codigo_de_escaneo(texto):
+    """El QR trae la URL completa; el código es el último segmento."""
+    return texto.strip().rstrip("/").rsplit("/", 1)[-1]
+
+def verificar_escaneo(codigo):
+    """Pregunta al servidor; sin conexión decide con la instantánea local.
+
+    Devuelve (estado, nombre, local). Solo un error de red o un timeout
+    pasan a la instantánea; una respuesta de error del servidor no.
+    """
+    try:
+        status_code, data = verificar_en_linea(codigo)
+    except (requests.ConnectionError, requests.Timeout):
+        if not verificador.disponible:
+            raise
+        return verificador.verificar(codigo), "", True
+    if status_code != 200:
+        raise RuntimeError(f"Error del servidor ({status_code})")
+    return data.get("status"), data.get("nombre", ""), False
+
+def modo_escaner():
+    if modo_escaner.ventana is not None and modo_escaner.ventana.winfo_exists():
+        modo_escaner.ventana.lift()
+        return
+    ventana = modo_escaner.ventana = tk.Toplevel(root)
+    ventana.title("Modo escáner continuo")
+    ventana.geometry("560x520")
+
+    tk.Label(ventana, text="Escanea los códigos (Enter después de cada uno):", font=("Arial", 12)).pack(pady=5)
+    entry_escaneo = tk.Entry(ventana, width=50, font=("Arial", 14))
+    entry_escaneo.pack(pady=5)
+    contador = tk.StringVar(value="0 escaneos/min | 0 en curso")
+    tk.Label(ventana, textvariable=contador, font=("Arial", 11)).pack()
+    lista = tk.Listbox(ventana, font=("Arial", 13), height=HISTORIAL_ESCANEOS)
+    lista.pack(fill="both", expand=True, padx=5, pady=5)
+
+    marcas = deque()
+    estado = {"escaneos": 0, "en_curso": 0}
+
+    def fila(numero):
+        # El más reciente va arriba: la posición depende de cuántos llegaron después
+        indice = estado["escaneos"] - 1 - numero
+        return indice if indice < lista.size() else None
+
+    def mostrar(numero, codigo, resultado):
+        estado["en_curso"] -= 1
+        if not lista.winfo_exists():
+            return
+        indice = fila(numero)
+        if indice is None:
+            return
+        status, nombre, local = resultado
+        sufijo = " (sin conexión)" if local else ""
+        if status == "puede reclamar":
+            texto, color = f"🟩 {nombre} VALIDADO{sufijo}", "#d9fcd9"
+        elif status == "ya reclamado":
+            texto, color = f"🟥 {nombre} YA RECLAMÓ{sufijo}", "#ffd6d6"
+        else:
+            texto, color = f"❌ {codigo} NO ENCONTRADO{sufijo}", "#dddddd"
+        lista.delete(indice)
+        lista.insert(indice, texto)
+        lista.itemconfig(indice, bg=color)
+
+    def fallo(numero, codigo, error):
+        estado["en_curso"] -= 1
+        if not lista.winfo_exists():
+            return
+        indice = fila(numero)
+        if indice is None:
+            return
+        lista.delete(indice)
+        lista.insert(indice, f"⚠️ {codigo}: {error}")
+        lista.itemconfig(indice, bg="#ffe0b3")
+
+    def escanear(event=None):
+        codigo = codigo_de_escaneo(entry_escaneo.get())
+        entry_escaneo.delete(0, tk.END)
+        if not codigo:
+            return
+        numero = estado["escaneos"]
+        estado["escaneos"] += 1
+        estado["en_curso"] += 1
+        marcas.append(time.monotonic())
+        lista.insert(0, f"⏳ {codigo}")
+        if lista.size() > HISTORIAL_ESCANEOS:
+            lista.delete(tk.END)
+
+        def terminado(futuro):
+            # Corre en un hilo del pool: el resultado pasa por la cola de Tk
+            error = futuro.exception()
+            if error is None:
+                resultados.put((lambda r: mostrar(numero, codigo, r), futuro.result()))
             else:
-                mostrar_resultado("orange", "Error del servidor")
-        except Exception:
-            mostrar_resultado("orange", "Error de conexión")
+                resultados.put((lambda e: fallo(numero, codigo, e), error))
+        escaneos_pool.submit(verificar_escaneo, codigo).add_done_callback(terminado)
+
+    def actualizar_contador():
+        if not ventana.winfo_exists():
+            return
+        ahora = time.monotonic()
+        while marcas and ahora - marcas[0] > 60:
+            marcas.popleft()
+        contador.set(f"{len(marcas)} escaneos/min | {estado['en_curso']} en curso")
+        root.after(1000, actualizar_contador)
+
+    entry_escaneo.bind("<Return>", escanear)
+    ventana.bind("<FocusIn>", lambda event: entry_escaneo.focus_set())
+    entry_escaneo.focus_set()
+    actualizar_contador()
+
+modo_escaner.ventana = None
+
+# ---------------- SINCRONIZACIÓN DE RECLAMOS ----------------
+verificador = VerificadorSinConexion(SERVER_URL, sesion=sesion_http)
+INTERVALO_SINCRONIZACION_MS = 1000
+
+def ciclo_sincronizacion():
+    """Muestra en la barra de estado lo que hizo el hilo de sincronización."""
+    sincronizados = verificador.stats["sincronizados"]
+    while verificador.conflictos:
+        conflicto = verificador.conflictos.pop(0)
+        messagebox.showwarning(
+            "Conflicto de reclamo",
+            f"{conflicto.get('nombre') or conflicto['codigo']}: el servidor respondió "
+            f"'{conflicto['status']}' para el escaneo de {conflicto['escaneado']}"
+        )
+    if sincronizados != ciclo_sincronizacion.sincronizados:
+        ciclo_sincronizacion.sincronizados = sincronizados
+        actualizar_tabla()
+        status_bar.set(f"Reclamos sincronizados: {sincronizados} | pendientes: {verificador.pendientes()}")
+    root.after(INTERVALO_SINCRONIZACION_MS, ciclo_sincronizacion)
 
-    tk.Button(ventana, text="Validar", command=validar).pack(pady=15)
+ciclo_sincronizacion.sincronizados = 0
 
 # ---------------- CONFIGURACIÓN DE TIEMPO ----------------
+def enviar_tiempo(payload):
+    r = sesion_http.post(f"{SERVER_URL}/configurar_tiempo", json=payload, timeout=6)
+    return r.status_code
+
 def aplicar_tiempo():
     seleccion = combo_tiempo.get()
     if seleccion == "10 segundos":
@@ -249,14 +632,15 @@ def aplicar_tiempo():
     else:
         horas = int(seleccion.split()[0])
         payload = {"horas": horas}
-    try:
-        r = requests.post(f"{SERVER_URL}/configurar_tiempo", json=payload, timeout=6)
-        if r.status_code == 200:
+
+    def respuesta(status_code):
+        if status_code == 200:
             messagebox.showinfo("Configuración", f"Tiempo de renovación establecido en {seleccion}")
         else:
             messagebox.showerror("Error", "No se pudo aplicar la configuración en el servidor")
-    except Exception:
-        messagebox.showerror("Error", "No se pudo conectar con el servidor")
+
+    trabajador_red.enviar(enviar_tiempo, payload, al_terminar=respuesta,
+                          al_fallar=lambda error: messagebox.showerror("Error", "No se pudo conectar con el servidor"))
 
 # ---------------- INTERFAZ PRINCIPAL ----------------
 ensure_schema()
@@ -274,30 +658,27 @@ status_label.pack(fill="x")
 frame_busqueda = tk.Frame(root)
 frame_busqueda.pack(pady=5, fill="x")
 
-tk.Label(frame_busqueda, text="Buscar por nombre:").pack(side=tk.LEFT, padx=5)
+LIMITE_BUSQUEDA = 500
+
+tk.Label(frame_busqueda, text="Buscar por nombre o CURP:").pack(side=tk.LEFT, padx=5)
 entry_buscar = tk.Entry(frame_busqueda)
 entry_buscar.pack(side=tk.LEFT, padx=5, fill="x", expand=True)
 
 def buscar_nombre():
-    nombre = entry_buscar.get().strip().upper()
-    if not nombre:
+    texto = entry_buscar.get().strip()
+    if not texto:
         refrescar_tabla()
         return
-    limpiar_expirados()
-    for row in tree.get_children():
-        tree.delete(row)
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, nombre, curp, status, codigo_unico FROM beneficiarios WHERE nombre LIKE ?",
-        (f"%{nombre}%",)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-    for r in rows:
-        status_tag = "pendiente" if r[3] == "PENDIENTE" else "reclamado"
-        tree.insert("", tk.END, values=r, tags=(status_tag,))
-    status_bar.set(f"Búsqueda: {len(rows)} resultados")
+
+    def encontrados(resultado):
+        version, rows = resultado
+        # Mientras se muestra una búsqueda solo se actualizan sus resultados
+        estado_tabla.update(version=version, busqueda=[tuple(r) for r in rows], inicio=0)
+        mostrar_busqueda()
+        status_bar.set(f"Búsqueda: {len(rows)} resultados")
+
+    status_bar.set("Buscando...")
+    trabajador_db.enviar(buscar_en_base, texto, al_terminar=encontrados)
 
 btn_buscar = tk.Button(frame_busqueda, text="Buscar", command=buscar_nombre)
 btn_buscar.pack(side=tk.LEFT, padx=5)
@@ -353,9 +734,30 @@ btn_aplicar_tiempo.pack(side=tk.LEFT, padx=5)
 label_qr = tk.Label(root)
 label_qr.pack(pady=10)
 
+# ----- Botón para verificación -----
+# Se empaqueta antes que la tabla para que la tabla ocupe el espacio restante
+btn_verificar = tk.Button(
+    root,
+    text="Comenzar Verificación QR",
+    command=comenzar_verificacion,
+    bg="blue", fg="white"
+)
+btn_verificar.pack(side=tk.BOTTOM, pady=10)
+
+btn_escaner = tk.Button(
+    root,
+    text="Modo escáner continuo",
+    command=modo_escaner,
+    bg="navy", fg="white"
+)
+btn_escaner.pack(side=tk.BOTTOM, pady=5)
+
 # ----- Tabla -----
+frame_tabla = tk.Frame(root)
+frame_tabla.pack(pady=10, fill="both", expand=True)
+
 tree = ttk.Treeview(
-    root,
+    frame_tabla,
     columns=("ID", "Nombre", "CURP", "Status", "Codigo_unico"),
     show="headings", height=14
 )
@@ -374,21 +776,32 @@ tree.column("Codigo_unico", width=320)
 # Colorear filas según status
 style = ttk.Style()
 style.map('Treeview', foreground=[('disabled', 'gray')], background=[('disabled', '#eee')])
+# Alto fijo: así se sabe cuántas filas caben al redimensionar
+style.configure("Treeview", rowheight=ALTO_FILA)
 tree.tag_configure("pendiente", background="#d9fcd9")   # verde claro
 tree.tag_configure("reclamado", background="#ffd6d6")   # rojo claro
 
-tree.pack(pady=10, fill="both", expand=True)
+# La barra no desplaza el Treeview: mueve la ventana que se pide a la base
+scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=desplazar)
+scrollbar.pack(side=tk.RIGHT, fill="y")
+tree.pack(side=tk.LEFT, fill="both", expand=True)
 
-# ----- Botón para verificación -----
-btn_verificar = tk.Button(
-    root,
-    text="Comenzar Verificación QR",
-    command=comenzar_verificacion,
-    bg="blue", fg="white"
-)
-btn_verificar.pack(pady=10)
+tree.bind("<Configure>", redimensionar)
+tree.bind("<MouseWheel>", rueda)
+tree.bind("<Button-4>", rueda)
+tree.bind("<Button-5>", rueda)
+tree.bind("<Prior>", lambda event: desplazar("scroll", -1, "pages"))
+tree.bind("<Next>", lambda event: desplazar("scroll", 1, "pages"))
 
 # Inicializar tabla
+ciclo_resultados()
 refrescar_tabla()
+# La expiración la hace el programador del servidor; si este equipo usa la base
+# sin servidor, gana el candado y la hace él (ver expiracion.py). Los registros
+# reseteados llegan a la tabla por ciclo_cambios.
+programador.iniciar()
+ciclo_cambios()
+verificador.iniciar()
+ciclo_sincronizacion()
 
 root.mainloop()
@@ -0,0 +1,267 @@
+# almacen.py (acceso a los beneficiarios: un solo archivo o varios fragmentos)
+#
+# server.py, admin_app.py, importar.py y el programador de expiración pasan
+# por `almacen` en lugar de abrir beneficiarios.db directamente. Con
+# DB_FRAGMENTOS=N (N > 1) las filas se reparten en N archivos por la huella
+# de codigo_unico; cada fragmento tiene su propio candado de escritura, así
+# los reclamos de códigos en fragmentos distintos no se esperan entre sí.
+# Las lecturas del panel consultan todos los fragmentos y mezclan.
+import heapq, uuid
+from itertools import chain, islice
+import database
+import exportar_qr
+from indice_codigos import huella
+
+# Clave de orden de cada fila del panel (ver database.ORDENES)
+CLAVES_ORDEN = {
+    "id": lambda row: row["id"],
+    "-id": lambda row: -row["id"],
+    "nombre": lambda row: (row["nombre"], row["id"]),
+}
+
+class AlmacenSQLite:
+    """Todos los beneficiarios en un archivo: el modo por defecto.
+
+    También es cada fragmento de AlmacenFragmentado; en ese caso
+    `fragmento` es (k, n) y los ids nuevos se asignan con paso n. Los dos
+    tienen `fragmentos` y fragmento(codigo) para quien necesite un
+    escritor por archivo (server_async.py).
+    """
+
+    def __init__(self, ruta=None, fragmento=None):
+        self.ruta = ruta
+        self.numero = fragmento
+        self.fragmentos = [self]
+
+    def fragmento(self, texto):
+        return self
+
+    def conexion(self):
+        # Sin ruta: database.DB_NAME al momento de conectar
+        return database.get_conn(self.ruta)
+
+    def _con_conexion(self, funcion, *args, **kwargs):
+        conn = self.conexion()
+        try:
+            return funcion(conn, *args, **kwargs)
+        finally:
+            conn.close()
+
+    # ---------------- RECLAMOS ----------------
+    def reclamar(self, codigo, duracion):
+        return self._con_conexion(database.reclamar, codigo, duracion)
+
+    def reclamar_lote(self, escaneos, duracion):
+        return self._con_conexion(database.reclamar_lote, escaneos, duracion)
+
+    def sincronizar(self, reclamos, duracion):
+        return self._con_conexion(database.sincronizar_reclamos, reclamos, duracion)
+
+    def existe_codigo(self, codigo):
+        return self._con_conexion(database.existe_codigo, codigo)
+
+    # ---------------- REGISTRO ----------------
+    def nuevo_codigo(self, curp):
+        return str(uuid.uuid4())
+
+    def registrar(self, nombre, curp, codigo=None):
+        """Registra con un código nuevo; devuelve el código o None si es duplicado."""
+        codigo = codigo or self.nuevo_codigo(curp)
+        insertado = self._con_conexion(database.registrar_beneficiario, nombre, curp, codigo, self.numero)
+        return codigo if insertado else None
+
+    def registrados(self, nombres, curps):
+        return self._con_conexion(database.registrados, nombres, curps)
+
+    def insertar_lote(self, filas):
+        """Filas (nombre, curp, codigo) con códigos de nuevo_codigo(); devuelve las insertadas."""
+        return self._con_conexion(database.insertar_lote, filas, self.numero)
+
+    # ---------------- LECTURAS ----------------
+    def pagina(self, orden="id", despues=None, status=None, limite=100):
+        return self._con_conexion(
+            lambda conn: database.pagina_beneficiarios(conn, orden, despues, status, limite).fetchall())
+
+    def buscar(self, texto, limite=50):
+        return self._con_conexion(database.buscar, texto, limite)
+
+    def cambios(self, desde, limite):
+        """(cursor, filas, hay_mas); el cursor es la versión que el cliente manda después."""
+        version = int(desde or 0)
+        filas = self._con_conexion(database.cambios_desde, version, limite)
+        return (filas[-1]["version"] if filas else version), filas, len(filas) == limite
+
+    def instantanea(self):
+        """Filas (codigo, fecha_expira) para instantanea.generar()."""
+        conn = self.conexion()
+        try:
+            yield from database.instantanea_verificacion(conn)
+        finally:
+            conn.close()
+
+    def contar(self, **filtro):
+        return self._con_conexion(exportar_qr.contar, **filtro)
+
+    def exportables(self, **filtro):
+        """(nombre, curp, codigo) para las hojas de credenciales, leídos por bloques."""
+        conn = self.conexion()
+        try:
+            yield from exportar_qr.beneficiarios(conn, **filtro)
+        finally:
+            conn.close()
+
+    # ---------------- EXPIRACIÓN ----------------
+    def expirar(self, limite):
+        """Resetea todo lo vencido en transacciones de `limite`; devuelve (filas, lotes)."""
+        conn = self.conexion()
+        try:
+            total, lotes = 0, 0
+            while True:
+                cambios = database.resetear_lote_expirados(conn, limite)
+                total += cambios
+                lotes += 1
+                if cambios < limite:
+                    return total, lotes
+        finally:
+            conn.close()
+
+    def proximas_expiraciones(self, limite):
+        """Las siguientes expiraciones como datetime, en orden."""
+        return [database.a_fecha(fecha) for fecha in
+                self._con_conexion(database.proximas_expiraciones, limite)]
+
+class AlmacenFragmentado:
+    """Beneficiarios repartidos en n archivos por la huella de codigo_unico.
+
+    El código de un registro nuevo se elige para que caiga en el fragmento
+    de su CURP: así el UNIQUE de curp de cada archivo basta para toda la
+    base. El nombre duplicado se revisa en todos los fragmentos antes de
+    insertar (dos altas simultáneas del mismo nombre con CURP distinta en
+    fragmentos distintos no se detectan).
+    """
+
+    def __init__(self, rutas):
+        n = len(rutas)
+        self.fragmentos = [AlmacenSQLite(ruta, (k, n)) for k, ruta in enumerate(rutas)]
+
+    def fragmento(self, texto):
+        return self.fragmentos[huella(texto) % len(self.fragmentos)]
+
+    def _repartir(self, items, codigo):
+        """{fragmento: [(posición, item)]} según el código de cada item."""
+        grupos = {}
+        for i, item in enumerate(items):
+            grupos.setdefault(self.fragmento(codigo(item)), []).append((i, item))
+        return grupos
+
+    # ---------------- RECLAMOS ----------------
+    def reclamar(self, codigo, duracion):
+        return self.fragmento(codigo).reclamar(codigo, duracion)
+
+    def reclamar_lote(self, escaneos, duracion):
+        # Una transacción por fragmento; un código siempre cae en el mismo
+        resultados = [None] * len(escaneos)
+        for fragmento, grupo in self._repartir(escaneos, lambda escaneo: escaneo[0]).items():
+            for (i, _), resultado in zip(grupo, fragmento.reclamar_lote([e for _, e in grupo], duracion)):
+                resultados[i] = resultado
+        return resultados
+
+    def sincronizar(self, reclamos, duracion):
+        # El id de cada reclamo queda en el fragmento de su código, junto con el reclamo
+        resultados = [None] * len(reclamos)
+        for fragmento, grupo in self._repartir(reclamos, lambda reclamo: reclamo[1]).items():
+            for (i, _), resultado in zip(grupo, fragmento.sincronizar([r for _, r in grupo], duracion)):
+                resultados[i] = resultado
+        return resultados
+
+    def existe_codigo(self, codigo):
+        return self.fragmento(codigo).existe_codigo(codigo)
+
+    # ---------------- REGISTRO ----------------
+    def nuevo_codigo(self, curp):
+        # En promedio n intentos de uuid4 hasta caer en el fragmento de la CURP
+        destino = self.fragmento(curp)
+        while True:
+            codigo = str(uuid.uuid4())
+            if self.fragmento(codigo) is destino:
+                return codigo
+
+    def registrar(self, nombre, curp):
+        nombres, _ = self.registrados([nombre], [])
+        if nombres:
+            return None
+        return self.fragmento(curp).registrar(nombre, curp, self.nuevo_codigo(curp))
+
+    def registrados(self, nombres, curps):
+        nombres, curps = list(nombres), list(curps)
+        nombres_existentes, curps_existentes = set(), set()
+        for fragmento in self.fragmentos:
+            encontrados = fragmento.registrados(nombres, curps)
+            nombres_existentes |= encontrados[0]
+            curps_existentes |= encontrados[1]
+        return nombres_existentes, curps_existentes
+
+    def insertar_lote(self, filas):
+        return list(chain.from_iterable(fragmento.insertar_lote([fila for _, fila in grupo])
+                                        for fragmento, grupo in self._repartir(filas, lambda fila: fila[1]).items()))
+
+    # ---------------- LECTURAS ----------------
+    def pagina(self, orden="id", despues=None, status=None, limite=100):
+        # Cada fragmento ya viene ordenado: basta mezclar y cortar
+        paginas = [fragmento.pagina(orden, despues, status, limite) for fragmento in self.fragmentos]
+        return list(islice(heapq.merge(*paginas, key=CLAVES_ORDEN[orden]), limite))
+
+    def buscar(self, texto, limite=50):
+        filas = chain.from_iterable(fragmento.buscar(texto, limite) for fragmento in self.fragmentos)
+        return sorted(filas, key=CLAVES_ORDEN["id"])[:limite]
+
+    def cambios(self, desde, limite):
+        """Como AlmacenSQLite.cambios con un cursor "v0.v1..." (una versión por fragmento)."""
+        versiones = [int(v) for v in (desde or "0").split(".")]
+        if versiones == [0]:
+            versiones *= len(self.fragmentos)
+        if len(versiones) != len(self.fragmentos):
+            raise ValueError("Cursor de cambios de otro número de fragmentos")
+        filas, hay_mas = [], False
+        for k, fragmento in enumerate(self.fragmentos):
+            restantes = limite - len(filas)
+            if restantes <= 0:
+                hay_mas = True
+                break
+            version, parte, mas = fragmento.cambios(versiones[k], restantes)
+            versiones[k] = version
+            filas.extend(parte)
+            hay_mas = hay_mas or mas
+        return ".".join(map(str, versiones)), filas, hay_mas
+
+    def instantanea(self):
+        return chain.from_iterable(fragmento.instantanea() for fragmento in self.fragmentos)
+
+    def contar(self, limite=None, **filtro):
+        total = sum(fragmento.contar(**filtro) for fragmento in self.fragmentos)
+        return min(total, limite) if limite else total
+
+    def exportables(self, limite=None, **filtro):
+        # Mezcla por id, como en un solo archivo; cada fragmento lee como mucho `limite`
+        filas = heapq.merge(*(fragmento.exportables(limite=limite, con_id=True, **filtro)
+                              for fragmento in self.fragmentos))
+        filas = (fila[1:] for fila in filas)
+        return islice(filas, limite) if limite else filas
+
+    # ---------------- EXPIRACIÓN ----------------
+    def expirar(self, limite):
+        resultados = [fragmento.expirar(limite) for fragmento in self.fragmentos]
+        return sum(total for total, _ in resultados), sum(lotes for _, lotes in resultados)
+
+    def proximas_expiraciones(self, limite):
+        listas = [fragmento.proximas_expiraciones(limite) for fragmento in self.fragmentos]
+        return list(islice(heapq.merge(*listas), limite))
+
+def crear_almacen(fragmentos=None):
+    """AlmacenSQLite con un fragmento (o ninguno configurado), si no AlmacenFragmentado."""
+    rutas = database.rutas_fragmentos(fragmentos)
+    if len(rutas) == 1:
+        return AlmacenSQLite()
+    return AlmacenFragmentado(rutas)
+
+almacen = crear_almacen()
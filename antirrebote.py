@@ -0,0 +1,140 @@
+# antirrebote.py (escaneos repetidos y límite de escaneos por dispositivo en /verificar)
+#
+# Las cámaras de celular y los lectores de kiosco disparan el mismo QR varias
+# veces en un segundo: sin esto el segundo disparo pasa por SQLite y la
+# pantalla cambia de VALIDADO a YA RECLAMÓ para la misma persona. Para los
+# dispositivos que se identifican con X-Dispositivo, los repetidos dentro de
+# ESCANEO_REPETIDO_MS reciben el resultado original sin tocar la base y cada
+# uno tiene una cubeta de tokens para que un lector descompuesto no sature
+# el camino de verificación. Sin la cabecera no se aplica ninguna de las dos:
+# detrás del proxy todos los celulares llegan con la misma IP, y otra puerta
+# que escanea el mismo QR recibiría el "puede reclamar" de la primera. Las
+# dos estructuras son por worker y con tamaño acotado.
+import math, os, threading, time
+from collections import OrderedDict
+
+# Ventana en la que un escaneo del mismo código y dispositivo es un repetido (0 la desactiva)
+REPETIDO_TTL = float(os.getenv("ESCANEO_REPETIDO_MS", 2000)) / 1000
+REPETIDOS_MAX = int(os.getenv("ESCANEO_REPETIDOS_MAX", 10000))
+# Escaneos por segundo sostenidos y ráfaga por dispositivo (tasa 0 desactiva el límite)
+TASA = float(os.getenv("DISPOSITIVO_TASA", 5))
+RAFAGA = float(os.getenv("DISPOSITIVO_RAFAGA", 20))
+DISPOSITIVOS_MAX = int(os.getenv("DISPOSITIVOS_MAX", 10000))
+# La cabecera la manda el cliente: se recorta para acotar la memoria
+CABECERA_DISPOSITIVO = "X-Dispositivo"
+LARGO_DISPOSITIVO = 64
+
+def identificar(cabecera):
+    """Clave del dispositivo: su cabecera X-Dispositivo, o "" si no la manda."""
+    return (cabecera or "")[:LARGO_DISPOSITIVO]
+
+class EscaneosRecientes:
+    """Resultado de cada (código, dispositivo) durante `ttl` segundos.
+
+    Todas las entradas viven lo mismo, así que el orden de inserción es el
+    de vencimiento: las vencidas se quitan del frente y, si se llena, sale
+    la más vieja. Un repetido que llega a otro worker sí pasa por la base.
+    """
+
+    def __init__(self, ttl=REPETIDO_TTL, max_entradas=REPETIDOS_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"repetidos": 0, "nuevos": 0, "vencidos": 0, "desalojados": 0}
+
+    def _purgar(self, ahora):
+        while self._entradas:
+            clave, (vence, _) = next(iter(self._entradas.items()))
+            if vence > ahora:
+                break
+            del self._entradas[clave]
+            self.stats["vencidos"] += 1
+
+    def obtener(self, codigo, dispositivo):
+        """El resultado guardado si es un repetido; si no (o sin dispositivo), None."""
+        if self.ttl <= 0 or not dispositivo:
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            self._purgar(ahora)
+            entrada = self._entradas.get((codigo, dispositivo))
+            if entrada is None:
+                self.stats["nuevos"] += 1
+                return None
+            self.stats["repetidos"] += 1
+            return entrada[1]
+
+    def guardar(self, codigo, dispositivo, resultado):
+        if self.ttl <= 0 or not dispositivo:
+            return
+        clave = (codigo, dispositivo)
+        with self._lock:
+            # Se conserva el primer resultado: los repetidos no extienden la ventana
+            if clave in self._entradas:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, resultado)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.stats["desalojados"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self.stats, entradas=len(self._entradas), max=self.max_entradas,
+                        ttl_ms=self.ttl * 1000)
+
+class LimitadorDispositivos:
+    """Cubeta de tokens por dispositivo (LRU de DISPOSITIVOS_MAX cubetas).
+
+    Una cubeta que sale por LRU llevaba tiempo sin usarse y ya estaría
+    llena de nuevo, así que desalojarla no le regala escaneos a nadie
+    salvo que haya más de `max_dispositivos` activos a la vez.
+    """
+
+    def __init__(self, tasa=TASA, rafaga=RAFAGA, max_dispositivos=DISPOSITIVOS_MAX):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_dispositivos = max_dispositivos
+        self._cubetas = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"permitidos": 0, "limitados": 0, "desalojados": 0, "sin_cabecera": 0}
+
+    def permitir(self, dispositivo):
+        """0 si el escaneo pasa; si no, segundos hasta que haya un token.
+
+        `dispositivo` es la cabecera X-Dispositivo; sin ella el escaneo pasa.
+        """
+        if self.tasa <= 0:
+            return 0
+        if not dispositivo:
+            with self._lock:
+                self.stats["sin_cabecera"] += 1
+            return 0
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ultimo = self._cubetas.pop(dispositivo, (self.rafaga, ahora))
+            tokens = min(self.rafaga, tokens + (ahora - ultimo) * self.tasa)
+            if tokens >= 1:
+                tokens -= 1
+                espera = 0
+                self.stats["permitidos"] += 1
+            else:
+                espera = (1 - tokens) / self.tasa
+                self.stats["limitados"] += 1
+            self._cubetas[dispositivo] = (tokens, ahora)
+            if len(self._cubetas) > self.max_dispositivos:
+                self._cubetas.popitem(last=False)
+                self.stats["desalojados"] += 1
+        return espera
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self.stats, dispositivos=len(self._cubetas), max=self.max_dispositivos,
+                        tasa=self.tasa, rafaga=self.rafaga)
+
+def segundos_reintento(espera):
+    """Valor de Retry-After (entero, al menos 1)."""
+    return str(max(1, math.ceil(espera)))
+
+escaneos_recientes = EscaneosRecientes()
+limitador = LimitadorDispositivos()
@@ -0,0 +1,102 @@
+# benchmarks/arranque.py (tiempo de arranque en frío de un worker)
+#
+# Uso:  python benchmarks/arranque.py --filas 100000 --repeticiones 10 [--modulo server_async]
+#
+# Siembra una base en un directorio temporal, aplica las migraciones (como el
+# maestro de gunicorn) y arranca `repeticiones` procesos nuevos que importan
+# la app y atienden su primera verificación. Así se ve cuánto tarda un worker
+# extra en estar listo al escalar bajo carga, y qué módulos pesados carga.
+import argparse, json, os, platform, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Módulos que un worker que solo verifica no debería cargar
+PESADOS = ("qrcode", "PIL", "concurrent.futures", "multiprocessing")
+
+# Proceso hijo: mide la importación y la primera verificación
+_HIJO = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import {modulo}
+importado = time.perf_counter()
+primera = None
+if "{modulo}" == "server":
+    {modulo}.app.test_client().post("/verificar", json={{"codigo": "{codigo}"}})
+    primera = time.perf_counter() - importado
+json.dump({{
+    "importar_ms": (importado - inicio) * 1000,
+    "primera_ms": primera * 1000 if primera is not None else None,
+    "pesados": [m for m in {pesados!r} if m in sys.modules],
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}, sys.stdout)
+"""
+
+def _ms(valores):
+    valores = sorted(v for v in valores if v is not None)
+    if not valores:
+        return None
+    return {"min": round(valores[0], 1), "p50": round(statistics.median(valores), 1),
+            "max": round(valores[-1], 1)}
+
+def medir(args):
+    from benchmarks.sembrar import sembrar
+    import migraciones
+    directorio = tempfile.mkdtemp(prefix="bench_arranque_")
+    try:
+        ruta = os.path.join(directorio, "beneficiarios.db")
+        sembrar(ruta, args.filas)
+        # Lo que antes pagaba cada worker al importar server.py, ahora una vez
+        conn = sqlite3.connect(ruta)
+        conn.execute("PRAGMA user_version=0")
+        conn.close()
+        inicio = time.perf_counter()
+        migraciones.aplicar(ruta)
+        migrar_ms = (time.perf_counter() - inicio) * 1000
+        conn = sqlite3.connect(ruta)
+        codigo = conn.execute("SELECT codigo_unico FROM beneficiarios LIMIT 1").fetchone()[0]
+        conn.close()
+
+        script = _HIJO.format(modulo=args.modulo, codigo=codigo, pesados=PESADOS)
+        entorno = dict(os.environ, PYTHONPATH=RAIZ, EXPIRACION_SONDEO="3600")
+        corridas = []
+        for _ in range(args.repeticiones):
+            inicio = time.perf_counter()
+            salida = subprocess.run([sys.executable, "-c", script], cwd=directorio, env=entorno,
+                                    check=True, stdout=subprocess.PIPE).stdout
+            datos = json.loads(salida)
+            datos["proceso_ms"] = (time.perf_counter() - inicio) * 1000
+            corridas.append(datos)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return {
+        "modulo": args.modulo,
+        "filas": args.filas,
+        "migraciones_ms": round(migrar_ms, 1),
+        "importar_ms": _ms(c["importar_ms"] for c in corridas),
+        "primera_verificacion_ms": _ms(c["primera_ms"] for c in corridas),
+        "proceso_ms": _ms(c["proceso_ms"] for c in corridas),
+        "rss_kb": max(c["rss_kb"] for c in corridas),
+        "modulos_pesados": sorted({m for c in corridas for m in c["pesados"]}),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Arranque en frío de un worker")
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--modulo", choices=("server", "server_async"), default="server")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    args = parser.parse_args(argv)
+
+    resultado = medir(args)
+    resultado["entorno"] = {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                            "plataforma": platform.platform(), "cpus": os.cpu_count()}
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+# benchmarks/carga.py (rendimiento del camino de verificación: en proceso y por HTTP)
+#
+# Uso:
+#   python benchmarks/carga.py --filas 1000,100000 --reclamados 0,0.5 --escaneres 8 \
+#       --salida resultados.json [--base base.json --tolerancia 0.15]
+#
+# Con --base solo se comparan corridas con los mismos parámetros de medición
+# (PARAMETROS_COMPARABLES); si difieren, termina con código 2 sin comparar.
+#
+# Cada combinación (filas x reclamados) corre en un proceso hijo con su propia
+# base sembrada en un directorio temporal, así nunca toca beneficiarios.db ni
+# arrastra estado (pool, índice, caché) de una combinación a otra.
+import argparse, http.client, itertools, json, math, os, platform, random, shutil, socket, sqlite3
+import subprocess, sys, tempfile, threading, time, uuid
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ESCENARIOS = ("verificar_codigo", "verificar_post", "registrar", "limpiar_expirados")
+# Fracción de escaneos con un código que no existe (QR ajeno o mal leído)
+DESCONOCIDOS = 0.1
+# Reclamos que se dejan vencidos antes de cada llamada a limpiar_expirados
+VENCER_POR_LLAMADA = 1000
+
+# ---------------- ESTADÍSTICAS ----------------
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    # Rango más cercano: el menor valor que cubre el p% de las muestras
+    k = max(0, min(len(ordenadas) - 1, math.ceil(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[k]
+
+def resumen(latencias, errores, segundos, cpu=None):
+    ordenadas = sorted(latencias)
+    ms = lambda valor: round(valor * 1000, 3) if valor is not None else None
+    return {
+        "peticiones": len(ordenadas),
+        "errores": errores,
+        "segundos": round(segundos, 3),
+        "por_segundo": round(len(ordenadas) / segundos, 1) if segundos else 0.0,
+        "p50_ms": ms(percentil(ordenadas, 50)),
+        "p95_ms": ms(percentil(ordenadas, 95)),
+        "p99_ms": ms(percentil(ordenadas, 99)),
+        "max_ms": ms(ordenadas[-1] if ordenadas else None),
+        # CPU de este proceso por petición (en modo proceso incluye al servidor)
+        "cpu_us": round(cpu / len(ordenadas) * 1e6, 1) if cpu is not None and ordenadas else None,
+    }
+
+def concurrente(escaneres, duracion, hacer_peticion):
+    """Corre `escaneres` hilos durante `duracion` s; hacer_peticion(hilo, azar) -> bool (éxito)."""
+    latencias, errores = [], [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + duracion
+
+    def escaner(numero):
+        azar = random.Random(numero)
+        propias, fallos = [], 0
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            try:
+                exito = hacer_peticion(numero, azar)
+            except Exception:
+                exito = False
+            propias.append(time.perf_counter() - inicio)
+            fallos += not exito
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallos
+
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    hilos = [threading.Thread(target=escaner, args=(i,)) for i in range(escaneres)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resumen(latencias, errores[0], time.perf_counter() - inicio, time.process_time() - inicio_cpu)
+
+# ---------------- COMBINACIÓN (PROCESO HIJO) ----------------
+def elegir_codigo(codigos, azar):
+    if azar.random() < DESCONOCIDOS:
+        return str(uuid.UUID(int=azar.getrandbits(128), version=4))
+    return azar.choice(codigos)
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def iniciar_servidor(tipo, puerto, procesos):
+    if tipo == "gunicorn":
+        comando = [sys.executable, "-m", "gunicorn", "-w", str(procesos), "--threads", "8",
+                   "-b", f"127.0.0.1:{puerto}", "server:app"]
+    elif tipo == "uvicorn":
+        comando = [sys.executable, "-m", "uvicorn", "server_async:app", "--host", "127.0.0.1",
+                   "--port", str(puerto), "--workers", str(procesos), "--log-level", "warning"]
+    else:
+        comando = [sys.executable, "-c",
+                   "import server; from werkzeug.serving import run_simple; "
+                   f"run_simple('127.0.0.1', {puerto}, server.app, threaded=True)"]
+    entorno = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proceso = subprocess.Popen(comando, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=1)
+            conexion.request("GET", "/verificar/calentamiento")
+            conexion.getresponse().read()
+            return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError(f"El servidor {tipo} no respondió en el puerto {puerto}")
+
+def combinacion(args):
+    """Siembra la base en el directorio actual y corre todos los escenarios."""
+    from benchmarks.sembrar import sembrar
+    segundos_siembra = sembrar("beneficiarios.db", args.filas, args.reclamados, args.vencidos,
+                               compacto=args.compacto)
+    import database
+    conn = sqlite3.connect("beneficiarios.db")
+    codigos = [row[0] for row in conn.execute(f"SELECT {database.CODIGO_TEXTO} FROM beneficiarios")]
+    conn.close()
+    tamano = os.path.getsize("beneficiarios.db")
+
+    # Reclamos vigentes todo el benchmark y programador de expiración en reposo:
+    # las proporciones sembradas no cambian solas a mitad de la medición
+    os.environ["EXPIRACION_SONDEO"] = "3600"
+    # Los escáneres simulados no mandan X-Dispositivo: ni la ventana de
+    # repetidos ni la cubeta por dispositivo se aplican y se mide la base
+    import server
+    from configuracion import configuracion, CLAVE_TIEMPO
+    configuracion.guardar(**{CLAVE_TIEMPO: 86400})
+    server.indice.cargar()
+    registros = itertools.count()
+    resultados = {}
+
+    def registrar_datos(numero):
+        n = next(registros)
+        return {"nombre": f"REGISTRO {numero} {n}", "curp": f"R{numero:03d}{n:014d}"}
+
+    if "proceso" in args.modos:
+        clientes = {}
+
+        def cliente(numero):
+            if numero not in clientes:
+                clientes[numero] = server.app.test_client()
+            return clientes[numero]
+
+        peticiones = {
+            "verificar_codigo": lambda n, azar: cliente(n).get(
+                f"/verificar/{elegir_codigo(codigos, azar)}").status_code in (200, 404),
+            "verificar_post": lambda n, azar: cliente(n).post(
+                "/verificar", json={"codigo": elegir_codigo(codigos, azar)}).status_code == 200,
+            "registrar": lambda n, azar: cliente(n).post(
+                "/registrar", data=registrar_datos(n)).status_code == 200,
+        }
+        for escenario in args.escenarios:
+            if escenario in peticiones:
+                resultados[f"proceso/{escenario}"] = concurrente(args.escaneres, args.duracion, peticiones[escenario])
+        if "limpiar_expirados" in args.escenarios:
+            resultados["proceso/limpiar_expirados"] = medir_limpieza(database, args.duracion)
+
+    if "http" in args.modos:
+        puerto = puerto_libre()
+        servidor = iniciar_servidor(args.servidor, puerto, args.procesos)
+        try:
+            conexiones = {}
+
+            def peticion(numero, metodo, ruta, cuerpo=None, tipo=None):
+                # Una conexión keep-alive por escáner, como un lector en la puerta
+                conexion = conexiones.get(numero)
+                if conexion is None:
+                    conexion = conexiones[numero] = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+                try:
+                    conexion.request(metodo, ruta, body=cuerpo, headers={"Content-Type": tipo} if tipo else {})
+                    respuesta = conexion.getresponse()
+                    respuesta.read()
+                except (OSError, http.client.HTTPException):
+                    conexion.close()
+                    del conexiones[numero]
+                    raise
+                if respuesta.will_close:
+                    conexion.close()
+                    del conexiones[numero]
+                return respuesta.status
+
+            peticiones = {
+                "verificar_codigo": lambda n, azar: peticion(
+                    n, "GET", f"/verificar/{elegir_codigo(codigos, azar)}") in (200, 404),
+                "verificar_post": lambda n, azar: peticion(
+                    n, "POST", "/verificar", json.dumps({"codigo": elegir_codigo(codigos, azar)}),
+                    "application/json") == 200,
+            }
+            if args.servidor != "uvicorn":
+                # server_async solo atiende la verificación
+                from urllib.parse import urlencode
+                peticiones["registrar"] = lambda n, azar: peticion(
+                    n, "POST", "/registrar", urlencode(registrar_datos(n)),
+                    "application/x-www-form-urlencoded") == 200
+            for escenario in args.escenarios:
+                if escenario in peticiones:
+                    resultados[f"http/{escenario}"] = concurrente(args.escaneres, args.duracion, peticiones[escenario])
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+    return {
+        "filas": args.filas,
+        "reclamados": args.reclamados,
+        "compacto": args.compacto,
+        "siembra_segundos": round(segundos_siembra, 2),
+        "db_bytes": tamano,
+        "resultados": resultados,
+    }
+
+def medir_limpieza(database, duracion):
+    """Vence VENCER_POR_LLAMADA reclamos (sin medir) y mide cada limpiar_expirados."""
+    conn = database.get_conn()
+    latencias = []
+    # Fechas de 2000 en el formato de la base: vencidas para cualquier reloj
+    formato = database.formato(conn)
+    reclamo, expira = formato.fecha(datetime(2000, 1, 1)), formato.fecha(datetime(2000, 1, 1, 0, 0, 1))
+    fin = time.perf_counter() + duracion
+    inicio_total = time.perf_counter()
+    try:
+        while time.perf_counter() < fin:
+            conn.execute("""
+                UPDATE beneficiarios SET status='RECLAMADO', fecha_reclamo=?, fecha_expira=?
+                WHERE id IN (SELECT id FROM beneficiarios ORDER BY random() LIMIT ?)
+            """, (reclamo, expira, VENCER_POR_LLAMADA))
+            conn.commit()
+            inicio = time.perf_counter()
+            database.limpiar_expirados(conn)
+            latencias.append(time.perf_counter() - inicio)
+    finally:
+        conn.close()
+    datos = resumen(latencias, 0, time.perf_counter() - inicio_total)
+    # Aquí el ritmo lo marca la preparación; lo útil es la latencia por llamada
+    datos["por_segundo"] = None
+    datos["filas_por_llamada"] = VENCER_POR_LLAMADA
+    return datos
+
+# ---------------- COMPARACIÓN ----------------
+# Parámetros que cambian lo que se mide: con otros valores la base no sirve
+PARAMETROS_COMPARABLES = ("vencidos", "escaneres", "modos", "servidor", "procesos", "compacto")
+
+def parametros_distintos(actual, base):
+    """Parámetros de PARAMETROS_COMPARABLES que difieren de la base (texto por cada uno).
+
+    Una base de antes de que existiera un parámetro se compara con su valor por defecto.
+    """
+    por_defecto = vars(argumentos([]))
+    distintos = []
+    for nombre in PARAMETROS_COMPARABLES:
+        valor = actual["parametros"].get(nombre, por_defecto[nombre])
+        previo = base.get("parametros", {}).get(nombre, por_defecto[nombre])
+        if valor != previo:
+            distintos.append(f"{nombre}: base {previo}, actual {valor}")
+    return distintos
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones (p95 más alto o rendimiento más bajo que la base)."""
+    regresiones = []
+    anteriores = {(c["filas"], c["reclamados"]): c for c in base.get("combinaciones", [])}
+    for combinacion in actual["combinaciones"]:
+        anterior = anteriores.get((combinacion["filas"], combinacion["reclamados"]))
+        if anterior is None:
+            continue
+        for nombre, datos in combinacion["resultados"].items():
+            previo = anterior["resultados"].get(nombre)
+            if not previo:
+                continue
+            clave = f"{combinacion['filas']} filas, {combinacion['reclamados']:.0%} reclamados, {nombre}"
+            if previo.get("p95_ms") and datos.get("p95_ms") and datos["p95_ms"] > previo["p95_ms"] * (1 + tolerancia):
+                regresiones.append(f"{clave}: p95 {previo['p95_ms']} -> {datos['p95_ms']} ms")
+            if previo.get("por_segundo") and datos.get("por_segundo") is not None \
+                    and datos["por_segundo"] < previo["por_segundo"] * (1 - tolerancia):
+                regresiones.append(f"{clave}: {previo['por_segundo']} -> {datos['por_segundo']} pet/s")
+    return regresiones
+
+# ---------------- CLI ----------------
+def lista(tipo):
+    return lambda texto: [tipo(x) for x in texto.split(",") if x]
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de verificación, registro y expiración")
+    parser.add_argument("--filas", type=lista(int), default=[1000, 100000], help="tamaños, separados por coma")
+    parser.add_argument("--reclamados", type=lista(float), default=[0.0, 0.5], help="fracciones reclamadas")
+    parser.add_argument("--vencidos", type=float, default=0.0, help="fracción de reclamos sembrados ya vencidos")
+    parser.add_argument("--escaneres", type=int, default=8, help="clientes concurrentes")
+    parser.add_argument("--duracion", type=float, default=5.0, help="segundos por escenario")
+    parser.add_argument("--modos", type=lista(str), default=["proceso", "http"])
+    parser.add_argument("--escenarios", type=lista(str), default=list(ESCENARIOS))
+    parser.add_argument("--servidor", choices=("werkzeug", "gunicorn", "uvicorn"), default="werkzeug")
+    parser.add_argument("--procesos", type=int, default=1, help="workers de gunicorn/uvicorn")
+    parser.add_argument("--compacto", action="store_true", help="sembrar con el formato compacto (compactar.py)")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--base", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    parser.add_argument("--combinacion", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = argumentos(argv)
+    if args.combinacion:
+        # Proceso hijo: una sola combinación, resultado en stdout
+        args.filas, args.reclamados = args.filas[0], args.reclamados[0]
+        json.dump(combinacion(args), sys.stdout)
+        return 0
+
+    combinaciones = []
+    for filas, reclamados in itertools.product(args.filas, args.reclamados):
+        print(f"== {filas} filas, {reclamados:.0%} reclamados", file=sys.stderr)
+        directorio = tempfile.mkdtemp(prefix="bench_beneficiarios_")
+        hijo = [sys.executable, os.path.abspath(__file__), "--combinacion",
+                "--filas", str(filas), "--reclamados", str(reclamados), "--vencidos", str(args.vencidos),
+                "--escaneres", str(args.escaneres), "--duracion", str(args.duracion),
+                "--modos", ",".join(args.modos), "--escenarios", ",".join(args.escenarios),
+                "--servidor", args.servidor, "--procesos", str(args.procesos)]
+        if args.compacto:
+            hijo.append("--compacto")
+        try:
+            salida = subprocess.run(hijo, cwd=directorio, check=True, stdout=subprocess.PIPE,
+                                    env=dict(os.environ, PYTHONPATH=RAIZ)).stdout
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+        resultado = json.loads(salida)
+        combinaciones.append(resultado)
+        for nombre, datos in resultado["resultados"].items():
+            print(f"   {nombre:28} {datos['peticiones']:7d} pet  {datos['por_segundo'] or '-':>8} pet/s  "
+                  f"p50 {datos['p50_ms']} ms  p95 {datos['p95_ms']} ms  p99 {datos['p99_ms']} ms  "
+                  f"cpu {datos.get('cpu_us') or '-'} µs  errores {datos['errores']}", file=sys.stderr)
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "base", "combinacion")},
+        "combinaciones": combinaciones,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2)
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        distintos = parametros_distintos(informe, base)
+        if distintos:
+            for diferencia in distintos:
+                print(f"BASE NO COMPARABLE {diferencia}", file=sys.stderr)
+            return 2
+        regresiones = comparar(informe, base, args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}", file=sys.stderr)
+        if regresiones:
+            return 1
+        print(f"Sin regresiones frente a {args.base} (tolerancia {args.tolerancia:.0%})", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
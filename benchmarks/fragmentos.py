@@ -0,0 +1,127 @@
+# benchmarks/fragmentos.py (reclamos por segundo según el número de fragmentos)
+#
+# Uso:
+#   python benchmarks/fragmentos.py --fragmentos 1,2,4,8 --procesos 4 --filas 100000 \
+#       [--durable] [--salida fragmentos.json]
+#
+# Para cada número de fragmentos siembra una base en un directorio temporal y
+# lanza `procesos` procesos (como workers de gunicorn) que reclaman códigos al
+# azar con almacen.reclamar durante `duracion` segundos. La renovación es de
+# 0 s, así todo reclamo escribe: lo que se mide es cuánto se esperan los
+# escritores por el candado de cada archivo. Con --durable los commits usan
+# synchronous=FULL (un fsync por reclamo), que es donde más pesa el candado.
+import argparse, json, os, platform, random, shutil, sqlite3, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.carga import lista, resumen
+
+# Margen para que todos los procesos terminen de importar antes de empezar
+ARRANQUE = 3.0
+
+# ---------------- TRABAJADOR (PROCESO HIJO) ----------------
+def trabajador(args):
+    """Reclama durante args.duracion desde args.inicio; devuelve latencias y errores."""
+    import database
+    if args.durable:
+        database.PRAGMAS = database.PRAGMAS + ("PRAGMA synchronous=FULL",)
+    from almacen import almacen
+    codigos = []
+    for ruta in database.rutas_fragmentos():
+        conn = sqlite3.connect(ruta)
+        codigos.extend(row[0] for row in conn.execute(f"SELECT {database.CODIGO_TEXTO} FROM beneficiarios"))
+        conn.close()
+    azar = random.Random(args.semilla)
+    sin_renovacion = timedelta(0)
+    latencias, errores = [], 0
+    time.sleep(max(0.0, args.inicio - time.time()))
+    fin = time.perf_counter() + args.duracion
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            estado, _ = almacen.reclamar(azar.choice(codigos), sin_renovacion)
+            errores += estado != "puede reclamar"
+        except sqlite3.OperationalError:
+            # database is locked: el escritor esperó más que busy_timeout
+            errores += 1
+        latencias.append(time.perf_counter() - inicio)
+    return {"latencias": latencias, "errores": errores}
+
+# ---------------- MEDICIÓN ----------------
+def medir(fragmentos, args):
+    """Siembra `fragmentos` archivos y corre los procesos; devuelve el resumen combinado."""
+    from benchmarks.sembrar import sembrar
+    directorio = tempfile.mkdtemp(prefix="bench_fragmentos_")
+    try:
+        sembrar(os.path.join(directorio, "beneficiarios.db"), args.filas, fragmentos=fragmentos)
+        entorno = dict(os.environ, PYTHONPATH=RAIZ, DB_FRAGMENTOS=str(fragmentos))
+        inicio = time.time() + ARRANQUE
+        hijos = []
+        for numero in range(args.procesos):
+            comando = [sys.executable, os.path.abspath(__file__), "--trabajador",
+                       "--inicio", str(inicio), "--duracion", str(args.duracion), "--semilla", str(numero)]
+            if args.durable:
+                comando.append("--durable")
+            hijos.append(subprocess.Popen(comando, cwd=directorio, env=entorno, stdout=subprocess.PIPE))
+        latencias, errores = [], 0
+        for hijo in hijos:
+            salida, _ = hijo.communicate()
+            if hijo.returncode:
+                raise RuntimeError(f"Un proceso de reclamos terminó con código {hijo.returncode}")
+            datos = json.loads(salida)
+            latencias.extend(datos["latencias"])
+            errores += datos["errores"]
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+    datos = resumen(latencias, errores, args.duracion)
+    datos["fragmentos"] = fragmentos
+    return datos
+
+# ---------------- CLI ----------------
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Rendimiento de reclamos según el número de fragmentos")
+    parser.add_argument("--fragmentos", type=lista(int), default=[1, 2, 4, 8], help="valores de DB_FRAGMENTOS")
+    parser.add_argument("--procesos", type=int, default=4, help="procesos que reclaman a la vez")
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--duracion", type=float, default=5.0, help="segundos por medición")
+    parser.add_argument("--durable", action="store_true", help="synchronous=FULL (un fsync por commit)")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--trabajador", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--inicio", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--semilla", type=int, default=0, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = argumentos(argv)
+    if args.trabajador:
+        json.dump(trabajador(args), sys.stdout)
+        return 0
+
+    mediciones = []
+    for fragmentos in args.fragmentos:
+        datos = medir(fragmentos, args)
+        mediciones.append(datos)
+        print(f"{fragmentos:3d} fragmentos  {datos['peticiones']:7d} reclamos  {datos['por_segundo']:>8} rec/s  "
+              f"p50 {datos['p50_ms']} ms  p95 {datos['p95_ms']} ms  p99 {datos['p99_ms']} ms  "
+              f"errores {datos['errores']}", file=sys.stderr)
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": {k: v for k, v in vars(args).items() if k in ("procesos", "filas", "duracion", "durable")},
+        "mediciones": mediciones,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
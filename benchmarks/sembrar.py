@@ -0,0 +1,99 @@
+# benchmarks/sembrar.py (base de datos sintética para las pruebas de rendimiento)
+#
+# Uso:  python benchmarks/sembrar.py /tmp/bench/beneficiarios.db --filas 100000 --reclamados 0.3 [--fragmentos 4]
+import argparse, os, random, sqlite3, sys, time, uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import compactar
+import database
+import migraciones
+from indice_codigos import huella
+
+TAMANO_LOTE = 10000
+
+def _crear(ruta):
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    database.crear_beneficiarios(conn.cursor())
+    return conn
+
+def sembrar(ruta, filas, reclamados=0.0, vencidos=0.0, semilla=1, compacto=False, fragmentos=1):
+    """Crea `ruta` con `filas` beneficiarios; devuelve los segundos que tardó.
+
+    `reclamados` es la fracción en RECLAMADO (vigentes por un día) y
+    `vencidos` la fracción de esos reclamos que ya expiró. El esquema
+    secundario (índices, FTS, triggers) lo crea migraciones.py después de
+    insertar, que es mucho más rápido que mantenerlo fila por fila. Con
+    `compacto` la base termina convertida con compactar.py. Con
+    `fragmentos` > 1 se crean los archivos de database.rutas_fragmentos
+    (beneficiarios.0.db...) repartidos como en almacen.py: huella del
+    código e ids con paso n.
+    """
+    inicio = time.perf_counter()
+    azar = random.Random(semilla)
+    ahora = datetime.now()
+    reclamo = database.fecha_iso(ahora - timedelta(minutes=5))
+    vigente = database.fecha_iso(ahora + timedelta(days=1))
+    vencido = database.fecha_iso(ahora - timedelta(minutes=1))
+
+    rutas = database.rutas_fragmentos(fragmentos, ruta)
+    conexiones = [_crear(ruta_fragmento) for ruta_fragmento in rutas]
+
+    def generar():
+        for i in range(filas):
+            uuid_bytes = azar.getrandbits(128).to_bytes(16, "little")
+            codigo = str(uuid.UUID(bytes=uuid_bytes, version=4))
+            if azar.random() < reclamados:
+                expira = vencido if azar.random() < vencidos else vigente
+                yield (f"BENEFICIARIO {i:07d}", f"BENCH{i:013d}", codigo, "RECLAMADO", reclamo, expira)
+            else:
+                yield (f"BENEFICIARIO {i:07d}", f"BENCH{i:013d}", codigo, "PENDIENTE", None, None)
+
+    filas_generadas = generar()
+    siguientes = list(range(1, len(rutas) + 1))
+    while True:
+        lote = [fila for _, fila in zip(range(TAMANO_LOTE), filas_generadas)]
+        if not lote:
+            break
+        por_fragmento = [[] for _ in rutas]
+        for fila in lote:
+            k = huella(fila[2]) % len(rutas)
+            por_fragmento[k].append((siguientes[k],) + fila)
+            siguientes[k] += len(rutas)
+        for conn, filas_fragmento in zip(conexiones, por_fragmento):
+            conn.executemany("""
+                INSERT INTO beneficiarios (id, nombre, curp, codigo_unico, status, fecha_reclamo, fecha_expira)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, filas_fragmento)
+    for ruta_fragmento, conn in zip(rutas, conexiones):
+        conn.commit()
+        conn.close()
+        # El resto del esquema (y user_version) como en una base real
+        migraciones.aplicar(ruta_fragmento)
+        conn = sqlite3.connect(ruta_fragmento)
+        conn.execute("ANALYZE")
+        conn.close()
+        if compacto:
+            compactar.migrar(ruta_fragmento, vacuum=True)
+    return time.perf_counter() - inicio
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Siembra una base de beneficiarios para benchmarks")
+    parser.add_argument("ruta")
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--reclamados", type=float, default=0.0, help="fracción en RECLAMADO (0-1)")
+    parser.add_argument("--vencidos", type=float, default=0.0, help="fracción de los reclamos ya vencida")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--compacto", action="store_true", help="convertir al formato compacto al terminar")
+    parser.add_argument("--fragmentos", type=int, default=1, help="archivos en los que repartir (DB_FRAGMENTOS)")
+    args = parser.parse_args(argv)
+    segundos = sembrar(args.ruta, args.filas, args.reclamados, args.vencidos, args.semilla, args.compacto,
+                       args.fragmentos)
+    print(f"{args.filas} filas en {segundos:.1f} s -> {args.ruta}")
+
+if __name__ == "__main__":
+    main()
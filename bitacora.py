@@ -0,0 +1,119 @@
+# bitacora.py (bitácora de reclamos con escritura diferida y commit agrupado)
+#
+# Cada verificación deja un evento en la tabla reclamos (de solo agregar).
+# El handler solo lo pone en una cola en memoria; un hilo por worker los
+# escribe juntos, así la auditoría no agrega un commit por escaneo.
+import atexit, os, threading, time
+from collections import deque
+from datetime import datetime
+import database
+import metricas
+
+# Un grupo se escribe cada INTERVALO segundos o en cuanto hay LOTE eventos
+INTERVALO = float(os.getenv("BITACORA_INTERVALO_MS", 200)) / 1000
+LOTE = int(os.getenv("BITACORA_LOTE", 500))
+# Si la base no acepta escrituras, eventos que se guardan antes de descartar los más viejos
+MAX_PENDIENTES = int(os.getenv("BITACORA_MAX_PENDIENTES", 100000))
+# Los códigos desconocidos vienen de la URL: se recortan
+LARGO_CODIGO = 64
+
+class Bitacora:
+    """Cola de eventos de reclamo que se vacía con commits agrupados.
+
+    Con WAL y synchronous=NORMAL los commits del hilo no esperan a disco;
+    cerrar() (registrado con atexit) escribe lo pendiente con
+    synchronous=FULL, que también deja en disco los grupos anteriores.
+    """
+
+    def __init__(self):
+        self._pendientes = deque()
+        self._cond = threading.Condition()
+        self._escritura = threading.Lock()
+        self._pid = None
+        self.stats = {"registrados": 0, "escritos": 0, "commits": 0, "descartados": 0,
+                      "errores": 0, "lote_maximo": 0}
+
+    # ---------------- CICLO DE VIDA ----------------
+    def _asegurar_hilo(self):
+        # Con el candado tomado. Tras un fork la cola heredada es del padre
+        # (él la escribe) y el hilo no existe en el hijo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pendientes.clear()
+            threading.Thread(target=self._ciclo, name="bitacora", daemon=True).start()
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                if len(self._pendientes) < LOTE:
+                    self._cond.wait(INTERVALO)
+            try:
+                self.vaciar()
+            except Exception:
+                # Base ocupada: los eventos siguen en la cola para el siguiente grupo
+                time.sleep(INTERVALO)
+
+    def cerrar(self):
+        """Escribe lo pendiente de este proceso y lo deja en disco (al salir)."""
+        if self._pid == os.getpid():
+            self.vaciar(durable=True)
+
+    # ---------------- OPERACIONES ----------------
+    def registrar(self, codigo, resultado, origen, id_beneficiario=None, momento=None):
+        """Encola un evento; no toca SQLite."""
+        evento = (database.fecha_iso(momento or datetime.now()), str(codigo)[:LARGO_CODIGO],
+                  id_beneficiario, resultado, origen)
+        with self._cond:
+            self._asegurar_hilo()
+            if len(self._pendientes) >= MAX_PENDIENTES:
+                self._pendientes.popleft()
+                self.stats["descartados"] += 1
+                metricas.bitacora_eventos.inc("descartado")
+            self._pendientes.append(evento)
+            self.stats["registrados"] += 1
+            if len(self._pendientes) >= LOTE:
+                self._cond.notify()
+
+    def vaciar(self, durable=False):
+        """Escribe ahora todo lo pendiente en una transacción; devuelve cuántos eventos."""
+        with self._escritura:
+            with self._cond:
+                lote = list(self._pendientes)
+                self._pendientes.clear()
+            if not lote:
+                return 0
+            inicio = time.perf_counter()
+            conn = database.get_conn()
+            try:
+                if durable:
+                    conn.execute("PRAGMA synchronous=FULL")
+                database.guardar_reclamos(conn, lote)
+            except Exception:
+                with self._cond:
+                    # Al frente de la cola y en orden, para el siguiente intento
+                    self._pendientes.extendleft(reversed(lote))
+                    while len(self._pendientes) > MAX_PENDIENTES:
+                        self._pendientes.popleft()
+                        self.stats["descartados"] += 1
+                        metricas.bitacora_eventos.inc("descartado")
+                    self.stats["errores"] += 1
+                raise
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                conn.close()
+            metricas.bitacora_commit.observar(time.perf_counter() - inicio)
+            metricas.bitacora_eventos.inc("escrito", cantidad=len(lote))
+            self.stats["escritos"] += len(lote)
+            self.stats["commits"] += 1
+            self.stats["lote_maximo"] = max(self.stats["lote_maximo"], len(lote))
+            return len(lote)
+
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def estadisticas(self):
+        return dict(self.stats, pendientes=self.pendientes(), intervalo_ms=INTERVALO * 1000, lote=LOTE)
+
+bitacora = Bitacora()
+atexit.register(bitacora.cerrar)
@@ -0,0 +1,202 @@
+# compactar.py (migración en línea de beneficiarios al formato compacto)
+#
+# Uso:  python compactar.py --db beneficiarios.db --lote 5000 [--vacuum]
+#
+# codigo_unico pasa de texto (36 bytes) a BLOB de 16 bytes y fecha_reclamo /
+# fecha_expira de ISO a enteros (ms desde epoch). SQLite no cambia el tipo de
+# una columna, así que se copia a una tabla nueva en lotes cortos mientras
+# el servidor sigue atendiendo; lo que cambie durante la copia se vuelve a
+# copiar leyendo la tabla cambios, y solo el intercambio final de tablas
+# detiene las escrituras. Con DB_FRAGMENTOS se ejecuta una vez por archivo
+# (--db beneficiarios.0.db, --db beneficiarios.1.db...).
+import argparse, json, sqlite3, sys, time, uuid
+from datetime import datetime
+import database
+import migraciones
+
+TAMANO_LOTE = 5000
+# Ids por sentencia al reaplicar cambios (límite de parámetros de SQLite)
+LOTE_CAMBIOS = 500
+TABLA_NUEVA = "beneficiarios_compacta"
+
+_COPIAR = f"""
+    INSERT OR REPLACE INTO {TABLA_NUEVA} (id, nombre, curp, codigo_unico, status, fecha_reclamo, fecha_expira)
+    SELECT id, nombre, curp, uuid_bytes(codigo_unico), status, fecha_ms(fecha_reclamo), fecha_ms(fecha_expira)
+    FROM beneficiarios
+"""
+
+# ---------------- CONVERSIONES ----------------
+def _uuid_bytes(codigo):
+    return uuid.UUID(codigo).bytes
+
+def _fecha_ms(valor):
+    return None if valor is None else database.epoch_ms(datetime.fromisoformat(valor))
+
+def _es_uuid(codigo):
+    try:
+        return str(uuid.UUID(codigo)) == codigo
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+def conectar(ruta):
+    """Conexión en autocommit: cada lote abre y cierra su propia transacción."""
+    conn = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.create_function("uuid_bytes", 1, _uuid_bytes, deterministic=True)
+    conn.create_function("fecha_ms", 1, _fecha_ms, deterministic=True)
+    conn.create_function("es_uuid", 1, _es_uuid, deterministic=True)
+    return conn
+
+# ---------------- TAMAÑOS ----------------
+def tamanos(conn):
+    """Bytes ocupados por la tabla, sus índices y la base completa (sin páginas libres)."""
+    paginas, libres, tamano = (conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                               for pragma in ("page_count", "freelist_count", "page_size"))
+    resultado = {"base": (paginas - libres) * tamano}
+    try:
+        por_objeto = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    except sqlite3.OperationalError:
+        # SQLite sin dbstat: solo el total
+        return resultado
+    indices = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='beneficiarios'").fetchall()
+    resultado["tabla"] = por_objeto.get("beneficiarios", 0)
+    resultado["indices"] = {nombre: por_objeto.get(nombre, 0) for (nombre,) in indices}
+    return resultado
+
+# ---------------- MIGRACIÓN ----------------
+def _transaccion(conn, funcion, *args):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        resultado = funcion(conn, *args)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return resultado
+
+def _copiar_lote(conn, ultimo_id, lote):
+    hasta = conn.execute("""
+        SELECT MAX(id) FROM (SELECT id FROM beneficiarios WHERE id > ? ORDER BY id LIMIT ?)
+    """, (ultimo_id, lote)).fetchone()[0]
+    if hasta is not None:
+        conn.execute(_COPIAR + " WHERE id > ? AND id <= ?", (ultimo_id, hasta))
+    return hasta
+
+def _aplicar_cambios(conn, version):
+    """Vuelve a copiar (o borra) los beneficiarios que cambiaron después de `version`."""
+    filas = conn.execute("""
+        SELECT version, id_beneficiario FROM cambios WHERE version > ? ORDER BY version LIMIT ?
+    """, (version, LOTE_CAMBIOS)).fetchall()
+    if not filas:
+        return version, 0
+    ids = [id_ for _, id_ in filas]
+    marcas = ",".join("?" * len(ids))
+    conn.execute(f"DELETE FROM {TABLA_NUEVA} WHERE id IN ({marcas})", ids)
+    conn.execute(_COPIAR + f" WHERE id IN ({marcas})", ids)
+    return filas[-1][0], len(filas)
+
+def _intercambiar(conn, version):
+    # Con el candado de escritura tomado: lo último pendiente y el cambio de tabla
+    while True:
+        version, aplicados = _aplicar_cambios(conn, version)
+        if aplicados < LOTE_CAMBIOS:
+            break
+    fila = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='beneficiarios'").fetchone()
+    conn.execute("DROP TABLE beneficiarios")
+    conn.execute(f"ALTER TABLE {TABLA_NUEVA} RENAME TO beneficiarios")
+    if fila:
+        # AUTOINCREMENT: no reutilizar ids de beneficiarios ya borrados
+        cursor = conn.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name='beneficiarios'", fila)
+        if cursor.rowcount == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('beneficiarios', ?)", fila)
+    # Índices, FTS y triggers de cambios sobre la tabla nueva
+    database.asegurar_esquema(conn.cursor())
+
+def migrar(ruta, lote=TAMANO_LOTE, vacuum=False, salida=None):
+    """Convierte `ruta` al formato compacto; devuelve un resumen con los tamaños.
+
+    Se puede ejecutar con el servidor en marcha. Si la base ya es compacta
+    no hace nada.
+    """
+    conn = conectar(ruta)
+    try:
+        migraciones.aplicar(ruta)
+        if database.formato(conn).compacto:
+            return {"ya_compacta": True, "despues": tamanos(conn)}
+        invalidos = conn.execute(
+            "SELECT id, codigo_unico FROM beneficiarios WHERE NOT es_uuid(codigo_unico) LIMIT 5").fetchall()
+        if invalidos:
+            raise ValueError(f"Códigos que no son UUID (id, código): {invalidos}")
+
+        inicio = time.perf_counter()
+        antes = tamanos(conn)
+        conn.execute(f"DROP TABLE IF EXISTS {TABLA_NUEVA}")
+        conn.execute(f"""
+            CREATE TABLE {TABLA_NUEVA} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nombre TEXT NOT NULL,
+                curp TEXT UNIQUE NOT NULL,
+                codigo_unico BLOB UNIQUE NOT NULL,
+                status TEXT DEFAULT 'PENDIENTE',
+                fecha_reclamo INTEGER,
+                fecha_expira INTEGER
+            )
+        """)
+        # Lo que cambie desde aquí queda en cambios con una versión mayor
+        version = database.version_cambios(conn)
+
+        ultimo_id, copiadas = 0, 0
+        while True:
+            hasta = _transaccion(conn, _copiar_lote, ultimo_id, lote)
+            if hasta is None:
+                break
+            copiadas += conn.execute(f"SELECT COUNT(*) FROM {TABLA_NUEVA} WHERE id > ? AND id <= ?",
+                                     (ultimo_id, hasta)).fetchone()[0]
+            ultimo_id = hasta
+            if salida:
+                salida(f"{copiadas} filas copiadas")
+
+        reaplicados = 0
+        while True:
+            version, aplicados = _transaccion(conn, _aplicar_cambios, version)
+            reaplicados += aplicados
+            if aplicados < LOTE_CAMBIOS:
+                break
+
+        inicio_bloqueo = time.perf_counter()
+        _transaccion(conn, _intercambiar, version)
+        bloqueo = time.perf_counter() - inicio_bloqueo
+        if vacuum:
+            # No es en línea: reescribe la base completa con el candado tomado
+            conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+        return {
+            "filas": copiadas,
+            "reaplicadas": reaplicados,
+            "segundos": round(time.perf_counter() - inicio, 2),
+            "bloqueo_final_segundos": round(bloqueo, 3),
+            "antes": antes,
+            "despues": tamanos(conn),
+        }
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convierte beneficiarios al formato compacto (BLOB + enteros)")
+    parser.add_argument("--db", default=database.DB_NAME)
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="filas copiadas por transacción")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="devolver al sistema el espacio liberado (bloquea la base mientras dura)")
+    args = parser.parse_args(argv)
+
+    def progreso(mensaje):
+        print(f"\r{mensaje}", end="", file=sys.stderr)
+
+    resumen = migrar(args.db, args.lote, args.vacuum, progreso)
+    print(file=sys.stderr)
+    print(json.dumps(resumen, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# configuracion.py (configuración compartida entre workers, guardada en la base)
+import os, threading, time
+from datetime import timedelta
+import database
+
+# Cada worker revisa el contador de versión como mucho cada este intervalo
+INTERVALO_VERIFICACION = float(os.getenv("CONFIG_INTERVALO_MS", 500)) / 1000
+CLAVE_TIEMPO = "tiempo_renovacion_segundos"
+# Valor por defecto: 10 segundos (para pruebas)
+TIEMPO_POR_DEFECTO = 10
+
+class Configuracion:
+    """Lectura en caché de la tabla configuracion.
+
+    Cada escritura incrementa la clave 'version'. Los lectores solo
+    consultan ese contador (una búsqueda por clave primaria) cuando pasó
+    INTERVALO_VERIFICACION desde la última vez, y recargan todo si cambió.
+    Así todos los workers coinciden en el valor con un retraso acotado sin
+    agregar consultas al camino de verificación.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._version = None
+        self._verificado = 0.0
+
+    def _refrescar(self):
+        if time.monotonic() - self._verificado < INTERVALO_VERIFICACION:
+            return
+        with self._lock:
+            if time.monotonic() - self._verificado < INTERVALO_VERIFICACION:
+                return
+            conn = database.get_conn()
+            try:
+                version = database.version_configuracion(conn)
+                if version != self._version:
+                    self._valores = database.leer_configuracion(conn)
+                    self._version = version
+            finally:
+                conn.close()
+            self._verificado = time.monotonic()
+
+    def obtener(self, clave, defecto=None):
+        self._refrescar()
+        return self._valores.get(clave, defecto)
+
+    def guardar(self, **valores):
+        conn = database.get_conn()
+        try:
+            database.guardar_configuracion(conn, valores)
+        finally:
+            conn.close()
+        # Este worker ve el cambio de inmediato
+        self._verificado = 0.0
+
+    def tiempo_renovacion(self):
+        return timedelta(seconds=float(self.obtener(CLAVE_TIEMPO, TIEMPO_POR_DEFECTO)))
+
+def segundos_renovacion(data):
+    """Segundos pedidos en {"segundos": n} o {"horas": n} (JSON o formulario).
+
+    Devuelve None si no hay un número positivo.
+    """
+    for clave, factor in (("segundos", 1), ("horas", 3600)):
+        valor = data.get(clave)
+        if valor in (None, ""):
+            continue
+        try:
+            segundos = float(valor) * factor
+        except (TypeError, ValueError):
+            return None
+        return segundos if segundos > 0 else None
+    return None
+
+configuracion = Configuracion()
@@ -1,22 +1,831 @@
-import sqlite3
-
-def init_db():
-    conn = sqlite3.connect("beneficiarios.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS beneficiarios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL,
-        curp TEXT UNIQUE NOT NULL,
-        codigo_unico TEXT UNIQUE NOT NULL,
-        status TEXT DEFAULT 'no reclamado',
-        fecha_reclamo TEXT,
-        fecha_expira TEXT
+import sqlite3, os, re, threading, time, uuid
+from datetime import datetime
+import metricas
+
+DB_NAME = "beneficiarios.db"
+
+# ---------------- FECHAS ----------------
+def fecha_iso(fecha):
+    """ISO de ancho fijo: las fechas se comparan como texto directamente en SQL."""
+    return fecha.isoformat(timespec="microseconds")
+
+def ahora_iso():
+    return fecha_iso(datetime.now())
+
+def epoch_ms(fecha):
+    """Milisegundos desde epoch: las fechas del formato compacto."""
+    return int(fecha.timestamp() * 1000)
+
+def a_fecha(valor):
+    """datetime de una fecha leída de beneficiarios, en cualquiera de los dos formatos."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return datetime.fromisoformat(valor)
+    return datetime.fromtimestamp(valor / 1000)
+
+# ---------------- POOL DE CONEXIONES ----------------
+# Cada proceso (worker de gunicorn) mantiene sus propias conexiones de larga
+# vida, configuradas una sola vez. Con WAL los lectores (panel admin) no
+# bloquean al escritor que registra los reclamos. Hay un pool por archivo
+# (la base principal y, con DB_FRAGMENTOS, cada fragmento).
+POOL_MAX = int(os.getenv("DB_POOL_MAX", 8))
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+)
+
+_pool_lock = threading.Lock()
+_pool_pid = None
+_ociosas = {}
+_stats = {"creadas": 0, "reutilizadas": 0, "descartadas": 0, "en_uso": 0}
+
+# Una escritura que tarda más que esto casi siempre esperó el candado de
+# escritura (busy_timeout); SQLite no avisa de la espera de otra forma.
+ESPERA_BLOQUEO = float(os.getenv("DB_ESPERA_BLOQUEO", 0.05))
+_operaciones = {}
+
+def _operacion(sql):
+    operacion = _operaciones.get(sql)
+    if operacion is None:
+        palabra = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        operacion = palabra if palabra in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTRA"
+        _operaciones[sql] = operacion
+    return operacion
+
+class ConexionPool(sqlite3.Connection):
+    """Conexión cuyo close() la devuelve al pool en lugar de cerrarla.
+
+    execute() y executemany() miden cada sentencia para /metrics.
+    """
+
+    def execute(self, sql, parametros=()):
+        return self._medir(sqlite3.Connection.execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self._medir(sqlite3.Connection.executemany, sql, parametros)
+
+    def _medir(self, ejecutar, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return ejecutar(self, sql, parametros)
+        except sqlite3.OperationalError as error:
+            if "locked" in str(error) or "busy" in str(error):
+                metricas.sqlite_bloqueos.inc()
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            operacion = _operacion(sql)
+            metricas.sqlite_sentencias.observar(segundos, operacion)
+            if segundos > ESPERA_BLOQUEO and operacion not in ("SELECT", "OTRA"):
+                metricas.sqlite_esperas.inc()
+
+    def close(self):
+        devolver_conexion(self)
+
+    def cerrar(self):
+        sqlite3.Connection.close(self)
+
+def _nueva_conexion(ruta):
+    conn = sqlite3.connect(
+        ruta, timeout=5, factory=ConexionPool,
+        check_same_thread=False, cached_statements=256,
     )
+    conn.ruta = ruta
+    conn.row_factory = sqlite3.Row
+    try:
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    except Exception:
+        conn.cerrar()
+        raise
+    return conn
+
+def get_conn(ruta=None):
+    """Toma una conexión del pool de `ruta` (por defecto DB_NAME) o abre una nueva."""
+    global _pool_pid
+    ruta = ruta or DB_NAME
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # Proceso nuevo tras un fork: las conexiones heredadas no se usan
+            _pool_pid = os.getpid()
+            _ociosas.clear()
+        ociosas = _ociosas.get(ruta)
+        if ociosas:
+            _stats["en_uso"] += 1
+            _stats["reutilizadas"] += 1
+            return ociosas.pop()
+    # Se cuenta solo si abrió: un error al abrir no deja el contador corrido
+    conn = _nueva_conexion(ruta)
+    with _pool_lock:
+        _stats["en_uso"] += 1
+        _stats["creadas"] += 1
+    return conn
+
+def devolver_conexion(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        _stats["en_uso"] -= 1
+        ociosas = _ociosas.setdefault(conn.ruta, [])
+        if len(ociosas) < POOL_MAX:
+            ociosas.append(conn)
+            return
+        _stats["descartadas"] += 1
+    conn.cerrar()
+
+def estadisticas_pool():
+    with _pool_lock:
+        return dict(_stats, ociosas=sum(map(len, _ociosas.values())), max=POOL_MAX,
+                    archivos=len(_ociosas), pid=os.getpid())
+
+# ---------------- FRAGMENTOS ----------------
+# Con DB_FRAGMENTOS > 1 los beneficiarios se reparten en varios archivos
+# (ver almacen.py); DB_NAME conserva configuración y bitácora.
+FRAGMENTOS = int(os.getenv("DB_FRAGMENTOS", 1))
+
+def rutas_fragmentos(fragmentos=None, ruta=None):
+    """Archivos con la tabla beneficiarios: DB_NAME o beneficiarios.0.db, beneficiarios.1.db..."""
+    fragmentos = FRAGMENTOS if fragmentos is None else fragmentos
+    ruta = ruta or DB_NAME
+    if fragmentos <= 1:
+        return [ruta]
+    base, extension = os.path.splitext(ruta)
+    return [f"{base}.{k}{extension}" for k in range(fragmentos)]
+
+# ---------------- FORMATO COMPACTO ----------------
+# Formato opcional de beneficiarios (ver compactar.py): codigo_unico como
+# BLOB de 16 bytes y fecha_reclamo/fecha_expira como enteros (ms desde
+# epoch). Fuera de este módulo los códigos siguen siendo el texto del UUID:
+# los parámetros se convierten con el Formato de la base, y las consultas
+# que devuelven el código usan CODIGO_TEXTO, que sirve para los dos.
+
+def _codigo_texto(columna):
+    h = f"lower(hex({columna}))"
+    return (f"CASE WHEN typeof({columna})='blob' THEN substr({h}, 1, 8)||'-'||substr({h}, 9, 4)||'-'||"
+            f"substr({h}, 13, 4)||'-'||substr({h}, 17, 4)||'-'||substr({h}, 21) ELSE {columna} END")
+
+CODIGO_TEXTO = _codigo_texto("codigo_unico") + " AS codigo_unico"
+
+class Formato:
+    """Convierte parámetros (código, datetime) al formato de la tabla."""
+
+    def __init__(self, compacto):
+        self.compacto = compacto
+
+    def codigo(self, codigo):
+        if not self.compacto:
+            return codigo
+        try:
+            binario = uuid.UUID(codigo)
+        except (TypeError, ValueError, AttributeError):
+            return None
+        # Solo la forma canónica, igual que al comparar el texto
+        return binario.bytes if str(binario) == codigo else None
+
+    def fecha(self, momento):
+        return epoch_ms(momento) if self.compacto else fecha_iso(momento)
+
+TEXTO, COMPACTO = Formato(False), Formato(True)
+
+def formato(conn):
+    """Formato de beneficiarios; se vuelve a detectar solo si cambió el esquema.
+
+    Quien escribe debe llamarla dentro de su transacción (ver _escribir):
+    así compactar.py no puede cambiar el formato antes del commit.
+    """
+    version = sqlite3.Connection.execute(conn, "PRAGMA schema_version").fetchone()[0]
+    previo = getattr(conn, "_formato", None)
+    if previo is not None and previo[0] == version:
+        return previo[1]
+    tipos = {fila[1]: fila[2] for fila in sqlite3.Connection.execute(conn, "PRAGMA table_info(beneficiarios)")}
+    actual = COMPACTO if tipos.get("codigo_unico", "").upper() == "BLOB" else TEXTO
+    if isinstance(conn, ConexionPool):
+        conn._formato = (version, actual)
+    return actual
+
+def _escribir(conn):
+    """Abre la transacción de escritura y devuelve el formato vigente en ella."""
+    conn.execute("BEGIN IMMEDIATE")
+    return formato(conn)
+
+# ---------------- ESQUEMA ----------------
+# Se aplica con migraciones.py (PRAGMA user_version), no al importar.
+def crear_beneficiarios(cursor, tabla="beneficiarios"):
+    """Tabla principal en el formato de texto (compactar.py define el compacto)."""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabla} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            curp TEXT UNIQUE NOT NULL,
+            codigo_unico TEXT UNIQUE NOT NULL,
+            status TEXT DEFAULT 'PENDIENTE',
+            fecha_reclamo TEXT,
+            fecha_expira TEXT
+        )
+    """)
+
+def crear_indices(cursor):
+    """Índices secundarios; el parcial solo contiene los RECLAMADO por fecha_expira."""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reclamados_expira
+        ON beneficiarios(fecha_expira) WHERE status='RECLAMADO'
+    """)
+    # Orden alfabético paginado en el panel sin ordenar toda la tabla
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_beneficiarios_nombre ON beneficiarios(nombre, id)")
+    crear_busqueda(cursor)
+
+def crear_busqueda(cursor):
+    """Índice FTS5 sobre nombre y curp, sincronizado por triggers.
+
+    Los triggers de UPDATE solo se disparan si cambian nombre o curp, así
+    que los reclamos (que cambian status y fechas) no pagan nada extra.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name='beneficiarios_fts'")
+    existia = cursor.fetchone() is not None
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS beneficiarios_fts USING fts5(
+                nombre, curp,
+                content='beneficiarios', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite compilado sin FTS5: buscar() usa LIKE por prefijo
+        return
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_ai AFTER INSERT ON beneficiarios BEGIN
+            INSERT INTO beneficiarios_fts(rowid, nombre, curp) VALUES (new.id, new.nombre, new.curp);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_ad AFTER DELETE ON beneficiarios BEGIN
+            INSERT INTO beneficiarios_fts(beneficiarios_fts, rowid, nombre, curp)
+            VALUES ('delete', old.id, old.nombre, old.curp);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_au AFTER UPDATE OF nombre, curp ON beneficiarios BEGIN
+            INSERT INTO beneficiarios_fts(beneficiarios_fts, rowid, nombre, curp)
+            VALUES ('delete', old.id, old.nombre, old.curp);
+            INSERT INTO beneficiarios_fts(rowid, nombre, curp) VALUES (new.id, new.nombre, new.curp);
+        END
+    """)
+    if not existia:
+        # Tabla con datos previos: indexar lo que ya existe
+        cursor.execute("INSERT INTO beneficiarios_fts(beneficiarios_fts) VALUES ('rebuild')")
+
+def crear_configuracion(cursor):
+    """Tabla clave/valor compartida por todos los workers; 'version' cuenta los cambios."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS configuracion (
+            clave TEXT PRIMARY KEY,
+            valor
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO configuracion (clave, valor) VALUES ('version', 0)")
+
+def crear_sincronizacion(cursor):
+    """Resultado de cada reclamo subido por un verificador sin conexión, por su id."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reclamos_sincronizados (
+            id TEXT PRIMARY KEY,
+            codigo_unico TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            nombre TEXT,
+            escaneado TEXT NOT NULL,
+            recibido TEXT NOT NULL
+        )
+    """)
+
+def crear_cambios(cursor):
+    """Registro de cambios: una fila por beneficiario con la versión de su último cambio.
+
+    Los triggers actualizan la fila del beneficiario con MAX(version)+1
+    (leído del índice único), así la versión crece de forma monótona y la
+    tabla no pasa del número de ids que han existido. Un DELETE deja la
+    fila marcada como borrada para que los clientes la quiten.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name='cambios'")
+    existia = cursor.fetchone() is not None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cambios (
+            id_beneficiario INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL UNIQUE,
+            borrado INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for evento, fila, borrado in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1)):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS beneficiarios_cambios_{evento.lower()}
+            AFTER {evento} ON beneficiarios BEGIN
+                INSERT INTO cambios (id_beneficiario, version, borrado)
+                VALUES ({fila}.id, (SELECT IFNULL(MAX(version), 0) + 1 FROM cambios), {borrado})
+                ON CONFLICT(id_beneficiario) DO UPDATE SET version=excluded.version, borrado=excluded.borrado;
+            END
+        """)
+    if not existia:
+        cursor.execute("INSERT INTO cambios (id_beneficiario, version) SELECT id, id FROM beneficiarios")
+
+def crear_bitacora(cursor):
+    """Bitácora de solo agregar: una fila por verificación, nunca se modifica.
+
+    La llenan los workers por lotes (bitacora.py); los triggers rechazan
+    cualquier UPDATE o DELETE para que sirva en una auditoría.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reclamos (
+            id INTEGER PRIMARY KEY,
+            momento TEXT NOT NULL,
+            codigo_unico TEXT NOT NULL,
+            id_beneficiario INTEGER,
+            resultado TEXT NOT NULL,
+            origen TEXT NOT NULL
+        )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reclamos_codigo ON reclamos(codigo_unico, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reclamos_beneficiario ON reclamos(id_beneficiario, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reclamos_momento ON reclamos(momento)")
+    for evento in ("UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS reclamos_sin_{evento.lower()} BEFORE {evento} ON reclamos BEGIN
+                SELECT RAISE(ABORT, 'la bitácora de reclamos es de solo agregar');
+            END
+        """)
+
+def asegurar_esquema(cursor):
+    """Todo lo que se agrega sobre la tabla beneficiarios."""
+    crear_indices(cursor)
+    crear_configuracion(cursor)
+    crear_sincronizacion(cursor)
+    crear_cambios(cursor)
+    crear_bitacora(cursor)
+
+def init_db(ruta=None):
+    """Crea o actualiza el esquema de `ruta` (ver migraciones.py)."""
+    # migraciones importa este módulo: se importa aquí
+    import migraciones
+    migraciones.aplicar(ruta or DB_NAME)
+
+# ---------------- EXPIRACIÓN ----------------
+def limpiar_expirados(conn):
+    """Resetea a PENDIENTE los RECLAMADO vencidos con un solo UPDATE.
+
+    Recorre el índice parcial solo hasta la fecha actual, así que el costo
+    depende de cuántas filas vencieron y no del tamaño de la tabla.
+    """
+    ahora = _escribir(conn).fecha(datetime.now())
+    cursor = conn.execute("""
+        UPDATE beneficiarios
+        SET status='PENDIENTE', fecha_reclamo=NULL, fecha_expira=NULL
+        WHERE status='RECLAMADO' AND fecha_expira < ?
+    """, (ahora,))
     conn.commit()
-    conn.close()
+    _contar_expirados(cursor.rowcount)
+    return cursor.rowcount
+
+def _contar_expirados(reseteados):
+    # El índice parcial solo recorre las filas vencidas: examinadas = reseteadas
+    metricas.expiracion_examinadas.inc(cantidad=reseteados)
+    metricas.expiracion_reseteadas.inc(cantidad=reseteados)
+
+def resetear_lote_expirados(conn, limite):
+    """Como limpiar_expirados pero acotado a `limite` filas por transacción."""
+    ahora = _escribir(conn).fecha(datetime.now())
+    cursor = conn.execute("""
+        UPDATE beneficiarios
+        SET status='PENDIENTE', fecha_reclamo=NULL, fecha_expira=NULL
+        WHERE id IN (
+            SELECT id FROM beneficiarios
+            WHERE status='RECLAMADO' AND fecha_expira < ?
+            LIMIT ?
+        )
+    """, (ahora, limite))
+    conn.commit()
+    _contar_expirados(cursor.rowcount)
+    return cursor.rowcount
+
+def proximas_expiraciones(conn, limite):
+    """Las siguientes fecha_expira en orden ascendente, leídas del índice parcial.
+
+    Vienen tal como están guardadas (texto ISO o ms); a_fecha() las convierte.
+    """
+    cursor = conn.execute("""
+        SELECT fecha_expira FROM beneficiarios
+        WHERE status='RECLAMADO' AND fecha_expira IS NOT NULL
+        ORDER BY fecha_expira LIMIT ?
+    """, (limite,))
+    proximas = [row[0] for row in cursor.fetchall()]
+    metricas.expiracion_examinadas.inc(cantidad=len(proximas))
+    return proximas
+
+# ---------------- RECLAMO ----------------
+# `clave` es el código ya convertido con formato_bd.codigo()
+def _intentar_reclamo(conn, formato_bd, clave, momento, duracion):
+    desde = formato_bd.fecha(momento)
+    cursor = conn.execute("""
+        UPDATE beneficiarios
+        SET status='RECLAMADO', fecha_reclamo=?, fecha_expira=?
+        WHERE codigo_unico=? AND (status<>'RECLAMADO' OR fecha_expira < ?)
+        RETURNING id, nombre, curp, status, fecha_reclamo, fecha_expira
+    """, (desde, formato_bd.fecha(momento + duracion), clave, desde))
+    filas = cursor.fetchall()
+    return filas[0] if filas else None
+
+def _consultar_codigo(conn, clave):
+    return conn.execute("""
+        SELECT id, nombre, curp, status, fecha_reclamo, fecha_expira
+        FROM beneficiarios WHERE codigo_unico=?
+    """, (clave,)).fetchone()
+
+def existe_codigo(conn, codigo):
+    return _consultar_codigo(conn, formato(conn).codigo(codigo)) is not None
+
+def reclamar(conn, codigo, duracion):
+    """Reclama un código con un único UPDATE condicional.
+
+    La decisión y el commit ocurren en la misma sentencia, así que dos
+    escáneres simultáneos no pueden reclamar el mismo QR. Devuelve
+    (estado, fila) con estado en "puede reclamar", "ya reclamado" o
+    "no existe". Las fechas de la fila vienen en el formato de la base.
+    """
+    try:
+        formato_bd = _escribir(conn)
+        clave = formato_bd.codigo(codigo)
+        fila = _intentar_reclamo(conn, formato_bd, clave, datetime.now(), duracion)
+        if fila:
+            estado = "puede reclamar"
+        else:
+            # Solo si no se pudo reclamar: distinguir entre reclamado e inexistente
+            fila = _consultar_codigo(conn, clave)
+            estado = "ya reclamado" if fila else "no existe"
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    metricas.reclamos.inc(estado, "base")
+    return estado, fila
+
+def reclamar_lote(conn, escaneos, duracion):
+    """Reclama una lista de (codigo, momento) en una sola transacción.
+
+    Los escaneos se aplican en orden cronológico para que un código repetido
+    en el lote se resuelva igual que si hubiera llegado en línea. Devuelve
+    los (estado, fila) en el mismo orden de entrada.
+    """
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        resultados = _resolver_escaneos(conn, escaneos, duracion)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return resultados
+
+def _resolver_escaneos(conn, escaneos, duracion):
+    # Sin commit: lo hace quien llama (con la transacción ya abierta),
+    # junto con lo que deba guardar
+    formato_bd = formato(conn)
+    resultados = [None] * len(escaneos)
+    orden = sorted(range(len(escaneos)), key=lambda i: escaneos[i][1])
+    for i in orden:
+        codigo, momento = escaneos[i]
+        clave = formato_bd.codigo(codigo)
+        fila = _intentar_reclamo(conn, formato_bd, clave, momento, duracion)
+        if fila:
+            resultados[i] = ("puede reclamar", fila)
+            continue
+        fila = _consultar_codigo(conn, clave)
+        resultados[i] = ("ya reclamado", fila) if fila else ("no existe", None)
+    for estado, _ in resultados:
+        metricas.reclamos.inc(estado, "base")
+    return resultados
+
+# ---------------- SINCRONIZACIÓN SIN CONEXIÓN ----------------
+def instantanea_verificacion(conn):
+    """Filas (codigo_unico, fecha_expira) de todos los beneficiarios.
+
+    fecha_expira solo viene para los RECLAMADO (en el formato de la base);
+    se recorre en bloques para no cargar la tabla completa en memoria.
+    """
+    cursor = conn.execute(f"""
+        SELECT {CODIGO_TEXTO}, CASE WHEN status='RECLAMADO' THEN fecha_expira END
+        FROM beneficiarios
+    """)
+    while True:
+        filas = cursor.fetchmany(5000)
+        if not filas:
+            break
+        yield from filas
+
+def sincronizar_reclamos(conn, reclamos, duracion):
+    """Aplica reclamos (id, codigo, momento) hechos sin conexión, una sola vez cada uno.
+
+    Un id ya subido devuelve el resultado guardado sin volver a reclamar,
+    así el cliente puede reintentar el lote completo tras un corte. Los
+    nuevos se resuelven como en reclamar_lote (orden cronológico; si el
+    código ya estaba reclamado en el servidor, gana el reclamo anterior).
+    Devuelve (estado, nombre, repetido, fila) por cada reclamo; `fila` es
+    la del beneficiario (para la bitácora) y None en los repetidos.
+    """
+    try:
+        # Toma el candado de escritura antes de leer: dos workers con el
+        # mismo lote no pueden aplicar dos veces el mismo id
+        conn.execute("BEGIN IMMEDIATE")
+        previos = {}
+        ids = list({id_ for id_, _, _ in reclamos})
+        for i in range(0, len(ids), _MAX_PARAMS):
+            parte = ids[i:i + _MAX_PARAMS]
+            marcas = ",".join("?" * len(parte))
+            for row in conn.execute(
+                    f"SELECT id, estado, nombre FROM reclamos_sincronizados WHERE id IN ({marcas})", parte):
+                previos[row[0]] = (row[1], row[2])
+
+        nuevos = {}
+        for id_, codigo, momento in reclamos:
+            if id_ not in previos and id_ not in nuevos:
+                nuevos[id_] = (codigo, momento)
+        escaneos = list(nuevos.values())
+        aplicados = {}
+        recibido = ahora_iso()
+        for id_, (codigo, momento), (estado, fila) in zip(
+                nuevos, escaneos, _resolver_escaneos(conn, escaneos, duracion)):
+            aplicados[id_] = (estado, fila["nombre"] if fila else None, fila)
+        conn.executemany("""
+            INSERT INTO reclamos_sincronizados (id, codigo_unico, estado, nombre, escaneado, recibido)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(id_, codigo, *aplicados[id_][:2], fecha_iso(momento), recibido)
+              for id_, (codigo, momento) in nuevos.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    resultados = []
+    for id_, _, _ in reclamos:
+        if id_ in aplicados:
+            # Un id repetido dentro del mismo lote cuenta como reintento
+            estado, nombre, fila = aplicados.pop(id_)
+            resultados.append((estado, nombre, False, fila))
+            previos[id_] = (estado, nombre)
+        else:
+            resultados.append((*previos[id_], True, None))
+    return resultados
+
+# ---------------- CAMBIOS ----------------
+CAMBIOS_MAX = 1000
+
+def version_cambios(conn):
+    """Versión del último cambio en beneficiarios (0 si no hay ninguno)."""
+    return conn.execute("SELECT IFNULL(MAX(version), 0) FROM cambios").fetchone()[0]
+
+def cambios_desde(conn, version, limite=CAMBIOS_MAX):
+    """Beneficiarios que cambiaron después de `version`, en orden de versión.
+
+    Cada fila es (version, id, borrado, nombre, curp, status, codigo_unico);
+    en los borrados los datos vienen en NULL.
+    """
+    return conn.execute(f"""
+        SELECT c.version, c.id_beneficiario, c.borrado, b.nombre, b.curp, b.status,
+               {_codigo_texto("b.codigo_unico")} AS codigo_unico
+        FROM cambios c LEFT JOIN beneficiarios b ON b.id = c.id_beneficiario
+        WHERE c.version > ?
+        ORDER BY c.version LIMIT ?
+    """, (version, limite)).fetchall()
+
+# ---------------- BITÁCORA DE RECLAMOS ----------------
+def guardar_reclamos(conn, eventos):
+    """Agrega (momento, codigo, id_beneficiario, resultado, origen) en una transacción."""
+    try:
+        conn.executemany("""
+            INSERT INTO reclamos (momento, codigo_unico, id_beneficiario, resultado, origen)
+            VALUES (?, ?, ?, ?, ?)
+        """, eventos)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def consultar_reclamos(conn, codigo=None, id_beneficiario=None, desde=None, hasta=None,
+                       resultado=None, despues=None, limite=None):
+    """Cursor sobre la bitácora en orden de id, con paginación keyset.
+
+    `desde`/`hasta` son datetime (hasta excluido) y `despues` el id del
+    último evento de la página anterior. Filas: (id, momento, codigo_unico,
+    id_beneficiario, resultado, origen).
+    """
+    condiciones, params = [], []
+    for condicion, valor in (("codigo_unico=?", codigo), ("id_beneficiario=?", id_beneficiario),
+                             ("momento>=?", desde and fecha_iso(desde)), ("momento<?", hasta and fecha_iso(hasta)),
+                             ("resultado=?", resultado), ("id>?", despues)):
+        if valor is not None:
+            condiciones.append(condicion)
+            params.append(valor)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    sql = f"""
+        SELECT id, momento, codigo_unico, id_beneficiario, resultado, origen
+        FROM reclamos {where} ORDER BY id
+    """
+    if limite:
+        sql += " LIMIT ?"
+        params.append(limite)
+    return conn.execute(sql, params)
+
+# ---------------- REGISTRO ----------------
+def normalizar_registro(nombre, curp):
+    """Normaliza y valida como el formulario de registro.
+
+    Devuelve (nombre, curp, error); error es None si el registro es válido.
+    """
+    # Espacios internos colapsados: el nombre guardado es la clave de duplicados
+    nombre = " ".join((nombre or "").split()).upper()
+    curp = (curp or "").strip().upper()
+    if not nombre or not curp:
+        return nombre, curp, "Debes ingresar nombre y CURP"
+    if len(curp) != 18:
+        return nombre, curp, "La CURP debe tener exactamente 18 caracteres"
+    return nombre, curp, None
+
+# Límite conservador de parámetros por sentencia en SQLite antiguos
+_MAX_PARAMS = 500
+
+def registrados(conn, nombres, curps):
+    """Subconjuntos de `nombres` y `curps` que ya existen en la tabla."""
+    nombres, curps = list(nombres), list(curps)
+    nombres_existentes, curps_existentes = set(), set()
+    for i in range(0, len(curps), _MAX_PARAMS):
+        parte = curps[i:i + _MAX_PARAMS]
+        marcas = ",".join("?" * len(parte))
+        cursor = conn.execute(f"SELECT curp FROM beneficiarios WHERE curp IN ({marcas})", parte)
+        curps_existentes.update(row[0] for row in cursor)
+    for i in range(0, len(nombres), _MAX_PARAMS):
+        parte = nombres[i:i + _MAX_PARAMS]
+        marcas = ",".join("?" * len(parte))
+        cursor = conn.execute(f"SELECT nombre FROM beneficiarios WHERE nombre IN ({marcas})", parte)
+        nombres_existentes.update(row[0] for row in cursor)
+    return nombres_existentes, curps_existentes
+
+# Verificación de duplicados e inserción en una sola sentencia: el nombre se
+# busca en su índice y la CURP (UNIQUE) la descarta OR IGNORE.
+_SQL_REGISTRAR = """
+    INSERT OR IGNORE INTO beneficiarios (nombre, curp, codigo_unico, status)
+    SELECT ?1, ?2, ?3, 'PENDIENTE'
+    WHERE NOT EXISTS (SELECT 1 FROM beneficiarios WHERE nombre=?1)
+"""
+# En el fragmento k de n los ids son k+1, k+1+n, k+1+2n...: no se repiten
+# entre fragmentos y el panel puede ordenar y paginar por id. Como con
+# AUTOINCREMENT, el siguiente sale del mayor entre sqlite_sequence (que el
+# INSERT con id explícito también avanza) y MAX(id): un id borrado no se
+# vuelve a dar, así reclamos.id_beneficiario y cambios no mezclan personas.
+_SQL_REGISTRAR_FRAGMENTO = """
+    INSERT OR IGNORE INTO beneficiarios (id, nombre, curp, codigo_unico, status)
+    SELECT tope + ?5 - ((tope - ?4) % ?5 + ?5) % ?5, ?1, ?2, ?3, 'PENDIENTE'
+    FROM (SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name='beneficiarios'), ?4 - ?5),
+                     IFNULL((SELECT MAX(id) FROM beneficiarios), ?4 - ?5)) AS tope)
+    WHERE NOT EXISTS (SELECT 1 FROM beneficiarios WHERE nombre=?1)
+"""
+
+def _sql_registro(fragmento):
+    return _SQL_REGISTRAR if fragmento is None else _SQL_REGISTRAR_FRAGMENTO
+
+def _parametros_registro(fragmento, nombre, curp, clave):
+    if fragmento is None:
+        return (nombre, curp, clave)
+    k, n = fragmento
+    return (nombre, curp, clave, k + 1, n)
+
+def registrar_beneficiario(conn, nombre, curp, codigo, fragmento=None):
+    """Inserta si ni el nombre ni la CURP existen; devuelve False si es duplicado.
+
+    `fragmento` es (k, n) cuando la base es el fragmento k de n.
+    """
+    try:
+        clave = _escribir(conn).codigo(codigo)
+        cursor = conn.execute(_sql_registro(fragmento), _parametros_registro(fragmento, nombre, curp, clave))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount == 1
+
+def insertar_lote(conn, filas, fragmento=None):
+    """Inserta (nombre, curp, codigo) con executemany en una transacción.
+
+    Devuelve las filas que sí se insertaron; las que chocan con un registro
+    hecho en paralelo se ignoran. Los códigos son nuevos, así que los que
+    aparecen en la tabla antes del commit son exactamente los insertados.
+    """
+    filas = list(filas)
+    try:
+        formato_bd = _escribir(conn)
+        claves = [formato_bd.codigo(codigo) for _, _, codigo in filas]
+        conn.executemany(_sql_registro(fragmento), [_parametros_registro(fragmento, nombre, curp, clave)
+                                                    for (nombre, curp, _), clave in zip(filas, claves)])
+        insertadas = set()
+        for i in range(0, len(claves), _MAX_PARAMS):
+            parte = claves[i:i + _MAX_PARAMS]
+            marcas = ",".join("?" * len(parte))
+            cursor = conn.execute(f"SELECT codigo_unico FROM beneficiarios WHERE codigo_unico IN ({marcas})", parte)
+            insertadas.update(row[0] for row in cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [fila for fila, clave in zip(filas, claves) if clave in insertadas]
+
+# ---------------- PAGINACIÓN ----------------
+# Orden -> (condición keyset, ORDER BY)
+ORDENES = {
+    "id": ("id > ?", "id"),
+    "-id": ("id < ?", "id DESC"),
+    "nombre": ("(nombre, id) > (?, ?)", "nombre, id"),
+}
+
+def pagina_beneficiarios(conn, orden="id", despues=None, status=None, limite=100):
+    """Cursor sobre una página con paginación keyset.
+
+    `despues` es la clave de la última fila de la página anterior: el id, o
+    (nombre, id) si se ordena por nombre. Cada página cuesta lo mismo sin
+    importar cuántas filas haya antes.
+    """
+    condicion, order_by = ORDENES[orden]
+    condiciones, params = [], []
+    if despues is not None:
+        condiciones.append(condicion)
+        params.extend(despues if isinstance(despues, tuple) else (despues,))
+    if status:
+        condiciones.append("status=?")
+        params.append(status)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    params.append(limite)
+    return conn.execute(f"""
+        SELECT id, nombre, curp, status, {CODIGO_TEXTO} FROM beneficiarios
+        {where} ORDER BY {order_by} LIMIT ?
+    """, params)
+
+# ---------------- BÚSQUEDA ----------------
+BUSQUEDA_MAX = 500
+
+def consulta_fts(texto):
+    """Convierte el texto del usuario en una consulta FTS5 por prefijos.
+
+    Cada palabra debe aparecer (AND) como prefijo de alguna palabra del
+    nombre o de la CURP; las comillas evitan interpretar operadores.
+    """
+    palabras = re.findall(r"\w+", texto)
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+def buscar(conn, texto, limite=50):
+    """Filas (id, nombre, curp, status, codigo_unico) que coinciden con `texto`.
+
+    Sin distinguir mayúsculas ni acentos; usada por /admin/buscar y por la
+    app de escritorio.
+    """
+    limite = max(1, min(limite, BUSQUEDA_MAX))
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    try:
+        return conn.execute(f"""
+            SELECT b.id, b.nombre, b.curp, b.status, {_codigo_texto("b.codigo_unico")} AS codigo_unico
+            FROM beneficiarios_fts f JOIN beneficiarios b ON b.id = f.rowid
+            WHERE beneficiarios_fts MATCH ?
+            LIMIT ?
+        """, (consulta, limite)).fetchall()
+    except sqlite3.OperationalError:
+        # Sin FTS5: prefijo sobre el índice de nombre
+        prefijo = texto.strip().upper()
+        return conn.execute(f"""
+            SELECT id, nombre, curp, status, {CODIGO_TEXTO} FROM beneficiarios
+            WHERE (nombre >= ? AND nombre < ?) OR curp = ?
+            LIMIT ?
+        """, (prefijo, prefijo + "\uffff", prefijo, limite)).fetchall()
+
+# ---------------- CONFIGURACIÓN ----------------
+def version_configuracion(conn):
+    row = conn.execute("SELECT valor FROM configuracion WHERE clave='version'").fetchone()
+    return row[0] if row else None
+
+def leer_configuracion(conn):
+    return {row[0]: row[1] for row in conn.execute("SELECT clave, valor FROM configuracion")}
+
+def guardar_configuracion(conn, valores):
+    """Guarda los valores e incrementa la versión en la misma transacción."""
+    try:
+        conn.executemany("""
+            INSERT INTO configuracion (clave, valor) VALUES (?, ?)
+            ON CONFLICT(clave) DO UPDATE SET valor=excluded.valor
+        """, list(valores.items()))
+        conn.execute("UPDATE configuracion SET valor=valor+1 WHERE clave='version'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
 if __name__ == "__main__":
     init_db()
-
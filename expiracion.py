@@ -0,0 +1,124 @@
+# expiracion.py (motor de expiración en segundo plano para el servidor)
+import heapq, json, os, threading, time
+from datetime import datetime
+import database
+from almacen import almacen
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+
+# Máximo de segundos entre consultas al índice (recoge reclamos de otros workers)
+INTERVALO_SONDEO = float(os.getenv("EXPIRACION_SONDEO", 1.0))
+# Reintento del candado en los workers que no ejecutan el programador
+INTERVALO_RESERVA = 30.0
+LOTE = 500
+CANDADO = database.DB_NAME + ".expiracion.lock"
+
+def _segundos_hasta(fecha):
+    return (fecha - datetime.now()).total_seconds()
+
+class ProgramadorExpiracion:
+    """Resetea los RECLAMADO vencidos justo cuando expiran.
+
+    Mantiene un min-heap con las próximas fecha_expira (cargadas del índice
+    parcial) y duerme hasta la primera. Solo un proceso por despliegue lo
+    ejecuta: el que obtiene el candado de archivo; los demás quedan en
+    reserva por si ese worker muere.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._cond = threading.Condition()
+        self._ejecucion = threading.Lock()
+        self._hilo = None
+        self._candado = None
+        self.stats = {
+            "activo": False, "pid": None, "ejecuciones": 0, "lotes": 0,
+            "reseteados": 0, "ultima_ejecucion": None, "proxima_expiracion": None,
+        }
+
+    # ---------------- CICLO DE VIDA ----------------
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="expiracion", daemon=True)
+            self._hilo.start()
+
+    def _tomar_candado(self):
+        if fcntl is None:
+            return True
+        archivo = open(CANDADO, "a+")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._candado = archivo
+        return True
+
+    def _ciclo(self):
+        while not self._tomar_candado():
+            time.sleep(INTERVALO_RESERVA)
+        self.stats["activo"] = True
+        self.stats["pid"] = os.getpid()
+        while True:
+            try:
+                self.ejecutar()
+            except Exception:
+                # Base ocupada o no inicializada: se reintenta en el siguiente ciclo
+                pass
+            with self._cond:
+                espera = INTERVALO_SONDEO
+                if self._heap:
+                    espera = min(espera, max(0.0, _segundos_hasta(self._heap[0]) + 0.001))
+                self._cond.wait(espera)
+
+    # ---------------- OPERACIONES ----------------
+    def programar(self, fecha_expira):
+        """Avisa de un reclamo hecho en este proceso para despertar a tiempo."""
+        if not self.stats["activo"]:
+            return
+        # El heap guarda datetime: la columna puede estar en texto o en ms
+        fecha = database.a_fecha(fecha_expira)
+        with self._cond:
+            heapq.heappush(self._heap, fecha)
+            if self._heap[0] == fecha:
+                self._cond.notify()
+
+    def ejecutar(self):
+        """Resetea en lotes todo lo vencido y recarga las próximas expiraciones."""
+        with self._ejecucion:
+            total, lotes = almacen.expirar(LOTE)
+            proximas = almacen.proximas_expiraciones(LOTE)
+
+        with self._cond:
+            # Vienen ordenadas (mezcladas entre fragmentos), por lo que ya forman un heap válido
+            self._heap = proximas
+        self.stats["ejecuciones"] += 1
+        self.stats["lotes"] += lotes
+        self.stats["reseteados"] += total
+        self.stats["ultima_ejecucion"] = database.ahora_iso()
+        self.stats["proxima_expiracion"] = database.fecha_iso(proximas[0]) if proximas else None
+        if total and self._candado is not None:
+            self._publicar()
+        return total
+
+    def _publicar(self):
+        # Deja las estadísticas en el archivo del candado para los demás workers
+        self._candado.seek(0)
+        self._candado.truncate()
+        self._candado.write(json.dumps(self.stats))
+        self._candado.flush()
+
+    def estadisticas(self):
+        """Estadísticas del programador activo, aunque corra en otro worker."""
+        if self.stats["activo"] or fcntl is None:
+            return dict(self.stats)
+        try:
+            with open(CANDADO) as archivo:
+                return json.loads(archivo.read())
+        except (OSError, ValueError):
+            return dict(self.stats)
+
+programador = ProgramadorExpiracion()
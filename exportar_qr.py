@@ -0,0 +1,233 @@
+# exportar_qr.py (hojas de credenciales QR para imprimir, en PDF o ZIP)
+#
+# Uso:  python exportar_qr.py credenciales.pdf --status PENDIENTE --procesos 4
+import argparse, os, sys, time, zipfile
+from collections import deque
+import database
+import generador_qr
+
+# Credenciales por tarea en el modo ZIP (en PDF cada tarea es una página)
+ETIQUETAS_POR_TAREA = 50
+TAMANO_FETCH = 500
+STATUS_VALIDOS = ("PENDIENTE", "RECLAMADO")
+
+# Última exportación de este worker, visible en /admin/estadisticas
+ultima_exportacion = {}
+
+# ---------------- CONSULTA ----------------
+def _filtro(status=None, desde=None, hasta=None):
+    condiciones, params = [], []
+    if status:
+        condiciones.append("status=?")
+        params.append(status)
+    if desde is not None:
+        condiciones.append("id>=?")
+        params.append(desde)
+    if hasta is not None:
+        condiciones.append("id<=?")
+        params.append(hasta)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return where, params
+
+def contar(conn, status=None, desde=None, hasta=None, limite=None):
+    where, params = _filtro(status, desde, hasta)
+    total = conn.execute(f"SELECT COUNT(*) FROM beneficiarios {where}", params).fetchone()[0]
+    return min(total, limite) if limite else total
+
+def beneficiarios(conn, status=None, desde=None, hasta=None, limite=None, con_id=False):
+    """Genera (nombre, curp, codigo) en orden de id, leyendo por bloques.
+
+    Con `con_id` cada tupla empieza con el id (para mezclar fragmentos).
+    """
+    where, params = _filtro(status, desde, hasta)
+    columnas = "id, nombre, curp" if con_id else "nombre, curp"
+    sql = f"SELECT {columnas}, {database.CODIGO_TEXTO} FROM beneficiarios {where} ORDER BY id"
+    if limite:
+        sql += " LIMIT ?"
+        params.append(limite)
+    cursor = conn.execute(sql, params)
+    while True:
+        filas = cursor.fetchmany(TAMANO_FETCH)
+        if not filas:
+            break
+        for fila in filas:
+            yield tuple(fila)
+
+def en_grupos(items, tamano):
+    grupo = []
+    for item in items:
+        grupo.append(item)
+        if len(grupo) == tamano:
+            yield grupo
+            grupo = []
+    if grupo:
+        yield grupo
+
+# ---------------- POOL DE PROCESOS ----------------
+def en_orden(pool, funcion, tareas, max_en_vuelo):
+    """Ejecuta las tareas en el pool y entrega (tarea, resultado) en orden.
+
+    Nunca hay más de `max_en_vuelo` tareas pendientes, así la memoria no
+    depende de cuántas credenciales se exporten.
+    """
+    pendientes = deque()
+    for tarea in tareas:
+        if len(pendientes) >= max_en_vuelo:
+            anterior, futuro = pendientes.popleft()
+            yield anterior, futuro.result()
+        pendientes.append((tarea, pool.submit(funcion, tarea)))
+    while pendientes:
+        anterior, futuro = pendientes.popleft()
+        yield anterior, futuro.result()
+
+# ---------------- FORMATOS DE SALIDA ----------------
+class _Buffer:
+    """Destino no posicionable para ZipFile; se vacía en cada vuelta del generador."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+def zip_en_streaming(lotes):
+    """Genera los bytes de un ZIP a partir de lotes de (nombre_archivo, png)."""
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archivo:
+        for lote in lotes:
+            for nombre_archivo, png in lote:
+                archivo.writestr(nombre_archivo, png)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
+
+def pdf_en_streaming(paginas):
+    """Genera un PDF página por página a partir de imágenes en escala de grises.
+
+    Cada página es (ancho, alto, pixeles_zlib). El objeto /Pages y la tabla
+    xref se escriben al final, cuando ya se conocen todas las páginas.
+    """
+    offsets = {}
+    posicion = 0
+
+    def objeto(numero, cuerpo, stream=None):
+        nonlocal posicion
+        offsets[numero] = posicion
+        datos = f"{numero} 0 obj\n".encode() + cuerpo
+        if stream is not None:
+            datos += b"\nstream\n" + stream + b"\nendstream"
+        datos += b"\nendobj\n"
+        posicion += len(datos)
+        return datos
+
+    cabecera = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    posicion = len(cabecera)
+    yield cabecera + objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    hojas = []
+    numero = 3
+    for ancho, alto, pixeles in paginas:
+        pagina, contenido, imagen = numero, numero + 1, numero + 2
+        numero += 3
+        hojas.append(pagina)
+        ancho_pt = ancho * 72 / generador_qr.DPI
+        alto_pt = alto * 72 / generador_qr.DPI
+        dibujo = f"q {ancho_pt:.2f} 0 0 {alto_pt:.2f} 0 0 cm /Im0 Do Q".encode()
+        yield (
+            objeto(pagina, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {ancho_pt:.2f} {alto_pt:.2f}] "
+                f"/Resources << /XObject << /Im0 {imagen} 0 R >> >> /Contents {contenido} 0 R >>"
+            ).encode())
+            + objeto(contenido, f"<< /Length {len(dibujo)} >>".encode(), dibujo)
+            + objeto(imagen, (
+                f"<< /Type /XObject /Subtype /Image /Width {ancho} /Height {alto} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                f"/Length {len(pixeles)} >>"
+            ).encode(), pixeles)
+        )
+
+    kids = " ".join(f"{n} 0 R" for n in hojas)
+    final = objeto(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(hojas)} >>".encode())
+    inicio_xref = posicion
+    xref = [f"xref\n0 {numero}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, numero)]
+    xref.append(f"trailer\n<< /Size {numero} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n")
+    yield final + "".join(xref).encode()
+
+# ---------------- EXPORTACIÓN ----------------
+def exportar(filas, formato="pdf", total=None, procesos=None, progreso=None):
+    """Genera los bytes del PDF o ZIP de credenciales para las filas dadas.
+
+    Las credenciales se renderizan en un pool de procesos; `progreso`
+    recibe (hechas, total, imagenes_por_segundo) tras cada tarea.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    pool = generador_qr.crear_pool(procesos)
+    inicio = time.perf_counter()
+    hechas = 0
+
+    def avance(cantidad):
+        nonlocal hechas
+        hechas += cantidad
+        segundos = time.perf_counter() - inicio
+        por_segundo = hechas / segundos if segundos else 0.0
+        ultima_exportacion.update(formato=formato, imagenes=hechas, total=total,
+                                  segundos=round(segundos, 3),
+                                  imagenes_por_segundo=round(por_segundo, 1))
+        if progreso:
+            progreso(hechas, total, por_segundo)
+
+    ultima_exportacion.clear()
+    avance(0)
+    try:
+        if formato == "zip":
+            funcion, tamano, escribir = generador_qr.png_etiquetas, ETIQUETAS_POR_TAREA, zip_en_streaming
+        else:
+            funcion, tamano, escribir = generador_qr.pagina_etiquetas, generador_qr.POR_PAGINA, pdf_en_streaming
+
+        def resultados():
+            for grupo, resultado in en_orden(pool, funcion, en_grupos(filas, tamano), 2 * procesos):
+                avance(len(grupo))
+                yield resultado
+        yield from escribir(resultados())
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta credenciales QR para imprimir (PDF o ZIP)")
+    parser.add_argument("salida", help="archivo .pdf o .zip")
+    parser.add_argument("--status", choices=STATUS_VALIDOS)
+    parser.add_argument("--desde", type=int, help="id mínimo")
+    parser.add_argument("--hasta", type=int, help="id máximo")
+    parser.add_argument("--limite", type=int)
+    parser.add_argument("--procesos", type=int, help="por defecto, uno por CPU")
+    args = parser.parse_args(argv)
+
+    formato = "zip" if args.salida.lower().endswith(".zip") else "pdf"
+    filtro = dict(status=args.status, desde=args.desde, hasta=args.hasta, limite=args.limite)
+
+    def progreso(hechas, total, por_segundo):
+        print(f"\r{hechas}/{total} credenciales ({por_segundo:.1f} img/s)", end="", file=sys.stderr)
+
+    # almacen importa este módulo: se importa aquí
+    from almacen import almacen
+    total = almacen.contar(**filtro)
+    with open(args.salida, "wb") as salida:
+        for datos in exportar(almacen.exportables(**filtro), formato, total, args.procesos, progreso):
+            salida.write(datos)
+    print(file=sys.stderr)
+    print(f"{ultima_exportacion.get('imagenes', 0)} credenciales en "
+          f"{ultima_exportacion.get('segundos', 0)} s "
+          f"({ultima_exportacion.get('imagenes_por_segundo', 0)} img/s) -> {args.salida}")
+
+if __name__ == "__main__":
+    main()
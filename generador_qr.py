@@ -0,0 +1,174 @@
+# generador_qr.py (generación de imágenes QR compartida por el servidor y las herramientas)
+#
+# qrcode y Pillow se importan dentro de las funciones que dibujan: un worker
+# que solo verifica no los carga, y arranca más rápido.
+import hashlib, os, threading, time, zlib
+from collections import OrderedDict
+from io import BytesIO
+import metricas
+
+def url_verificacion(codigo):
+    """URL completa que se codifica en el QR de un beneficiario."""
+    base_url = os.getenv("BASE_URL", "http://localhost:5000")
+    return f"{base_url}/verificar/{codigo}"
+
+def png_qr(codigo):
+    import qrcode
+    qr_img = qrcode.make(url_verificacion(codigo))
+    buffer = BytesIO()
+    qr_img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def png_lote(items):
+    """Genera los PNG de una lista de (nombre_archivo, codigo).
+
+    Pensada para ejecutarse en un ProcessPoolExecutor: recibe y devuelve
+    solo datos serializables.
+    """
+    return [(nombre_archivo, png_qr(codigo)) for nombre_archivo, codigo in items]
+
+# ---------------- CREDENCIALES IMPRIMIBLES ----------------
+# Hoja carta/A4 a 150 dpi con 3 x 4 credenciales
+DPI = 150
+PAGINA = (1240, 1754)
+COLUMNAS, FILAS = 3, 4
+POR_PAGINA = COLUMNAS * FILAS
+
+def _fuente(tamano):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=tamano)
+    except TypeError:  # Pillow sin FreeType
+        return ImageFont.load_default()
+
+def _recortar(draw, texto, fuente, ancho):
+    while texto and draw.textlength(texto, font=fuente) > ancho:
+        texto = texto[:-1]
+    return texto
+
+def etiqueta(nombre, curp, codigo, ancho=400):
+    """Imagen en escala de grises con el QR y debajo el nombre y la CURP."""
+    import qrcode
+    from PIL import Image, ImageDraw
+    qr_img = qrcode.make(url_verificacion(codigo), box_size=8, border=2).get_image()
+    lado = ancho - 40
+    qr_img = qr_img.convert("L").resize((lado, lado), Image.NEAREST)
+    img = Image.new("L", (ancho, lado + 80), 255)
+    img.paste(qr_img, (20, 0))
+    draw = ImageDraw.Draw(img)
+    fuente = _fuente(22)
+    draw.text((ancho // 2, lado + 10), _recortar(draw, nombre, fuente, ancho - 10),
+              font=fuente, fill=0, anchor="ma")
+    draw.text((ancho // 2, lado + 45), curp, font=fuente, fill=0, anchor="ma")
+    return img
+
+def png_etiquetas(items):
+    """(nombre_archivo, png) por cada (nombre, curp, codigo); para el pool de procesos."""
+    resultado = []
+    for nombre, curp, codigo in items:
+        buffer = BytesIO()
+        etiqueta(nombre, curp, codigo).save(buffer, format="PNG")
+        resultado.append((f"{curp}.png", buffer.getvalue()))
+    return resultado
+
+def pagina_etiquetas(items):
+    """Renderiza hasta POR_PAGINA credenciales en una página.
+
+    Devuelve (ancho, alto, pixeles comprimidos con zlib) en escala de grises,
+    listo para incrustarse en un PDF con FlateDecode.
+    """
+    from PIL import Image
+    pagina = Image.new("L", PAGINA, 255)
+    celda_ancho = PAGINA[0] // COLUMNAS
+    celda_alto = PAGINA[1] // FILAS
+    for i, (nombre, curp, codigo) in enumerate(items):
+        img = etiqueta(nombre, curp, codigo, ancho=celda_ancho - 20)
+        x = (i % COLUMNAS) * celda_ancho + 10
+        y = (i // COLUMNAS) * celda_alto + (celda_alto - img.height) // 2
+        pagina.paste(img, (x, y))
+    return pagina.width, pagina.height, zlib.compress(pagina.tobytes(), 6)
+
+def crear_pool(procesos=None):
+    """Pool de procesos con 'spawn': seguro aunque el proceso tenga hilos activos."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+
+def svg_qr(codigo):
+    import qrcode
+    import qrcode.image.svg
+    qr_img = qrcode.make(url_verificacion(codigo), image_factory=qrcode.image.svg.SvgPathImage)
+    buffer = BytesIO()
+    qr_img.save(buffer)
+    return buffer.getvalue()
+
+# ---------------- CACHÉ DE IMÁGENES ----------------
+RENDERIZADORES = {"png": png_qr, "svg": svg_qr}
+
+class CacheQR:
+    """LRU en memoria respaldada por una caché en disco direccionada por contenido.
+
+    La clave es el hash del formato y la URL codificada, así que sirve también
+    como ETag: si cambia BASE_URL cambian la clave y la imagen.
+    """
+
+    def __init__(self, directorio=None, max_entradas=None):
+        self.directorio = directorio or os.getenv("QR_CACHE_DIR", "qr_cache")
+        self.max_entradas = max_entradas or int(os.getenv("QR_CACHE_MAX", 1024))
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits_memoria": 0, "hits_disco": 0, "fallos": 0, "segundos_render": 0.0}
+
+    def clave(self, codigo, formato):
+        return hashlib.sha256(f"{formato}:{url_verificacion(codigo)}".encode()).hexdigest()
+
+    def _ruta(self, clave, formato):
+        return os.path.join(self.directorio, clave[:2], f"{clave}.{formato}")
+
+    def obtener(self, codigo, formato):
+        """Devuelve (clave, bytes) de la imagen, generándola solo si hace falta."""
+        clave = self.clave(codigo, formato)
+        with self._lock:
+            datos = self._lru.get(clave)
+            if datos is not None:
+                self._lru.move_to_end(clave)
+                self.stats["hits_memoria"] += 1
+                return clave, datos
+
+        ruta = self._ruta(clave, formato)
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            estadistica = "hits_disco"
+        except OSError:
+            inicio = time.perf_counter()
+            datos = RENDERIZADORES[formato](codigo)
+            segundos = time.perf_counter() - inicio
+            self.stats["segundos_render"] += segundos
+            metricas.qr_render.observar(segundos, formato)
+            self._guardar_en_disco(ruta, datos)
+            estadistica = "fallos"
+
+        with self._lock:
+            self.stats[estadistica] += 1
+            self._lru[clave] = datos
+            if len(self._lru) > self.max_entradas:
+                self._lru.popitem(last=False)
+        return clave, datos
+
+    def _guardar_en_disco(self, ruta, datos):
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except OSError:
+            # Sin disco escribible la caché en memoria sigue funcionando
+            pass
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self.stats, entradas_memoria=len(self._lru), max_entradas=self.max_entradas)
+
+cache_qr = CacheQR()
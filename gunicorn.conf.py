@@ -0,0 +1,11 @@
+# gunicorn.conf.py (gunicorn lo lee del directorio de trabajo; también con -c)
+#
+# Las migraciones pendientes se aplican una sola vez en el proceso maestro,
+# antes de crear workers: un worker nuevo (al arrancar o al escalar bajo
+# carga) solo importa la app y lee PRAGMA user_version.
+import migraciones
+
+def on_starting(server):
+    for ruta, (anterior, final) in migraciones.aplicar_todas().items():
+        if anterior != final:
+            server.log.info("Migraciones de %s: versión %s -> %s", ruta, anterior, final)
@@ -0,0 +1,200 @@
+# importar.py (importación masiva de beneficiarios desde CSV o JSONL)
+#
+# Uso:  python importar.py padron.csv --qr-zip qrs.zip --reporte rechazados.csv
+import argparse, csv, io, json, os, sys, time, zipfile
+import database
+from almacen import almacen
+from indice_codigos import indice
+import generador_qr
+
+TAMANO_LOTE = 5000
+# Códigos por tarea enviada al pool de procesos
+QR_POR_TAREA = 200
+
+# ---------------- LECTURA EN STREAMING ----------------
+def leer_registros(archivo, formato):
+    """Genera (linea, nombre, curp) sin cargar el archivo completo."""
+    if formato == "jsonl":
+        for linea, texto in enumerate(archivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                dato = json.loads(texto)
+            except ValueError:
+                yield linea, None, None
+                continue
+            yield linea, dato.get("nombre"), dato.get("curp")
+    else:
+        lector = csv.DictReader(archivo)
+        for linea, dato in enumerate(lector, start=2):
+            yield linea, dato.get("nombre"), dato.get("curp")
+
+def en_lotes(registros, tamano):
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def detectar_formato(nombre_archivo):
+    return "jsonl" if nombre_archivo.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+def abrir_texto(binario):
+    """Envuelve un archivo binario subido (por ejemplo request.files) como texto."""
+    return io.TextIOWrapper(binario, encoding="utf-8-sig", newline="")
+
+# ---------------- SALIDA DE QR ----------------
+class SalidaQR:
+    """Genera los QR en un pool de procesos y los escribe a un directorio o ZIP.
+
+    Mantiene acotado el número de tareas en vuelo para que la memoria no
+    crezca con el tamaño del archivo.
+    """
+
+    def __init__(self, directorio=None, zip_path=None, procesos=None):
+        self.directorio = directorio
+        self.zip = zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) if zip_path else None
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        procesos = procesos or os.cpu_count() or 1
+        self.pool = generador_qr.crear_pool(procesos)
+        self.max_en_vuelo = 2 * procesos
+        self.pendientes = []
+        self.generados = 0
+
+    def agregar(self, filas):
+        for i in range(0, len(filas), QR_POR_TAREA):
+            items = [(f"{curp}.png", codigo) for _, curp, codigo in filas[i:i + QR_POR_TAREA]]
+            if len(self.pendientes) >= self.max_en_vuelo:
+                self._escribir(self.pendientes.pop(0).result())
+            self.pendientes.append(self.pool.submit(generador_qr.png_lote, items))
+
+    def _escribir(self, imagenes):
+        for nombre_archivo, png in imagenes:
+            if self.zip:
+                self.zip.writestr(nombre_archivo, png)
+            else:
+                with open(os.path.join(self.directorio, nombre_archivo), "wb") as f:
+                    f.write(png)
+        self.generados += len(imagenes)
+
+    def cerrar(self):
+        for futuro in self.pendientes:
+            self._escribir(futuro.result())
+        self.pendientes = []
+        self.pool.shutdown()
+        if self.zip:
+            self.zip.close()
+
+# ---------------- IMPORTACIÓN ----------------
+def importar(archivo, formato="csv", salida_qr=None, reporte=None,
+             tamano_lote=TAMANO_LOTE, progreso=None):
+    """Importa un archivo de texto abierto y devuelve un resumen.
+
+    Cada lote se valida igual que en /registrar, se descartan duplicados
+    (dentro del lote y contra la base) con consultas en bloque y se inserta
+    con executemany en una sola transacción.
+    """
+    resumen = {"leidos": 0, "insertados": 0, "invalidos": 0, "duplicados": 0,
+               "conflictos": 0, "rechazados_muestra": []}
+    inicio = time.perf_counter()
+
+    def rechazar(linea, nombre, curp, motivo):
+        if len(resumen["rechazados_muestra"]) < 50:
+            resumen["rechazados_muestra"].append(
+                {"linea": linea, "nombre": nombre, "curp": curp, "motivo": motivo})
+        if reporte is not None:
+            reporte.writerow([linea, nombre, curp, motivo])
+
+    try:
+        for lote in en_lotes(leer_registros(archivo, formato), tamano_lote):
+            resumen["leidos"] += len(lote)
+            validos = []
+            nombres, curps = set(), set()
+            for linea, nombre, curp in lote:
+                if nombre is None and curp is None:
+                    resumen["invalidos"] += 1
+                    rechazar(linea, nombre, curp, "Registro ilegible")
+                    continue
+                nombre, curp, error = database.normalizar_registro(nombre, curp)
+                if error:
+                    resumen["invalidos"] += 1
+                    rechazar(linea, nombre, curp, error)
+                elif nombre in nombres or curp in curps:
+                    resumen["duplicados"] += 1
+                    rechazar(linea, nombre, curp, "Duplicado dentro del archivo")
+                else:
+                    nombres.add(nombre)
+                    curps.add(curp)
+                    validos.append((linea, nombre, curp))
+
+            nombres_existentes, curps_existentes = almacen.registrados(nombres, curps)
+            filas = []
+            for linea, nombre, curp in validos:
+                if nombre in nombres_existentes or curp in curps_existentes:
+                    resumen["duplicados"] += 1
+                    rechazar(linea, nombre, curp, "El nombre o la CURP ya están registrados")
+                else:
+                    filas.append((nombre, curp, almacen.nuevo_codigo(curp)))
+
+            insertadas = almacen.insertar_lote(filas)
+            for _, _, codigo in insertadas:
+                indice.agregar(codigo)
+            resumen["insertados"] += len(insertadas)
+            resumen["conflictos"] += len(filas) - len(insertadas)
+            # Solo credenciales de lo insertado: un conflicto escanearía como "no existe"
+            if salida_qr is not None:
+                salida_qr.agregar(insertadas)
+            if progreso:
+                progreso(resumen)
+    finally:
+        if salida_qr is not None:
+            salida_qr.cerrar()
+            resumen["qr_generados"] = salida_qr.generados
+
+    resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importación masiva de beneficiarios (CSV o JSONL)")
+    parser.add_argument("archivo", help="CSV con columnas nombre,curp o JSONL con esas claves")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], help="por defecto se deduce de la extensión")
+    salida = parser.add_mutually_exclusive_group()
+    salida.add_argument("--qr-dir", help="directorio donde escribir un PNG por beneficiario")
+    salida.add_argument("--qr-zip", help="archivo ZIP donde guardar los PNG")
+    parser.add_argument("--procesos", type=int, help="procesos para generar QR (por defecto, uno por CPU)")
+    parser.add_argument("--reporte", help="CSV con los registros rechazados y el motivo")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="registros por transacción")
+    args = parser.parse_args(argv)
+
+    for ruta in database.rutas_fragmentos():
+        database.init_db(ruta)
+    formato = args.formato or detectar_formato(args.archivo)
+    salida_qr = None
+    if args.qr_dir or args.qr_zip:
+        salida_qr = SalidaQR(args.qr_dir, args.qr_zip, args.procesos)
+
+    def progreso(resumen):
+        print(f"\r{resumen['leidos']} leídos, {resumen['insertados']} insertados", end="", file=sys.stderr)
+
+    archivo_reporte = open(args.reporte, "w", newline="", encoding="utf-8") if args.reporte else None
+    try:
+        reporte = None
+        if archivo_reporte:
+            reporte = csv.writer(archivo_reporte)
+            reporte.writerow(["linea", "nombre", "curp", "motivo"])
+        with open(args.archivo, newline="", encoding="utf-8-sig") as archivo:
+            resumen = importar(archivo, formato, salida_qr, reporte, args.lote, progreso)
+    finally:
+        if archivo_reporte:
+            archivo_reporte.close()
+    print(file=sys.stderr)
+    del resumen["rechazados_muestra"]
+    print(json.dumps(resumen, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
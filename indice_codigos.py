@@ -0,0 +1,207 @@
+# indice_codigos.py (índice en memoria de códigos válidos para rechazar QR desconocidos)
+import hashlib, math, os, sys, threading, time
+from array import array
+from bisect import bisect_left
+from itertools import chain
+import database
+
+# Segundos entre sondeos (en el hilo de fondo) por códigos registrados en otros workers
+INTERVALO_SONDEO = float(os.getenv("INDICE_SONDEO", 0.5))
+# Si el último sondeo exitoso es más viejo que esto, un negativo ya no se cree
+ANTIGUEDAD_MAXIMA = float(os.getenv("INDICE_ANTIGUEDAD_MAX", 10))
+TASA_FP = 0.001
+CAPACIDAD_MINIMA = 10000
+# Altas recientes que se mantienen en un set antes de fusionarse al arreglo ordenado
+MAX_RECIENTES = 1024
+
+def huella(codigo):
+    """Hash de 64 bits del código; es lo único que se guarda en memoria."""
+    return int.from_bytes(hashlib.blake2b(codigo.encode(), digest_size=8).digest(), "little")
+
+class FiltroBloom:
+    def __init__(self, capacidad, tasa_fp=TASA_FP):
+        self.capacidad = capacidad
+        self.m = max(64, int(-capacidad * math.log(tasa_fp) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacidad * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _posiciones(self, h):
+        # Doble hashing (Kirsch-Mitzenmacher) a partir de las dos mitades
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def agregar(self, h):
+        for p in self._posiciones(h):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def contiene(self, h):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(h))
+
+    def tasa_fp_estimada(self):
+        ocupacion = int.from_bytes(self.bits, "little").bit_count() / self.m
+        return ocupacion ** self.k
+
+class IndiceCodigos:
+    """Bloom filter + conjunto compacto de huellas de los codigo_unico.
+
+    Un código que el índice no tiene no existe: se responde sin tocar
+    SQLite. Si el Bloom filter dice "quizá", el arreglo ordenado de huellas
+    lo confirma. Los códigos que registran otros workers o procesos los
+    incorpora un hilo de fondo con un sondeo incremental por id cada
+    INTERVALO_SONDEO segundos (con DB_FRAGMENTOS, uno por fragmento), así
+    que un alta ajena tarda a lo más eso en reconocerse. Si el sondeo deja
+    de funcionar por más de ANTIGUEDAD_MAXIMA segundos, los negativos se
+    dejan pasar a la base como si no hubiera índice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cargado = False
+        self._bloom = FiltroBloom(CAPACIDAD_MINIMA)
+        self._huellas = array("Q")
+        self._recientes = set()
+        # Por archivo: (último id visto, su código)
+        self._ultimos = {}
+        self._ultimo_sondeo = 0.0
+        self._hilo = None
+        self.stats = {"consultas": 0, "rechazos_bloom": 0, "falsos_positivos": 0,
+                      "sondeos": 0, "recargas": 0, "errores_sondeo": 0, "desactualizado": 0}
+
+    # ---------------- CARGA ----------------
+    def cargar(self):
+        """Lee todos los códigos de la base y reconstruye el índice."""
+        ultimos, codigos = {}, []
+        for ruta in database.rutas_fragmentos():
+            conn = database.get_conn(ruta)
+            try:
+                rows = conn.execute(f"SELECT id, {database.CODIGO_TEXTO} FROM beneficiarios ORDER BY id").fetchall()
+            finally:
+                conn.close()
+            ultimos[ruta] = (rows[-1][0], rows[-1][1]) if rows else (0, None)
+            codigos.extend(row[1] for row in rows)
+        huellas = array("Q", sorted(map(huella, codigos)))
+        bloom = FiltroBloom(max(CAPACIDAD_MINIMA, 2 * len(huellas)))
+        for h in huellas:
+            bloom.agregar(h)
+        with self._lock:
+            self._bloom, self._huellas, self._recientes = bloom, huellas, set()
+            self._ultimos = ultimos
+            self._ultimo_sondeo = time.monotonic()
+            self.stats["recargas"] += 1
+            self.cargado = True
+
+    def cargar_en_segundo_plano(self):
+        """Carga el índice y lo mantiene al día en un hilo propio."""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="indice-codigos", daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            # Sin índice (o con uno viejo) las consultas pasan a SQLite, como antes
+            try:
+                if self.cargado:
+                    self._sondear()
+                else:
+                    self.cargar()
+            except Exception:
+                self.stats["errores_sondeo"] += 1
+            time.sleep(INTERVALO_SONDEO)
+
+    def _sondear(self):
+        """Incorpora los códigos con id mayor al último visto."""
+        inicio = time.monotonic()
+        self.stats["sondeos"] += 1
+        nuevos = {}
+        for ruta in database.rutas_fragmentos():
+            ultimo_id, ultimo_codigo = self._ultimos.get(ruta, (0, None))
+            conn = database.get_conn(ruta)
+            try:
+                reiniciada = False
+                if ultimo_codigo is not None:
+                    fila = conn.execute(f"SELECT {database.CODIGO_TEXTO} FROM beneficiarios WHERE id=?",
+                                        (ultimo_id,)).fetchone()
+                    reiniciada = fila is None or fila[0] != ultimo_codigo
+                rows = [] if reiniciada else conn.execute(
+                    f"SELECT id, {database.CODIGO_TEXTO} FROM beneficiarios WHERE id>? ORDER BY id",
+                    (ultimo_id,)).fetchall()
+            finally:
+                conn.close()
+            if reiniciada:
+                # Se borró o reinició la tabla: los ids ya no son incrementales
+                self.cargar()
+                return
+            nuevos[ruta] = rows
+        with self._lock:
+            for ruta, rows in nuevos.items():
+                for id_, codigo in rows:
+                    self._agregar(huella(codigo))
+                    self._ultimos[ruta] = (id_, codigo)
+            self._ultimo_sondeo = inicio
+
+    # ---------------- ALTAS ----------------
+    def _agregar(self, h):
+        if self._contiene(h):
+            return
+        self._bloom.agregar(h)
+        self._recientes.add(h)
+        if len(self._recientes) > MAX_RECIENTES:
+            # Dos tramos ya ordenados: timsort los fusiona en tiempo lineal
+            self._huellas = array("Q", sorted(chain(self._huellas, sorted(self._recientes))))
+            self._recientes = set()
+            if len(self._huellas) > self._bloom.capacidad:
+                # Filtro lleno: se duplica para mantener la tasa de falsos positivos
+                self._bloom = FiltroBloom(2 * len(self._huellas))
+                for huella_existente in self._huellas:
+                    self._bloom.agregar(huella_existente)
+
+    def _contiene(self, h):
+        if h in self._recientes:
+            return True
+        i = bisect_left(self._huellas, h)
+        return i < len(self._huellas) and self._huellas[i] == h
+
+    def agregar(self, codigo):
+        """Alta hecha en este proceso; antes de cargar no hace falta (la carga la lee)."""
+        if not self.cargado:
+            return
+        with self._lock:
+            self._agregar(huella(codigo))
+
+    # ---------------- CONSULTA ----------------
+    def puede_existir(self, codigo):
+        """False solo si el código no está registrado; nunca toca la base."""
+        if not self.cargado:
+            return True
+        self.stats["consultas"] += 1
+        h = huella(codigo)
+        with self._lock:
+            if self._bloom.contiene(h):
+                if self._contiene(h):
+                    return True
+                self.stats["falsos_positivos"] += 1
+            else:
+                self.stats["rechazos_bloom"] += 1
+        if time.monotonic() - self._ultimo_sondeo > ANTIGUEDAD_MAXIMA:
+            # El hilo de fondo no ha podido sondear: el negativo ya no es confiable
+            self.stats["desactualizado"] += 1
+            return True
+        return False
+
+    def estadisticas(self):
+        with self._lock:
+            n = len(self._huellas) + len(self._recientes)
+            desconocidos = self.stats["rechazos_bloom"] + self.stats["falsos_positivos"]
+            return dict(
+                self.stats,
+                cargado=self.cargado,
+                codigos=n,
+                bloom_bits=self._bloom.m,
+                bloom_hashes=self._bloom.k,
+                bloom_bytes=len(self._bloom.bits),
+                huellas_bytes=self._huellas.itemsize * len(self._huellas) + sys.getsizeof(self._recientes),
+                tasa_fp_estimada=self._bloom.tasa_fp_estimada(),
+                tasa_fp_observada=(self.stats["falsos_positivos"] / desconocidos) if desconocidos else 0.0,
+            )
+
+indice = IndiceCodigos()
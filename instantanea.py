@@ -0,0 +1,217 @@
+# instantanea.py (verificación sin conexión: instantánea compacta y cola de reclamos)
+#
+# El servidor publica en GET /verificar/instantanea el estado de verificación
+# de todos los códigos en formato binario; el verificador de escritorio lo usa
+# para decidir cada escaneo localmente y sube los reclamos en segundo plano a
+# POST /verificar/sincronizar.
+import hashlib, json, os, struct, sys, threading, time, uuid
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import database
+from indice_codigos import huella
+
+# ---------------- FORMATO ----------------
+# Cabecera: firma, versión (hash del contenido), códigos, reclamados, segundos de renovación.
+# Después: huellas ordenadas (uint64), un bit de reclamado por huella y, para
+# cada bit encendido en orden, la expiración en segundos epoch (uint32).
+FIRMA = b"BQR1"
+CABECERA = struct.Struct("<4sQIId")
+
+def _ordenar_bytes(arreglo):
+    # El formato es little-endian
+    if sys.byteorder != "little":
+        arreglo.byteswap()
+    return arreglo
+
+def generar(filas, duracion):
+    """Instantánea binaria de filas (codigo, fecha_expira); devuelve (version, bytes).
+
+    Las filas vienen de almacen.instantanea() (todos los fragmentos). La
+    versión es un hash del contenido: dos workers (o dos regeneraciones)
+    con los mismos datos dan el mismo ETag y el verificador recibe 304.
+    """
+    filas = sorted((huella(codigo), fecha_expira) for codigo, fecha_expira in filas)
+    huellas = array("Q", (h for h, _ in filas))
+    bits = bytearray((len(filas) + 7) // 8)
+    expiraciones = array("I")
+    for i, (_, fecha_expira) in enumerate(filas):
+        if fecha_expira:
+            bits[i >> 3] |= 1 << (i & 7)
+            expiraciones.append(int(database.a_fecha(fecha_expira).timestamp()))
+    cuerpo = [_ordenar_bytes(huellas).tobytes(), bytes(bits), _ordenar_bytes(expiraciones).tobytes()]
+    digesto = hashlib.blake2b(struct.pack("<d", duracion.total_seconds()), digest_size=8)
+    for parte in cuerpo:
+        digesto.update(parte)
+    version = int.from_bytes(digesto.digest(), "little")
+    cabecera = CABECERA.pack(FIRMA, version, len(huellas), len(expiraciones),
+                             duracion.total_seconds())
+    return version, b"".join([cabecera, *cuerpo])
+
+class Instantanea:
+    """Instantánea ya decodificada: búsqueda binaria sobre las huellas."""
+
+    def __init__(self, datos):
+        firma, self.version, n, reclamados, segundos = CABECERA.unpack_from(datos)
+        if firma != FIRMA:
+            raise ValueError("Formato de instantánea desconocido")
+        inicio = CABECERA.size
+        self.huellas = _ordenar_bytes(array("Q", datos[inicio:inicio + 8 * n]))
+        inicio += 8 * n
+        bits = datos[inicio:inicio + (n + 7) // 8]
+        inicio += (n + 7) // 8
+        expiraciones = _ordenar_bytes(array("I", datos[inicio:inicio + 4 * reclamados]))
+        if len(self.huellas) != n or len(expiraciones) != reclamados:
+            raise ValueError("Instantánea incompleta")
+        # Solo los reclamados quedan en un dict (posición -> expiración)
+        posiciones = (i for i in range(n) if bits[i >> 3] & (1 << (i & 7)))
+        self.expiraciones = dict(zip(posiciones, expiraciones))
+        self.renovacion = timedelta(seconds=segundos)
+
+    def expiracion(self, h):
+        """None si la huella no existe; 0 si está pendiente; si no, epoch de expiración."""
+        i = bisect_left(self.huellas, h)
+        if i == len(self.huellas) or self.huellas[i] != h:
+            return None
+        return self.expiraciones.get(i, 0)
+
+# ---------------- VERIFICADOR SIN CONEXIÓN ----------------
+INTERVALO_INSTANTANEA = 60
+INTERVALO_SINCRONIZACION = 2
+LOTE_SINCRONIZACION = 500
+TIMEOUT = 6
+
+class VerificadorSinConexion:
+    """Verifica contra la última instantánea y sincroniza los reclamos en segundo plano.
+
+    Los reclamos locales se guardan en `archivo_cola` (JSONL) hasta que el
+    servidor confirma el lote; cada uno lleva un id propio, así reenviar un
+    lote tras un corte no reclama dos veces. El hilo de fondo nunca toca la
+    interfaz: solo actualiza `stats` y la lista `conflictos`.
+    """
+
+    def __init__(self, server_url, archivo_cola="reclamos_pendientes.jsonl", sesion=None):
+        import requests  # solo lo usa el cliente; el servidor importa este módulo para generar()
+        self.server_url = server_url
+        self.archivo_cola = archivo_cola
+        self._sesion = sesion or requests.Session()
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._instantanea = None
+        # Reclamos locales aún vigentes: se reaplican sobre cada instantánea nueva
+        self._locales = {}
+        self._cola = self._leer_cola()
+        self._archivo = open(self.archivo_cola, "a", encoding="utf-8")
+        self.conflictos = []
+        self.stats = {"verificaciones": 0, "reclamos_locales": 0, "sincronizados": 0,
+                      "conflictos": 0, "errores": 0, "version": None, "ultima_sincronizacion": None}
+        self._hilo = None
+
+    # ---------------- COLA PERSISTENTE ----------------
+    def _leer_cola(self):
+        if not os.path.exists(self.archivo_cola):
+            return []
+        with open(self.archivo_cola, encoding="utf-8") as f:
+            return [json.loads(linea) for linea in f if linea.strip()]
+
+    def _reescribir_cola(self):
+        self._archivo.close()
+        temporal = self.archivo_cola + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for reclamo in self._cola:
+                f.write(json.dumps(reclamo) + "\n")
+        os.replace(temporal, self.archivo_cola)
+        self._archivo = open(self.archivo_cola, "a", encoding="utf-8")
+
+    def pendientes(self):
+        with self._lock:
+            return len(self._cola)
+
+    # ---------------- VERIFICACIÓN LOCAL ----------------
+    @property
+    def disponible(self):
+        return self._instantanea is not None
+
+    def verificar(self, codigo):
+        """Decide localmente y encola el reclamo; devuelve "puede reclamar", "ya reclamado" o "no existe"."""
+        h = huella(codigo)
+        ahora = datetime.now()
+        with self._lock:
+            self.stats["verificaciones"] += 1
+            expira = self._locales.get(h)
+            if expira is None:
+                expira = self._instantanea.expiracion(h)
+                if expira is None:
+                    return "no existe"
+            if expira > ahora.timestamp():
+                return "ya reclamado"
+            self._locales[h] = (ahora + self._instantanea.renovacion).timestamp()
+            reclamo = {"id": str(uuid.uuid4()), "codigo": codigo, "escaneado": ahora.isoformat()}
+            self._cola.append(reclamo)
+            self._archivo.write(json.dumps(reclamo) + "\n")
+            self._archivo.flush()
+            self.stats["reclamos_locales"] += 1
+        self._despertar.set()
+        return "puede reclamar"
+
+    # ---------------- SEGUNDO PLANO ----------------
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="verificador-sin-conexion", daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        ultima_descarga = 0.0
+        while True:
+            # Sin red solo se cuenta el error; el siguiente ciclo reintenta
+            try:
+                while self.sincronizar():
+                    pass
+            except Exception:
+                self.stats["errores"] += 1
+            try:
+                if time.monotonic() - ultima_descarga >= INTERVALO_INSTANTANEA or not self.disponible:
+                    self.descargar()
+                    ultima_descarga = time.monotonic()
+            except Exception:
+                self.stats["errores"] += 1
+            self._despertar.wait(INTERVALO_SINCRONIZACION)
+            self._despertar.clear()
+
+    def descargar(self):
+        cabeceras = {}
+        if self._instantanea is not None:
+            cabeceras["If-None-Match"] = f'"{self._instantanea.version}"'
+        r = self._sesion.get(f"{self.server_url}/verificar/instantanea", headers=cabeceras, timeout=TIMEOUT)
+        if r.status_code == 304:
+            return
+        r.raise_for_status()
+        instantanea = Instantanea(r.content)
+        ahora = time.time()
+        with self._lock:
+            self._instantanea = instantanea
+            self._locales = {h: expira for h, expira in self._locales.items() if expira > ahora}
+            self.stats["version"] = instantanea.version
+
+    def sincronizar(self):
+        """Sube un lote de la cola; True si quedaron más por subir."""
+        with self._lock:
+            lote = self._cola[:LOTE_SINCRONIZACION]
+        if not lote:
+            return False
+        r = self._sesion.post(f"{self.server_url}/verificar/sincronizar",
+                              json={"reclamos": lote}, timeout=TIMEOUT)
+        r.raise_for_status()
+        resultados = r.json()["resultados"]
+        with self._lock:
+            for reclamo, resultado in zip(lote, resultados):
+                if resultado["status"] != "puede reclamar":
+                    # Otro verificador lo reclamó antes: el servidor decide
+                    self.conflictos.append(dict(resultado, escaneado=reclamo["escaneado"]))
+                    self.stats["conflictos"] += 1
+            enviados = {reclamo["id"] for reclamo in lote}
+            self._cola = [reclamo for reclamo in self._cola if reclamo["id"] not in enviados]
+            self._reescribir_cola()
+            self.stats["sincronizados"] += len(lote)
+            self.stats["ultima_sincronizacion"] = datetime.now().isoformat(timespec="seconds")
+            return bool(self._cola)
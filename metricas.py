@@ -0,0 +1,118 @@
+# metricas.py (métricas del proceso en formato de texto de Prometheus, para /metrics)
+#
+# Cada worker lleva sus propias métricas (proceso_pid indica cuál respondió).
+import os, threading
+from bisect import bisect_left
+
+# Límites superiores (segundos) de los histogramas de latencia
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_registro = []
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    pares += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self._lock = threading.Lock()
+        # Sin etiquetas la serie existe desde el inicio, en 0
+        self._valores = {} if self.etiquetas else {(): 0}
+        _registro.append(self)
+
+    def inc(self, *valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for valores, total in sorted(self._valores.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+class Histograma:
+    """Histograma acumulativo; observar() es un bisect y dos sumas bajo un lock."""
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+        _registro.append(self)
+
+    def observar(self, segundos, *valores):
+        i = bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += segundos
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((valores, list(conteos), suma) for valores, (conteos, suma) in self._series.items())
+        for valores, conteos, suma in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                etiquetas = _etiquetas(self.etiquetas, valores, [("le", limite)])
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {suma}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+class Medidor:
+    """Valor instantáneo leído al exponer; `funcion` devuelve un número o {etiquetas: número}."""
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self.funcion = funcion
+        _registro.append(self)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge"]
+        try:
+            valor = self.funcion()
+        except Exception:
+            return lineas
+        valores = valor if isinstance(valor, dict) else {(): valor}
+        for etiquetas, numero in sorted(valores.items()):
+            if numero is not None:
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {float(numero)}")
+        return lineas
+
+def exponer():
+    """Todas las métricas registradas en formato de texto de Prometheus."""
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+# ---------------- MÉTRICAS ----------------
+Medidor("proceso_pid", "PID del worker que generó esta respuesta", os.getpid)
+peticiones = Contador("http_peticiones_total", "Peticiones HTTP por ruta, método y código",
+                      ("ruta", "metodo", "codigo"))
+latencia = Histograma("http_latencia_segundos", "Tiempo hasta la respuesta (primer byte en streaming)",
+                      ("ruta", "metodo"))
+sqlite_sentencias = Histograma("sqlite_sentencia_segundos", "Duración de las sentencias SQLite por operación",
+                               ("operacion",))
+sqlite_bloqueos = Contador("sqlite_bloqueos_total", "Sentencias que fallaron con 'database is locked'")
+sqlite_esperas = Contador("sqlite_esperas_bloqueo_total",
+                          "Escrituras que tardaron más que ESPERA_BLOQUEO (esperaron el candado de escritura)")
+expiracion_examinadas = Contador("expiracion_filas_examinadas_total",
+                                 "Filas leídas del índice de reclamados para expirar o programar")
+expiracion_reseteadas = Contador("expiracion_filas_reseteadas_total", "Reclamos vencidos regresados a PENDIENTE")
+qr_render = Histograma("qr_render_segundos", "Tiempo de render de un QR que no estaba en caché", ("formato",))
+reclamos = Contador("reclamos_total", "Resultado de cada verificación", ("resultado", "origen"))
+bitacora_eventos = Contador("bitacora_eventos_total",
+                            "Eventos de la bitácora de reclamos escritos o descartados (cola llena)", ("estado",))
+bitacora_commit = Histograma("bitacora_commit_segundos", "Duración de cada commit agrupado de la bitácora")
@@ -0,0 +1,212 @@
+# migraciones.py (esquema versionado de la base, aplicado una sola vez)
+#
+# Uso:  python migraciones.py            # DB_NAME y, con DB_FRAGMENTOS, cada fragmento
+#       python migraciones.py --estado   # versión de cada archivo, sin cambiar nada
+#
+# PRAGMA user_version guarda cuántas migraciones tiene aplicadas cada archivo.
+# Con gunicorn se aplican en el proceso maestro antes de crear los workers
+# (gunicorn.conf.py); al importar server.py un worker solo lee el pragma.
+# Para cambiar el esquema se agrega una función al final de MIGRACIONES; las
+# que ya existen no se editan, porque hay bases que ya las tienen aplicadas.
+# Por eso cada migración lleva su propio DDL en lugar de llamar a los
+# crear_* de database.py, que describen el esquema actual (los usa
+# compactar.py al reconstruir la tabla) y sí cambian con el tiempo.
+import argparse, json, os, sqlite3, sys
+import database
+
+# ---------------- MIGRACIONES ----------------
+_TABLA_BENEFICIARIOS = """
+    CREATE TABLE IF NOT EXISTS {tabla} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        curp TEXT UNIQUE NOT NULL,
+        codigo_unico TEXT UNIQUE NOT NULL,
+        status TEXT DEFAULT 'PENDIENTE',
+        fecha_reclamo TEXT,
+        fecha_expira TEXT
+    )
+"""
+
+def _tabla_beneficiarios(conn):
+    """1: tabla principal; las bases muy viejas no tenían las columnas de fechas."""
+    conn.execute(_TABLA_BENEFICIARIOS.format(tabla="beneficiarios"))
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(beneficiarios)")}
+    for columna in ("fecha_reclamo", "fecha_expira"):
+        if columna not in columnas:
+            conn.execute(f"ALTER TABLE beneficiarios ADD COLUMN {columna} TEXT")
+
+def _status_pendiente(conn):
+    """2: las bases creadas con database.init_db tenían DEFAULT 'no reclamado'.
+
+    Ese status nunca lo reconoce la expiración ni el reclamo. SQLite no
+    cambia el DEFAULT de una columna, así que la tabla se reconstruye (la
+    migración 3 vuelve a crear índices y triggers).
+    """
+    status = [fila for fila in conn.execute("PRAGMA table_info(beneficiarios)") if fila[1] == "status"]
+    if status and status[0][4] == "'no reclamado'":
+        secuencia = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='beneficiarios'").fetchone()
+        conn.execute(_TABLA_BENEFICIARIOS.format(tabla="beneficiarios_nueva"))
+        conn.execute("""
+            INSERT INTO beneficiarios_nueva (id, nombre, curp, codigo_unico, status, fecha_reclamo, fecha_expira)
+            SELECT id, nombre, curp, codigo_unico, status, fecha_reclamo, fecha_expira FROM beneficiarios
+        """)
+        conn.execute("DROP TABLE beneficiarios")
+        conn.execute("ALTER TABLE beneficiarios_nueva RENAME TO beneficiarios")
+        if secuencia:
+            conn.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name='beneficiarios'", secuencia)
+    conn.execute("UPDATE beneficiarios SET status='PENDIENTE' WHERE status IS NULL OR status='no reclamado'")
+
+_ESQUEMA_SECUNDARIO = [
+    # Índice parcial de expiración y orden alfabético paginado
+    "CREATE INDEX IF NOT EXISTS idx_reclamados_expira ON beneficiarios(fecha_expira) WHERE status='RECLAMADO'",
+    "CREATE INDEX IF NOT EXISTS idx_beneficiarios_nombre ON beneficiarios(nombre, id)",
+    "CREATE TABLE IF NOT EXISTS configuracion (clave TEXT PRIMARY KEY, valor)",
+    "INSERT OR IGNORE INTO configuracion (clave, valor) VALUES ('version', 0)",
+    """CREATE TABLE IF NOT EXISTS reclamos_sincronizados (
+        id TEXT PRIMARY KEY,
+        codigo_unico TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        nombre TEXT,
+        escaneado TEXT NOT NULL,
+        recibido TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS reclamos (
+        id INTEGER PRIMARY KEY,
+        momento TEXT NOT NULL,
+        codigo_unico TEXT NOT NULL,
+        id_beneficiario INTEGER,
+        resultado TEXT NOT NULL,
+        origen TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_reclamos_codigo ON reclamos(codigo_unico, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reclamos_beneficiario ON reclamos(id_beneficiario, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reclamos_momento ON reclamos(momento)",
+    *(f"""CREATE TRIGGER IF NOT EXISTS reclamos_sin_{evento.lower()} BEFORE {evento} ON reclamos BEGIN
+        SELECT RAISE(ABORT, 'la bitácora de reclamos es de solo agregar');
+    END""" for evento in ("UPDATE", "DELETE")),
+]
+
+_BUSQUEDA = [
+    """CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_ai AFTER INSERT ON beneficiarios BEGIN
+        INSERT INTO beneficiarios_fts(rowid, nombre, curp) VALUES (new.id, new.nombre, new.curp);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_ad AFTER DELETE ON beneficiarios BEGIN
+        INSERT INTO beneficiarios_fts(beneficiarios_fts, rowid, nombre, curp)
+        VALUES ('delete', old.id, old.nombre, old.curp);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS beneficiarios_fts_au AFTER UPDATE OF nombre, curp ON beneficiarios BEGIN
+        INSERT INTO beneficiarios_fts(beneficiarios_fts, rowid, nombre, curp)
+        VALUES ('delete', old.id, old.nombre, old.curp);
+        INSERT INTO beneficiarios_fts(rowid, nombre, curp) VALUES (new.id, new.nombre, new.curp);
+    END""",
+]
+
+_CAMBIOS = [
+    """CREATE TABLE IF NOT EXISTS cambios (
+        id_beneficiario INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL UNIQUE,
+        borrado INTEGER NOT NULL DEFAULT 0
+    )""",
+    *(f"""CREATE TRIGGER IF NOT EXISTS beneficiarios_cambios_{evento.lower()}
+        AFTER {evento} ON beneficiarios BEGIN
+            INSERT INTO cambios (id_beneficiario, version, borrado)
+            VALUES ({fila}.id, (SELECT IFNULL(MAX(version), 0) + 1 FROM cambios), {borrado})
+            ON CONFLICT(id_beneficiario) DO UPDATE SET version=excluded.version, borrado=excluded.borrado;
+        END""" for evento, fila, borrado in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1))),
+]
+
+def _existe(conn, nombre):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (nombre,)).fetchone() is not None
+
+def _esquema_secundario(conn):
+    """3: índices, FTS, configuración, sincronización, cambios y bitácora."""
+    for sql in _ESQUEMA_SECUNDARIO:
+        conn.execute(sql)
+    habia_busqueda = _existe(conn, "beneficiarios_fts")
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS beneficiarios_fts USING fts5(
+                nombre, curp,
+                content='beneficiarios', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite compilado sin FTS5: database.buscar() usa LIKE por prefijo
+        pass
+    else:
+        for sql in _BUSQUEDA:
+            conn.execute(sql)
+        if not habia_busqueda:
+            conn.execute("INSERT INTO beneficiarios_fts(beneficiarios_fts) VALUES ('rebuild')")
+    habia_cambios = _existe(conn, "cambios")
+    for sql in _CAMBIOS:
+        conn.execute(sql)
+    if not habia_cambios:
+        conn.execute("INSERT INTO cambios (id_beneficiario, version) SELECT id, id FROM beneficiarios")
+
+MIGRACIONES = [_tabla_beneficiarios, _status_pendiente, _esquema_secundario]
+VERSION = len(MIGRACIONES)
+
+# ---------------- APLICACIÓN ----------------
+def version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar(ruta):
+    """Aplica lo pendiente en `ruta`; devuelve (versión anterior, versión final).
+
+    Si ya está al día solo lee el pragma. Si no, toma el candado de
+    escritura y vuelve a leerlo: de varios procesos que arrancan a la vez
+    solo el primero migra.
+    """
+    conn = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    try:
+        anterior = version(conn)
+        if anterior >= VERSION:
+            return anterior, anterior
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            anterior = version(conn)
+            for migracion in MIGRACIONES[anterior:]:
+                migracion(conn)
+            # user_version es parte de la transacción: si algo falla no avanza
+            conn.execute(f"PRAGMA user_version={max(anterior, VERSION)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return anterior, max(anterior, VERSION)
+    finally:
+        conn.close()
+
+def rutas():
+    """La base principal y, con DB_FRAGMENTOS, cada fragmento."""
+    return list(dict.fromkeys([database.DB_NAME, *database.rutas_fragmentos()]))
+
+def aplicar_todas():
+    """{ruta: (versión anterior, versión final)} de todos los archivos."""
+    return {ruta: aplicar(ruta) for ruta in rutas()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema")
+    parser.add_argument("--estado", action="store_true", help="solo mostrar la versión de cada archivo")
+    args = parser.parse_args(argv)
+    if args.estado:
+        estado = {}
+        for ruta in rutas():
+            if not os.path.exists(ruta):
+                estado[ruta] = None
+                continue
+            conn = sqlite3.connect(ruta)
+            estado[ruta] = version(conn)
+            conn.close()
+        print(json.dumps({"version_codigo": VERSION, "archivos": estado}, indent=2))
+        return 0
+    for ruta, (anterior, final) in aplicar_todas().items():
+        print(f"{ruta}: {anterior} -> {final}" if anterior != final else f"{ruta}: al día ({final})",
+              file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,64 +1,85 @@
-from flask import Flask, request, jsonify, render_template, Response
-import sqlite3, uuid, qrcode, os
-from io import BytesIO
-import base64
+from flask import Flask, request, jsonify, render_template, Response, g
+import os, threading, time
 from datetime import datetime, timedelta
 from admin_app import admin_bp
+import database
+import migraciones
+from almacen import almacen
+import generador_qr
+from expiracion import programador
+from indice_codigos import indice
+import instantanea
+import metricas
+import antirrebote
+from antirrebote import escaneos_recientes, limitador
+from bitacora import bitacora
+from configuracion import configuracion, segundos_renovacion, CLAVE_TIEMPO
 # ---------------- CONFIGURACIÓN DE RUTA ABSOLUTA ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 app = Flask(__name__, template_folder=TEMPLATES_DIR)
-def ensure_schema():
-    conn = sqlite3.connect("beneficiarios.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS beneficiarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            curp TEXT UNIQUE NOT NULL,
-            codigo_unico TEXT UNIQUE NOT NULL,
-            status TEXT DEFAULT 'PENDIENTE',
-            fecha_reclamo TEXT,
-            fecha_expira TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# Llamar al inicio
-ensure_schema()
+# Esquema al día antes de atender. Con gunicorn ya lo hizo el maestro
+# (gunicorn.conf.py) y aquí solo se lee PRAGMA user_version de cada archivo.
+migraciones.aplicar_todas()
 
 
 # ---------------- CONFIGURACIÓN DE TIEMPO DE RENOVACIÓN ----------------
-# Valor por defecto: 10 segundos (para pruebas)
-TIEMPO_RENOVACION = timedelta(seconds=10)
-
-# ---------------- CONEXIÓN A LA BASE ----------------
-def db_connection():
-    conn = sqlite3.connect("beneficiarios.db")
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# ---------------- FUNCIÓN DE LIMPIEZA ----------------
-def limpiar_expirados():
-    """Resetea a PENDIENTE todos los beneficiarios RECLAMADO cuyo tiempo ya expiró."""
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, fecha_expira FROM beneficiarios WHERE status='RECLAMADO'")
-    rows = cursor.fetchall()
-    cambios = 0
-    for row in rows:
-        if row["fecha_expira"] and datetime.fromisoformat(row["fecha_expira"]) < datetime.now():
-            cursor.execute("""
-                UPDATE beneficiarios
-                SET status='PENDIENTE', fecha_reclamo=NULL, fecha_expira=NULL
-                WHERE id=?
-            """, (row["id"],))
-            cambios += 1
-    conn.commit()
-    conn.close()
-    return cambios
+# Se guarda en la base para que todos los workers usen el mismo valor;
+# configuracion.tiempo_renovacion() lo lee de una caché local.
+
+# ---------------- ACCESO A LA BASE ----------------
+# Los beneficiarios se leen y escriben con `almacen` (un archivo o, con
+# DB_FRAGMENTOS, varios); configuración y bitácora quedan en DB_NAME.
+
+# ---------------- EXPIRACIÓN EN SEGUNDO PLANO ----------------
+# Un solo worker por despliegue resetea los reclamos vencidos; los handlers
+# no pagan ese costo (el reclamo ya trata como libre un QR vencido).
+programador.iniciar()
+
+# ---------------- ÍNDICE DE CÓDIGOS EN MEMORIA ----------------
+# Cada worker carga sus códigos válidos; los desconocidos se rechazan sin SQLite
+indice.cargar_en_segundo_plano()
+
+CODIGO_NO_ENCONTRADO = """
+        <html><body style="background-color: gray; color: white; text-align:center;">
+        <h1 style="font-size:50px;">❌ CÓDIGO NO ENCONTRADO</h1>
+        </body></html>
+        """
+
+# ---------------- MÉTRICAS ----------------
+# Conteo y latencia por ruta (la plantilla de la ruta, no la URL, para no
+# crear una serie por código). Cubre también las rutas de /admin.
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(respuesta):
+    inicio = g.pop("inicio_peticion", None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+        metricas.latencia.observar(time.perf_counter() - inicio, ruta, request.method)
+        metricas.peticiones.inc(ruta, request.method, respuesta.status_code)
+    return respuesta
+
+@app.route("/metrics")
+def metrics():
+    return Response(metricas.exponer(), mimetype="text/plain; version=0.0.4")
+
+metricas.Medidor("bd_pool_conexiones", "Conexiones del pool por estado",
+                 lambda: {(k,): v for k, v in database.estadisticas_pool().items() if k in ("en_uso", "ociosas")},
+                 ("estado",))
+metricas.Medidor("qr_cache_eventos", "Aciertos y fallos de la caché de QR",
+                 lambda: {(k,): v for k, v in generador_qr.cache_qr.stats.items() if k != "segundos_render"},
+                 ("evento",))
+metricas.Medidor("indice_codigos", "Códigos cargados en el índice en memoria",
+                 lambda: indice.estadisticas()["codigos"])
+metricas.Medidor("bitacora_pendientes", "Eventos de la bitácora en cola, aún sin escribir", bitacora.pendientes)
+metricas.Medidor("escaneos_repetidos_eventos", "Escaneos del mismo código y dispositivo dentro de la ventana",
+                 lambda: {(k,): v for k, v in escaneos_recientes.stats.items()}, ("evento",))
+metricas.Medidor("limitador_dispositivos_eventos", "Escaneos permitidos o limitados por la cubeta del dispositivo",
+                 lambda: {(k,): v for k, v in limitador.stats.items()}, ("evento",))
 
 # ---------------- AUTENTICACIÓN BÁSICA PARA PANEL ----------------
 USERNAME = "cerati"
@@ -90,167 +111,268 @@ def index():
 # ---------------- REGISTRO DE USUARIO ----------------
 @app.route("/registrar", methods=["POST"])
 def registrar():
-    nombre = request.form["nombre"].strip().upper()
-    curp = request.form["curp"].strip().upper()
-
     # Validaciones
-    if len(curp) != 18:
-        return "❌ La CURP debe tener exactamente 18 caracteres"
-
-    conn = db_connection()
-    cursor = conn.cursor()
+    nombre, curp, error = database.normalizar_registro(request.form["nombre"], request.form["curp"])
+    if error:
+        return f"❌ {error}"
 
-    # Verificar duplicados
-    cursor.execute("SELECT 1 FROM beneficiarios WHERE nombre=? OR curp=?", (nombre, curp))
-    existe = cursor.fetchone()
-    if existe:
-        conn.close()
+    # Insertar solo si no hay duplicados (verificación e inserción atómicas)
+    codigo = almacen.registrar(nombre, curp)
+    if not codigo:
         return "❌ El nombre o la CURP ya están registrados"
+    indice.agregar(codigo)
 
-    # Insertar si pasa validaciones
-    codigo = str(uuid.uuid4())
-    cursor.execute("""
-        INSERT INTO beneficiarios (nombre, curp, codigo_unico, status) 
-        VALUES (?,?,?,?)
-    """, (nombre, curp, codigo, "PENDIENTE"))
-    conn.commit()
-    conn.close()
-
-    # Generar QR con la URL completa de verificación
-    BASE_URL = os.getenv("BASE_URL", "http://localhost:5000")
-    url_qr = f"{BASE_URL}/verificar/{codigo}"
-
-    qr_img = qrcode.make(url_qr)
-    buffer = BytesIO()
-    qr_img.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
+    # El QR se sirve (y se cachea) desde /qr/<codigo>.png
     return f"""
     <h1>Registro exitoso</h1>
     <p>Nombre: {nombre}</p>
     <p>CURP: {curp}</p>
     <p>Escanea este QR para verificar:</p>
-    <img src="data:image/png;base64,{qr_base64}">
+    <img src="/qr/{codigo}.png">
+    <p><a href="/qr/{codigo}.svg">Descargar en SVG</a></p>
     """
 
-# ---------------- VERIFICACIÓN POR URL (GET) ----------------
-@app.route("/verificar/<codigo>", methods=["GET"])
-def verificar_codigo(codigo):
-    limpiar_expirados()
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM beneficiarios WHERE codigo_unico=?", (codigo,))
-    row = cursor.fetchone()
-
-    if not row:
-        conn.close()
-        return """
-        <html><body style="background-color: gray; color: white; text-align:center;">
-        <h1 style="font-size:50px;">❌ CÓDIGO NO ENCONTRADO</h1>
-        </body></html>
-        """, 404
-        
-    id_ = row["id"]
+# ---------------- IMAGEN QR (PNG / SVG) ----------------
+TIPOS_QR = {"png": "image/png", "svg": "image/svg+xml"}
+
+@app.route("/qr/<codigo>.<formato>", methods=["GET"])
+def imagen_qr(codigo, formato):
+    if formato not in TIPOS_QR:
+        return "Formato no soportado", 404
+    # Sin pasar por el índice: la página de /registrar pide la imagen enseguida
+    # y puede llegar a otro worker antes de que su sondeo vea el alta
+    if not almacen.existe_codigo(codigo):
+        return "❌ Código no encontrado", 404
+
+    clave, datos = generador_qr.cache_qr.obtener(codigo, formato)
+    resp = Response(datos, mimetype=TIPOS_QR[formato])
+    resp.set_etag(clave)
+    resp.headers["Cache-Control"] = "public, max-age=86400"
+    return resp.make_conditional(request)
+
+# ---------------- RESULTADOS DE VERIFICACIÓN ----------------
+# Compartidos con el servidor asíncrono (server_async.py)
+def pagina_verificacion(estado, row):
+    """HTML y código HTTP del resultado de escanear un QR por URL."""
+    if estado == "no existe":
+        return CODIGO_NO_ENCONTRADO, 404
+
     nombre = row["nombre"]
     curp = row["curp"]
-    status = row["status"]
-    fecha_expira = row["fecha_expira"]
-
-    if status == "RECLAMADO":
-        if fecha_expira and datetime.fromisoformat(fecha_expira) < datetime.now():
-            cursor.execute("""
-                UPDATE beneficiarios 
-                SET status=?, fecha_reclamo=NULL, fecha_expira=NULL 
-                WHERE id=?
-            """, ("PENDIENTE", id_))
-            conn.commit()
-            status = "PENDIENTE"
-        else:
-            conn.close()
-            return f"""
-            <html><body style="background-color: red; color: white; text-align:center;">
-            <h1 style="font-size:50px;">🟥 {nombre} ({curp}) YA RECLAMÓ</h1>
-            </body></html>
-            """
-
-    if status == "PENDIENTE":
-        expira = datetime.now() + TIEMPO_RENOVACION
-        cursor.execute("""
-            UPDATE beneficiarios 
-            SET status=?, fecha_reclamo=?, fecha_expira=? 
-            WHERE id=?
-        """, ("RECLAMADO", datetime.now().isoformat(), expira.isoformat(), id_))
-        conn.commit()
-        conn.close()
+
+    if estado == "ya reclamado":
         return f"""
-        <html><body style="background-color: green; color: white; text-align:center;">
-        <h1 style="font-size:50px;">🟩 {nombre} ({curp}) VALIDADO</h1>
-        <p>Marcado como RECLAMADO hasta {expira.strftime("%H:%M:%S")}</p>
+        <html><body style="background-color: red; color: white; text-align:center;">
+        <h1 style="font-size:50px;">🟥 {nombre} ({curp}) YA RECLAMÓ</h1>
         </body></html>
-        """
+        """, 200
+
+    expira = database.a_fecha(row["fecha_expira"])
+    return f"""
+    <html><body style="background-color: green; color: white; text-align:center;">
+    <h1 style="font-size:50px;">🟩 {nombre} ({curp}) VALIDADO</h1>
+    <p>Marcado como RECLAMADO hasta {expira.strftime("%H:%M:%S")}</p>
+    </body></html>
+    """, 200
+
+def registrar_evento(codigo, estado, row, origen, momento=None):
+    """Deja la verificación en la bitácora de reclamos (escritura diferida)."""
+    bitacora.registrar(codigo, estado, origen, row["id"] if row else None, momento)
+
+def reclamar_escaneo(codigo, dispositivo, origen):
+    """Reclama un código ya aceptado por el índice; un repetido recibe el resultado original."""
+    previo = escaneos_recientes.obtener(codigo, dispositivo)
+    if previo is not None:
+        metricas.reclamos.inc(previo[0], "repetido")
+        return previo
+    estado, row = almacen.reclamar(codigo, configuracion.tiempo_renovacion())
+    registrar_evento(codigo, estado, row, origen)
+    if estado == "puede reclamar":
+        programador.programar(row["fecha_expira"])
+    escaneos_recientes.guardar(codigo, dispositivo, (estado, row))
+    return estado, row
+
+def resultado_json(estado, row):
+    if estado == "no existe":
+        return {"status": "no existe"}
+    return {"status": estado, "nombre": row["nombre"]}
+
+# ---------------- ESCANEOS REPETIDOS Y LÍMITE POR DISPOSITIVO ----------------
+# Ver antirrebote.py. Los lectores se identifican con la cabecera X-Dispositivo;
+# sin ella no hay ventana de repetidos ni cubeta (detrás del proxy de Render
+# la IP es la del proxy, la misma para todos).
+DEMASIADOS_ESCANEOS = """
+<html><body style="background-color: orange; color: white; text-align:center;">
+<h1 style="font-size:50px;">⏳ DEMASIADOS ESCANEOS, ESPERA UN MOMENTO</h1>
+</body></html>
+"""
+
+def dispositivo_actual():
+    return antirrebote.identificar(request.headers.get(antirrebote.CABECERA_DISPOSITIVO))
+
+# ---------------- VERIFICACIÓN POR URL (GET) ----------------
+@app.route("/verificar/<codigo>", methods=["GET"])
+def verificar_codigo(codigo):
+    dispositivo = dispositivo_actual()
+    espera = limitador.permitir(dispositivo)
+    if espera:
+        return DEMASIADOS_ESCANEOS, 429, {"Retry-After": antirrebote.segundos_reintento(espera)}
+    if not indice.puede_existir(codigo):
+        metricas.reclamos.inc("no existe", "indice")
+        registrar_evento(codigo, "no existe", None, "url")
+        return CODIGO_NO_ENCONTRADO, 404
+
+    estado, row = reclamar_escaneo(codigo, dispositivo, "url")
+    return pagina_verificacion(estado, row)
 
 # ---------------- VERIFICACIÓN POR JSON (POST) ----------------
 @app.route("/verificar", methods=["POST"])
 def verificar_post():
-    limpiar_expirados()
+    dispositivo = dispositivo_actual()
+    espera = limitador.permitir(dispositivo)
+    if espera:
+        return jsonify({"error": "Demasiados escaneos desde este dispositivo"}), 429, \
+            {"Retry-After": antirrebote.segundos_reintento(espera)}
     data = request.json
     codigo = data.get("codigo")
-
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM beneficiarios WHERE codigo_unico=?", (codigo,))
-    row = cursor.fetchone()
-
-    if not row:
+    if not isinstance(codigo, str) or not indice.puede_existir(codigo):
+        metricas.reclamos.inc("no existe", "indice")
+        registrar_evento(codigo, "no existe", None, "post")
         return jsonify({"status": "no existe"})
 
-    id_ = row["id"]
-    nombre = row["nombre"]
-    status = row["status"]
-    fecha_expira = row["fecha_expira"]
-
-    if status == "RECLAMADO":
-        if fecha_expira and datetime.fromisoformat(fecha_expira) < datetime.now():
-            cursor.execute("""
-                UPDATE beneficiarios 
-                SET status=?, fecha_reclamo=NULL, fecha_expira=NULL 
-                WHERE id=?
-            """, ("PENDIENTE", id_))
-            conn.commit()
-            status = "PENDIENTE"
+    estado, row = reclamar_escaneo(codigo, dispositivo, "post")
+    return jsonify(resultado_json(estado, row))
+
+# ---------------- VERIFICACIÓN POR LOTE (POST) ----------------
+# Escáneres que acumularon códigos sin red los suben de una sola vez
+LOTE_MAX = 1000
+
+def momento_escaneo(escaneado, ahora):
+    """Hora del escaneo en el cliente (hora local), sin permitir fechas futuras."""
+    if not escaneado:
+        return ahora
+    momento = datetime.fromisoformat(escaneado)
+    if momento.tzinfo is not None:
+        momento = momento.astimezone().replace(tzinfo=None)
+    return min(momento, ahora)
+
+@app.route("/verificar/lote", methods=["POST"])
+def verificar_lote():
+    data = request.get_json(silent=True)
+    items = data.get("codigos") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Se esperaba una lista 'codigos'"}), 400
+    if len(items) > LOTE_MAX:
+        return jsonify({"error": f"Máximo {LOTE_MAX} códigos por lote"}), 400
+
+    ahora = datetime.now()
+    escaneos = []
+    for item in items:
+        if isinstance(item, dict):
+            codigo = item.get("codigo")
+            escaneado = item.get("escaneado")
         else:
-            conn.close()
-            return jsonify({"status": "ya reclamado", "nombre": nombre})
-
-    expira = datetime.now() + TIEMPO_RENOVACION
-    cursor.execute("""
-        UPDATE beneficiarios 
-        SET status=?, fecha_reclamo=?, fecha_expira=? 
-        WHERE id=?
-    """, ("RECLAMADO", datetime.now().isoformat(), expira.isoformat(), id_))
-    conn.commit()
-    conn.close()
-
-    return jsonify({"status": "puede reclamar", "nombre": nombre})
+            codigo, escaneado = item, None
+        if not isinstance(codigo, str):
+            return jsonify({"error": "Cada elemento necesita un 'codigo'"}), 400
+        try:
+            momento = momento_escaneo(escaneado, ahora)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Fecha de escaneo inválida: {escaneado}"}), 400
+        escaneos.append((codigo, momento))
+
+    # Los códigos que el índice descarta no llegan a la transacción
+    resultados = [("no existe", None)] * len(escaneos)
+    conocidos = [i for i, (codigo, _) in enumerate(escaneos) if indice.puede_existir(codigo)]
+    metricas.reclamos.inc("no existe", "indice", cantidad=len(escaneos) - len(conocidos))
+    if conocidos:
+        reclamos = almacen.reclamar_lote([escaneos[i] for i in conocidos], configuracion.tiempo_renovacion())
+        for i, resultado in zip(conocidos, reclamos):
+            resultados[i] = resultado
+
+    respuesta = []
+    for (codigo, momento), (estado, row) in zip(escaneos, resultados):
+        registrar_evento(codigo, estado, row, "lote", momento)
+        if estado == "puede reclamar":
+            programador.programar(row["fecha_expira"])
+        respuesta.append(dict(codigo=codigo, **resultado_json(estado, row)))
+    return jsonify({"resultados": respuesta})
+
+# ---------------- VERIFICACIÓN SIN CONEXIÓN ----------------
+# Los verificadores de escritorio descargan la instantánea y suben sus reclamos
+# con un id por reclamo; reenviar un lote no reclama dos veces.
+INSTANTANEA_TTL = float(os.getenv("INSTANTANEA_TTL", 5))
+_instantanea = {"version": None, "datos": b"", "creada": 0.0}
+_instantanea_lock = threading.Lock()
+
+def instantanea_actual():
+    """La instantánea de este worker, regenerada como mucho cada INSTANTANEA_TTL segundos."""
+    with _instantanea_lock:
+        if time.monotonic() - _instantanea["creada"] >= INSTANTANEA_TTL:
+            version, datos = instantanea.generar(almacen.instantanea(), configuracion.tiempo_renovacion())
+            _instantanea.update(version=version, datos=datos, creada=time.monotonic())
+        return _instantanea["version"], _instantanea["datos"]
+
+@app.route("/verificar/instantanea", methods=["GET"])
+def verificar_instantanea():
+    version, datos = instantanea_actual()
+    respuesta = Response(datos, mimetype="application/octet-stream")
+    respuesta.set_etag(str(version))
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta.make_conditional(request)
+
+@app.route("/verificar/sincronizar", methods=["POST"])
+def verificar_sincronizar():
+    data = request.get_json(silent=True)
+    items = data.get("reclamos") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Se esperaba una lista 'reclamos'"}), 400
+    if len(items) > LOTE_MAX:
+        return jsonify({"error": f"Máximo {LOTE_MAX} reclamos por lote"}), 400
+
+    ahora = datetime.now()
+    reclamos = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), str) \
+                or not isinstance(item.get("codigo"), str):
+            return jsonify({"error": "Cada reclamo necesita 'id' y 'codigo'"}), 400
+        try:
+            momento = momento_escaneo(item.get("escaneado"), ahora)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Fecha de escaneo inválida: {item.get('escaneado')}"}), 400
+        reclamos.append((item["id"], item["codigo"], momento))
+
+    resultados = almacen.sincronizar(reclamos, configuracion.tiempo_renovacion())
+
+    respuesta = []
+    for (id_, codigo, momento), (estado, nombre, repetido, row) in zip(reclamos, resultados):
+        if not repetido:
+            # Un reintento del mismo id ya quedó en la bitácora la primera vez
+            registrar_evento(codigo, estado, row, "sincronizacion", momento)
+        if estado == "puede reclamar" and not repetido:
+            programador.programar(database.fecha_iso(momento + configuracion.tiempo_renovacion()))
+        respuesta.append({"id": id_, "codigo": codigo, "status": estado, "nombre": nombre,
+                          "repetido": repetido})
+    return jsonify({"resultados": respuesta})
 
 # ---------------- ENDPOINT PARA CONFIGURAR TIEMPO ----------------
 @app.route("/configurar_tiempo", methods=["POST"])
 def configurar_tiempo():
-    global TIEMPO_RENOVACION
-    data = request.json
-    if "segundos" in data:
-        TIEMPO_RENOVACION = timedelta(seconds=data["segundos"])
-    elif "horas" in data:
-        TIEMPO_RENOVACION = timedelta(hours=data["horas"])
-    else:
+    segundos = segundos_renovacion(request.get_json(silent=True) or {})
+    if segundos is None:
         return jsonify({"error": "Parámetros inválidos"}), 400
-    return jsonify({"mensaje": f"Tiempo de renovación actualizado a {TIEMPO_RENOVACION}"}), 200
+    configuracion.guardar(**{CLAVE_TIEMPO: segundos})
+    return jsonify({"mensaje": f"Tiempo de renovación actualizado a {timedelta(seconds=segundos)}"}), 200
 
 # ---------------- ENDPOINT DE LIMPIEZA GENERAL ----------------
 @app.route("/limpiar", methods=["POST"])
 def limpiar_endpoint():
-    cambios = limpiar_expirados()
-    return jsonify({"mensaje": f"Se limpiaron {cambios} registros expirados"}), 200
+    """Disparo manual: ejecuta un barrido ahora e informa lo que hizo el programador."""
+    cambios = programador.ejecutar()
+    return jsonify({
+        "mensaje": f"Se limpiaron {cambios} registros expirados",
+        "programador": programador.estadisticas(),
+    }), 200
 
 # ---------------- PANEL DE CONTROL (PROTEGIDO) ----------------
 # Registrar el blueprint con prefijo /admin
@@ -0,0 +1,190 @@
+# server_async.py (modo asíncrono ASGI para la verificación con muchos escáneres)
+#
+# Mismas rutas y respuestas que server.py para GET /verificar/<codigo> y
+# POST /verificar, pero en un event loop: un solo proceso atiende cientos de
+# escaneos simultáneos.
+#
+# Uso:  uvicorn server_async:app --host 0.0.0.0 --port $PORT
+import asyncio, json, queue, threading
+from datetime import datetime
+import database
+import metricas
+import server
+import antirrebote
+from almacen import almacen
+from antirrebote import escaneos_recientes, limitador
+from bitacora import bitacora
+from configuracion import configuracion
+from expiracion import programador
+from indice_codigos import indice
+
+# Reclamos máximos por commit de grupo
+MAX_LOTE = 256
+
+# ---------------- ESCRITOR ÚNICO CON COMMIT DE GRUPO ----------------
+class EscritorReclamos:
+    """Hilo dueño de la única conexión de escritura del proceso.
+
+    Los reclamos que llegan mientras se confirma el lote anterior se juntan
+    y se aplican en una sola transacción (commit de grupo), así el costo de
+    fsync se reparte entre todos los escaneos concurrentes. Con
+    DB_FRAGMENTOS hay un escritor por fragmento (`ruta`).
+    """
+
+    def __init__(self, max_lote=MAX_LOTE, ruta=None):
+        self.max_lote = max_lote
+        self.ruta = ruta
+        self._cola = queue.SimpleQueue()
+        self._hilo = None
+        self.stats = {"reclamos": 0, "commits": 0, "lote_maximo": 0}
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="escritor-reclamos", daemon=True)
+            self._hilo.start()
+
+    async def reclamar(self, codigo):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._cola.put((codigo, datetime.now(), futuro, loop))
+        return await futuro
+
+    def _ciclo(self):
+        conn = database.get_conn(self.ruta)
+        while True:
+            lote = [self._cola.get()]
+            while len(lote) < self.max_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                escaneos = [(codigo, momento) for codigo, momento, _, _ in lote]
+                resultados = database.reclamar_lote(conn, escaneos, configuracion.tiempo_renovacion())
+            except Exception as error:
+                for _, _, futuro, loop in lote:
+                    loop.call_soon_threadsafe(_rechazar, futuro, error)
+                continue
+            self.stats["reclamos"] += len(lote)
+            self.stats["commits"] += 1
+            self.stats["lote_maximo"] = max(self.stats["lote_maximo"], len(lote))
+            for (_, _, futuro, loop), resultado in zip(lote, resultados):
+                loop.call_soon_threadsafe(_resolver, futuro, resultado)
+
+def _resolver(futuro, resultado):
+    # El cliente pudo haberse desconectado (futuro cancelado)
+    if not futuro.done():
+        futuro.set_result(resultado)
+
+def _rechazar(futuro, error):
+    if not futuro.done():
+        futuro.set_exception(error)
+
+# Un escritor por archivo: los fragmentos confirman sus lotes en paralelo
+escritores = {fragmento: EscritorReclamos(ruta=fragmento.ruta) for fragmento in almacen.fragmentos}
+
+def iniciar_escritores():
+    for escritor in escritores.values():
+        escritor.iniciar()
+
+# ---------------- HTTP ----------------
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+async def _responder(send, estado_http, cuerpo, tipo, cabeceras=()):
+    await send({
+        "type": "http.response.start",
+        "status": estado_http,
+        "headers": [(b"content-type", tipo), (b"content-length", str(len(cuerpo)).encode()), *cabeceras],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+async def _responder_json(send, datos, estado_http=200):
+    await _responder(send, estado_http, json.dumps(datos).encode(), b"application/json")
+
+def _dispositivo(scope):
+    # Igual que server.dispositivo_actual: sin cabecera no hay ventana ni cubeta
+    cabecera = dict(scope["headers"]).get(antirrebote.CABECERA_DISPOSITIVO.lower().encode())
+    return antirrebote.identificar(cabecera.decode("latin-1") if cabecera else None)
+
+async def _reclamar(codigo, dispositivo, origen):
+    # Mismo camino que server.reclamar_escaneo, con el escritor del fragmento.
+    # El índice responde solo en memoria (sondea en su hilo): no bloquea el loop
+    if not isinstance(codigo, str) or not indice.puede_existir(codigo):
+        metricas.reclamos.inc("no existe", "indice")
+        server.registrar_evento(codigo, "no existe", None, origen)
+        return "no existe", None
+    previo = escaneos_recientes.obtener(codigo, dispositivo)
+    if previo is not None:
+        metricas.reclamos.inc(previo[0], "repetido")
+        return previo
+    estado, row = await escritores[almacen.fragmento(codigo)].reclamar(codigo)
+    server.registrar_evento(codigo, estado, row, origen)
+    if estado == "puede reclamar":
+        programador.programar(row["fecha_expira"])
+    escaneos_recientes.guardar(codigo, dispositivo, (estado, row))
+    return estado, row
+
+async def _responder_limitado(send, espera, cuerpo, tipo):
+    await _responder(send, 429, cuerpo, tipo, [(b"retry-after", antirrebote.segundos_reintento(espera).encode())])
+
+async def verificar_codigo(codigo, scope, send):
+    dispositivo = _dispositivo(scope)
+    espera = limitador.permitir(dispositivo)
+    if espera:
+        await _responder_limitado(send, espera, server.DEMASIADOS_ESCANEOS.encode(), b"text/html; charset=utf-8")
+        return
+    estado, row = await _reclamar(codigo, dispositivo, "url")
+    html, estado_http = server.pagina_verificacion(estado, row)
+    await _responder(send, estado_http, html.encode(), b"text/html; charset=utf-8")
+
+async def verificar_post(scope, receive, send):
+    dispositivo = _dispositivo(scope)
+    espera = limitador.permitir(dispositivo)
+    if espera:
+        cuerpo = json.dumps({"error": "Demasiados escaneos desde este dispositivo"}).encode()
+        await _responder_limitado(send, espera, cuerpo, b"application/json")
+        return
+    try:
+        data = json.loads(await _leer_cuerpo(receive))
+        codigo = data.get("codigo")
+    except (ValueError, AttributeError):
+        await _responder_json(send, {"error": "JSON inválido"}, 400)
+        return
+    estado, row = await _reclamar(codigo, dispositivo, "post")
+    await _responder_json(send, server.resultado_json(estado, row))
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            iniciar_escritores()
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            # La bitácora pendiente a disco antes de avisar que terminamos
+            await asyncio.get_running_loop().run_in_executor(None, bitacora.cerrar)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    iniciar_escritores()
+    metodo, ruta = scope["method"], scope["path"]
+    if ruta.startswith("/verificar/") and metodo == "GET":
+        await verificar_codigo(ruta[len("/verificar/"):], scope, send)
+    elif ruta == "/verificar" and metodo == "POST":
+        await verificar_post(scope, receive, send)
+    elif ruta == "/metrics" and metodo == "GET":
+        await _responder(send, 200, metricas.exponer().encode(), b"text/plain; version=0.0.4")
+    else:
+        await _responder_json(send, {"error": "No encontrado"}, 404)